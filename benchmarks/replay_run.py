@@ -0,0 +1,63 @@
+"""
+Replay a recorded cassette through `main.run()` to benchmark the update loop offline.
+
+Record a cassette once against the real API (or a stand-in) with
+INPUT_HTTP_MODE=record INPUT_HTTP_CASSETTE=run.jsonl, then:
+
+    python benchmarks/replay_run.py --workspace path/to/repo --cassette run.jsonl \
+        --modified-files '["collections/cool/root/root.alias"]' --iterations 20 [--replay-latency]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import main  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workspace", type=Path, required=True)
+    parser.add_argument("--cassette", type=Path, required=True)
+    parser.add_argument("--modified-files", required=True, help="JSON list, as passed to the action")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--replay-latency", action="store_true", help="sleep for each recorded request duration")
+    parser.add_argument("--max-workers", type=int, default=4)
+    return parser.parse_args()
+
+
+def main_benchmark() -> None:
+    args = parse_args()
+    os.environ.update(
+        {
+            "GITHUB_WORKSPACE": str(args.workspace.resolve()),
+            "INPUT_AVRAE_TOKEN": os.environ.get("INPUT_AVRAE_TOKEN", "replay"),
+            "INPUT_MODIFIED_FILES": args.modified_files,
+            "INPUT_HTTP_MODE": "replay",
+            "INPUT_HTTP_CASSETTE": str(args.cassette.resolve()),
+            "INPUT_REPLAY_LATENCY": "true" if args.replay_latency else "false",
+            "INPUT_MAX_WORKERS": str(args.max_workers),
+        }
+    )
+    logging.basicConfig(level=logging.WARNING)
+
+    timings = []
+    for _ in range(args.iterations):
+        started = perf_counter()
+        main.run()
+        timings.append(perf_counter() - started)
+
+    print(f"iterations: {len(timings)}")
+    print(f"median:     {statistics.median(timings) * 1000:.1f} ms")
+    print(f"min:        {min(timings) * 1000:.1f} ms")
+    print(f"max:        {max(timings) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main_benchmark()
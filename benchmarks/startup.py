@@ -0,0 +1,94 @@
+"""
+Measure how long the updater takes to exit when a push touches no Avrae files.
+
+Native mode runs `src/main.py` directly with the current interpreter. Docker mode
+times `docker build` of the action image plus `docker run`, as the Docker-based
+action does on every workflow run; it is skipped when docker is unavailable.
+
+    python benchmarks/startup.py [--iterations 10] [--docker]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _workspace() -> Path:
+    workspace = Path(tempfile.mkdtemp(prefix="avrae-startup-"))
+    (workspace / "collections.json").write_text("{}")
+    (workspace / "gvars.json").write_text("{}")
+    return workspace
+
+
+def _env(workspace: Path) -> dict:
+    env = dict(os.environ)
+    env.update(
+        {
+            "GITHUB_WORKSPACE": str(workspace),
+            "INPUT_AVRAE_TOKEN": "benchmark",
+            "INPUT_MODIFIED_FILES": json.dumps(["README.md", "src/app.py"]),
+        }
+    )
+    return env
+
+
+def _time(command: list[str], env: dict, iterations: int) -> list[float]:
+    timings = []
+    for _ in range(iterations):
+        started = perf_counter()
+        subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+        timings.append(perf_counter() - started)
+    return timings
+
+
+def _report(label: str, timings: list[float]) -> None:
+    print(f"{label:<14} median {statistics.median(timings) * 1000:8.1f} ms   min {min(timings) * 1000:8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--docker", action="store_true", help="also benchmark the Docker action path")
+    args = parser.parse_args()
+
+    workspace = _workspace()
+    env = _env(workspace)
+    try:
+        _report("native", _time([sys.executable, str(REPO_ROOT / "src" / "main.py")], env, args.iterations))
+
+        if args.docker:
+            if shutil.which("docker") is None:
+                print("docker         skipped (docker not found)")
+                return
+            build = _time(["docker", "build", "-q", "-t", "avrae-autoupdate-bench", str(REPO_ROOT)], env, 1)
+            _report("docker build", build)
+            run = [
+                "docker",
+                "run",
+                "--rm",
+                "-v",
+                f"{workspace}:/github/workspace",
+                "-e",
+                "GITHUB_WORKSPACE=/github/workspace",
+                "-e",
+                "INPUT_AVRAE_TOKEN",
+                "-e",
+                "INPUT_MODIFIED_FILES",
+                "avrae-autoupdate-bench",
+            ]
+            _report("docker run", _time(run, env, args.iterations))
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,39 @@
 
 import json
 import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from functools import partial
 from pathlib import Path
 from time import sleep
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
 
 from requests import RequestException, Response, Session
 
+import tracing
+from gvarbuild import GvarBuildError, build_gvar
+from hedging import DEFAULT_HEDGE_AFTER_MS, Hedger
+from includes import IncludeGraph
+from lockfile import LockEntry, LockFile, active_version
+from minify import CodeBuilder
 from models import ParsedAlias, ParsedSnippet
-from parsing import Parser
+from normalize import DEFAULT_NORMALIZATION, Normalizer
+from parsing import DEFAULT_TOKEN_ALIAS, Parser
+from payloadcache import DEFAULT_PAYLOAD_CACHE_MB, PayloadCache
+from plan import Plan, PlanRecorder
+from ratelimit import SharedTokenBucket, TokenBucket
+from state import StateStore
+from transport import SessionTransport, Transport, create_transport
+from versions import VersionIndex, content_hash
 
 logger = logging.getLogger("api")
 
+AVRAE_API_URL = "https://api.avrae.io"
+# above this many modified items, one `/full` request beats per-item fetches
+LOCKED_FETCH_LIMIT = 8
+
 
 class AvraeError(Exception):
     """Base class for Avrae API and response failures."""
@@ -37,23 +59,36 @@ class AvraeResponseError(AvraeError):
 class AvraeHttpClient:
     """Small transport wrapper around requests with retry and decode helpers."""
 
-    def __init__(self, token: str, session: Optional[Session] = None):
+    def __init__(
+        self,
+        token: str,
+        session: Optional[Session] = None,
+        transport: Optional[Transport] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+        hedger: Optional[Hedger] = None,
+    ):
         self.token = token
         self.session: Session = session or Session()
+        self.transport: Transport = transport or SessionTransport(self.session)
+        self.rate_limiter = rate_limiter
+        # races a duplicate against slow GETs when set
+        self.hedger = hedger
 
     def request(self, method: str, path: str, request_data: Optional[Dict[str, Any]] = None) -> Response:
         """Send a request, retrying only transient network and 5xx failures."""
         headers = {"Authorization": self.token}
         last_exc: Optional[Exception] = None
         for attempt in range(3):
+            if self.rate_limiter is not None:
+                with tracing.span("rate limit", "wait"):
+                    self.rate_limiter.acquire()
             try:
-                response = self.session.request(
-                    method,
-                    url=path,
-                    headers=headers,
-                    json=request_data,
-                    timeout=10,
-                )
+                with tracing.span(f"{method.upper()} {urlsplit(path).path}", "http", attempt=attempt):
+                    send = partial(self.transport.send, method, path, headers, request_data, 10)
+                    if self.hedger is not None and method.lower() == "get":
+                        response = self.hedger.send(send, partial(self._send_hedge, send))
+                    else:
+                        response = send()
             except RequestException as exc:
                 last_exc = exc
                 if attempt == 2:
@@ -76,11 +111,25 @@ class AvraeHttpClient:
             raise last_exc
         raise AvraeRequestError("Unknown request failure")
 
+    def close(self) -> None:
+        """Stop hedging and drop pooled connections."""
+        if self.hedger is not None:
+            self.hedger.close()
+        self.session.close()
+
+    def _send_hedge(self, send: Callable[[], Response]) -> Response:
+        # a hedge is a real request, so it spends from the same budget
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        with tracing.span("hedge", "http"):
+            return send()
+
     @staticmethod
     def _sleep_before_retry(exc: Exception, attempt: int) -> None:
         sleep_seconds = 2**attempt
         logger.warning(f"Request failed ({exc}); retrying in {sleep_seconds}s...")
-        sleep(sleep_seconds)
+        with tracing.span("retry sleep", "wait", attempt=attempt, seconds=sleep_seconds):
+            sleep(sleep_seconds)
 
     def request_json(self, method: str, path: str, request_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Send a request and require a JSON object response body."""
@@ -99,8 +148,8 @@ class AvraeHttpClient:
 
 
 def _read_text(path: Path) -> str:
-    """Read a UTF-8 text file from disk."""
-    with open(path, "r") as fp:
+    """Read a UTF-8 text file from disk, leaving line endings untouched for the normalizer."""
+    with open(path, "r", encoding="utf-8", newline="") as fp:
         return fp.read()
 
 
@@ -161,13 +210,115 @@ def build_collection_outputs(
     return alias_outputs, snippet_outputs
 
 
+def lock_entries(
+    collection_id: str, alias_outputs: Dict[Path, ParsedAlias], snippet_outputs: Dict[Path, ParsedSnippet]
+) -> List[Tuple[Path, LockEntry]]:
+    """Lockfile entries for every alias and snippet of a freshly fetched collection."""
+    entries = []
+    for type_, outputs in (("alias", alias_outputs), ("snippet", snippet_outputs)):
+        for file_path, parsed in outputs.items():
+            entry = LockEntry(
+                type_,
+                parsed.data["_id"],
+                parsed.name,
+                collection_id,
+                parsed.docs_path.as_posix(),
+                parsed.data.get("parent_id"),
+                active_version(parsed.data),
+            )
+            entries.append((file_path, entry))
+    return entries
+
+
+def rate_limiter(config, token: str) -> Optional[TokenBucket]:
+    """The request budget of one account, shared with other processes on this host when configured."""
+    rate_limit = getattr(config, "rate_limit", None)
+    if not rate_limit:
+        return None
+    shared_dir = getattr(config, "shared_rate_limit_dir", None)
+    if shared_dir:
+        return SharedTokenBucket.for_token(Path(shared_dir), token, rate_limit)
+    return TokenBucket(rate_limit)
+
+
+def hedger(config) -> Optional[Hedger]:
+    """Hedging for one account's GETs, or None when it is off."""
+    hedge_rate = getattr(config, "hedge_rate", None)
+    if not isinstance(hedge_rate, (int, float)) or hedge_rate <= 0:
+        return None
+    hedge_after_ms = getattr(config, "hedge_after_ms", None)
+    if not isinstance(hedge_after_ms, (int, float)):
+        hedge_after_ms = DEFAULT_HEDGE_AFTER_MS
+    return Hedger(hedge_rate, hedge_after_ms / 1000)
+
+
+def payload_cache_bytes(config) -> int:
+    megabytes = getattr(config, "payload_cache_mb", None)
+    return int((megabytes if isinstance(megabytes, (int, float)) else DEFAULT_PAYLOAD_CACHE_MB) * 1024 * 1024)
+
+
 class Avrae:
     """High-level Avrae client that preserves the current updater workflow."""
 
-    def __init__(self, config):
-        self.token = config.token
-        self.client = AvraeHttpClient(self.token)
+    def __init__(
+        self,
+        config,
+        token: Optional[str] = None,
+        token_alias: str = DEFAULT_TOKEN_ALIAS,
+        state: Optional[StateStore] = None,
+        payloads: Optional[PayloadCache] = None,
+        client: Optional[AvraeHttpClient] = None,
+    ):
+        self.token = token if token is not None else config.token
+        self.token_alias = token_alias
+        if client is None:
+            session = Session()
+            # each account gets its own connection pool and its own request budget
+            client = AvraeHttpClient(
+                self.token,
+                session,
+                create_transport(config, session),
+                rate_limiter(config, self.token),
+                hedger(config),
+            )
+        self.client = client
         self.session = self.client.session
+        self.api_url = (getattr(config, "api_url", None) or AVRAE_API_URL).rstrip("/")
+        self.bulk_gvars: bool = getattr(config, "bulk_gvars", False)
+        self._gvar_index: Optional[Dict[str, Dict[str, Any]]] = None
+        # GETs in flight, so concurrent callers share one request
+        self._get_results: Dict[str, Future] = {}
+        # decoded GET payloads and parsed collections, within a byte budget that may be shared by every account
+        self.payloads = payloads if payloads is not None else PayloadCache(payload_cache_bytes(config))
+        self._get_lock = threading.Lock()
+        self.normalize = Normalizer(getattr(config, "normalization", DEFAULT_NORMALIZATION))
+        self.stats: Counter[str] = Counter()
+        self._stats_lock = threading.Lock()
+        # set for dry runs: writes are recorded instead of sent
+        self.planner: Optional[PlanRecorder] = None
+        self.versions: Optional[VersionIndex] = None
+        if getattr(config, "reuse_versions", False):
+            self.versions = VersionIndex.load(Path(config.cache_dir) / "versions.json")
+        # set by sync when include directives are enabled
+        self.includes: Optional[IncludeGraph] = None
+        # set by sync when a lockfile is present
+        self.lock: Optional[LockFile] = None
+        # GVARs are minified and sharded before upload; shard ids are set by sync
+        self.gvar_build: bool = getattr(config, "gvar_build", False)
+        self.gvar_shards: Dict[Path, Tuple[str, ...]] = {}
+        # last known remote state, shared by every account
+        self.state = state
+        # set when code is minified before upload
+        self.builder: Optional[CodeBuilder] = None
+        if getattr(config, "minify", False):
+            self.builder = CodeBuilder(Path(config.cache_dir) / "build")
+
+    def save_caches(self) -> None:
+        """Persist caches that outlive a single run."""
+        if self.versions is not None and self.planner is None:
+            self.versions.save()
+        if self.state is not None:
+            self.state.save()
 
     @staticmethod
     def _read_text(path: Path) -> str:
@@ -180,18 +331,80 @@ class Avrae:
     def _request(self, method: str, path: str, request_data: Optional[Dict[str, Any]] = None) -> Response:
         return self.client.request(method, path, request_data)
 
+    def get_request_shared(self, path: str) -> Dict[str, Any]:
+        """GET a JSON endpoint once while its payload stays cached; concurrent callers share one request."""
+        cached = self.payloads.get((self.token_alias, path))
+        if cached is not None:
+            logger.debug(f"Reusing response for {path}")
+            return cached
+        with self._get_lock:
+            future = self._get_results.get(path)
+            is_owner = future is None
+            if future is None:
+                future = self._get_results[path] = Future()
+        if is_owner:
+            try:
+                result = self.client.request_json("get", path)
+            except BaseException as exc:
+                # failures are not memoized, so a later caller may retry
+                with self._get_lock:
+                    self._get_results.pop(path, None)
+                future.set_exception(exc)
+            else:
+                self.payloads.put((self.token_alias, path), result)
+                with self._get_lock:
+                    self._get_results.pop(path, None)
+                future.set_result(result)
+        return future.result()
+
     def post_request(self, path: str, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        if self.planner is not None:
+            return self.planner.record("post", path, request_data, "json", self.token_alias)
         return self.client.request_json("post", path, request_data)
 
     def post_request_str(self, path: str, request_data: Dict[str, Any]) -> str:
+        if self.planner is not None:
+            return self.planner.record("post", path, request_data, "text", self.token_alias)
         return self.client.request_text("post", path, request_data)
 
     def put_request(self, path: str, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        if self.planner is not None:
+            return self.planner.record("put", path, request_data, "json", self.token_alias)
         return self.client.request_json("put", path, request_data)
 
     def patch_request(self, path: str, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        if self.planner is not None:
+            return self.planner.record("patch", path, request_data, "json", self.token_alias)
         return self.client.request_json("patch", path, request_data)
 
+    def apply_plan(self, plan: Plan, accounts: Optional[Mapping[str, "Avrae"]] = None) -> None:
+        """Issue a previously computed plan's writes in order, filling in code versions as they are created."""
+        accounts = accounts or {self.token_alias: self}
+        responses: Dict[int, Any] = {}
+        for index, operation in enumerate(plan.operations):
+            if operation.token_alias not in accounts:
+                raise AvraeError(f"Plan operation {index} needs a token for {operation.token_alias!r}")
+            client = accounts[operation.token_alias].client
+            request_data = dict(operation.request_data)
+            if operation.depends_on is not None:
+                try:
+                    request_data["version"] = responses[operation.depends_on]["data"]["version"]
+                except (KeyError, TypeError) as exc:
+                    raise AvraeResponseError(
+                        f"Plan operation {index} needs a version from operation {operation.depends_on}"
+                    ) from exc
+            if operation.expect == "text":
+                response = client.request_text(operation.method, operation.path, request_data)
+                if response != "Gvar updated.":
+                    raise AvraeResponseError(f"Could not apply {operation.method.upper()} {operation.path}\n{response}")
+            else:
+                response = self._require_success(
+                    client.request_json(operation.method, operation.path, request_data),
+                    f"Could not apply {operation.method.upper()} {operation.path}",
+                )
+            responses[index] = response
+            logger.info(f"Applied {operation.method.upper()} {operation.path}")
+
     @staticmethod
     def _require_success(payload: Dict[str, Any], error_message: str) -> Dict[str, Any]:
         """Require a payload-level success flag when the API uses one."""
@@ -199,57 +412,185 @@ class Avrae:
             raise AvraeResponseError(f"{error_message}\n{json.dumps(payload, indent=2)}")
         return payload
 
+    def _remember(self, path: Path, kind: str, item_id: str, remote: Optional[str], **fields: Any) -> None:
+        """Record what Avrae holds for a local file, so `status` can compare against it offline."""
+        if self.state is not None:
+            self.state.record(path, kind, item_id, content_hash(self.normalize(remote or "")), **fields)
+
+    def _remember_collection(
+        self,
+        collection_id: str,
+        alias_outputs: Dict[Path, ParsedAlias],
+        snippet_outputs: Dict[Path, ParsedSnippet],
+    ) -> None:
+        for type_, outputs in (("alias", alias_outputs), ("snippet", snippet_outputs)):
+            for file_path, parsed in outputs.items():
+                item_id = parsed.data["_id"]
+                self._remember(
+                    file_path,
+                    type_,
+                    item_id,
+                    parsed.data.get("code"),
+                    collection_id=collection_id,
+                    parent_id=parsed.data.get("parent_id"),
+                    version=active_version(parsed.data),
+                )
+                self._remember(parsed.docs_path, "docs", item_id, parsed.data.get("docs"), collection_id=collection_id)
+
+    def _count(self, stat: str) -> None:
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def _canonical_upload(self, local: str, remote: Optional[str]) -> Optional[str]:
+        """Return the canonical local content to upload, or None when both sides already match."""
+        canonical_local = self.normalize(local)
+        if canonical_local == self.normalize(remote or ""):
+            if local != remote:
+                self._count("uploads_avoided")
+            return None
+        return canonical_local
+
+    def _find_existing_version(self, type_: str, item_id: str, content: str) -> Optional[int]:
+        """Look up a code version that already holds this content, seeding the index from Avrae once per item."""
+        if self.versions is None:
+            return None
+        if not self.versions.is_seeded(item_id):
+            versions_response = self.get_request_shared(f"{self.api_url}/workshop/{type_}/{item_id}/code")
+            self._require_success(versions_response, f"Could not list code versions of {type_} {item_id}")
+            self.versions.seed(
+                item_id,
+                (
+                    (self.normalize(version["content"]), version["version"])
+                    for version in versions_response.get("data") or []
+                    if isinstance(version, dict) and "content" in version and "version" in version
+                ),
+            )
+        return self.versions.lookup(item_id, content)
+
+    def local_code(self, file_path: Path) -> str:
+        """An alias or snippet's local source with its includes expanded, as it will be uploaded."""
+        local_contents = self._read_text(file_path)
+        if self.includes is not None:
+            local_contents = self.includes.expand(file_path, local_contents)
+        return local_contents
+
     def check_and_maybe_update(self, type_: str, parsed_data: ParsedAlias | ParsedSnippet) -> int:
+        with tracing.span(f"{type_} {parsed_data.name}", "item", path=parsed_data.file_path.as_posix()):
+            return self._check_and_maybe_update(type_, parsed_data)
+
+    def _check_and_maybe_update(self, type_: str, parsed_data: ParsedAlias | ParsedSnippet) -> int:
         # load our file content and check for differences
         file_path = parsed_data.file_path
-        file_contents = self._read_text(file_path)
-        if file_contents == parsed_data.data["code"]:
+        item_id = parsed_data.data["_id"]
+        with tracing.span("read", "item"):
+            local_contents = self.local_code(file_path)
+            if self.builder is not None:
+                local_contents = self.builder.build(file_path, self.normalize(local_contents))
+        with tracing.span("compare", "item"):
+            file_contents = self._canonical_upload(local_contents, parsed_data.data["code"])
+        if file_contents is None:
             return -1
-        # update file via POST request
-        update_response = self.post_request(
-            f"https://api.avrae.io/workshop/{type_}/{parsed_data.data['_id']}/code",
-            {"content": file_contents},
-        )
-        self._require_success(update_response, f"Could not update {file_path}")
-        logger.info(f"Updated {parsed_data.name}")
-        try:
-            code_version = update_response["data"]["version"]
-        except KeyError as exc:
-            raise AvraeResponseError(
-                f"Could not read code version for {file_path}\n{json.dumps(update_response, indent=2)}"
-            ) from exc
+        code_version = self._find_existing_version(type_, item_id, file_contents)
+        if code_version is not None:
+            logger.info(f"Reusing existing code version {code_version} for {parsed_data.name}")
+        else:
+            # update file via POST request
+            with tracing.span("code POST", "item"):
+                update_response = self.post_request(
+                    f"{self.api_url}/workshop/{type_}/{item_id}/code",
+                    {"content": file_contents},
+                )
+            self._require_success(update_response, f"Could not update {file_path}")
+            logger.info(f"Updated {parsed_data.name}")
+            try:
+                code_version = update_response["data"]["version"]
+            except KeyError as exc:
+                raise AvraeResponseError(
+                    f"Could not read code version for {file_path}\n{json.dumps(update_response, indent=2)}"
+                ) from exc
+            if self.versions is not None:
+                self.versions.record(item_id, file_contents, code_version)
         # update active code version
-        update_code_version = self.put_request(
-            path=f"https://api.avrae.io/workshop/{type_}/{parsed_data.data['_id']}/active-code",
-            request_data={"version": code_version},
-        )
+        with tracing.span("active-code PUT", "item", version=code_version):
+            update_code_version = self.put_request(
+                path=f"{self.api_url}/workshop/{type_}/{item_id}/active-code",
+                request_data={"version": code_version},
+            )
         self._require_success(update_code_version, f"Could not update code version of {file_path}")
         logger.info(f"Code version: {code_version}")
+        if self.planner is None:
+            self._remember(file_path, type_, item_id, file_contents, version=code_version)
+            # only a version that went live belongs in the lockfile, whether it is new or reused
+            if self.lock is not None:
+                self.lock.record_version(file_path, code_version)
+        # keep the shared payload in step with what is now live
+        parsed_data.data["code"] = file_contents
         return 0
 
     def check_and_maybe_update_docs(self, type_: str, parsed_data: ParsedAlias | ParsedSnippet) -> int:
+        with tracing.span(f"{type_} docs {parsed_data.name}", "item", path=parsed_data.docs_path.as_posix()):
+            return self._check_and_maybe_update_docs(type_, parsed_data)
+
+    def _check_and_maybe_update_docs(self, type_: str, parsed_data: ParsedAlias | ParsedSnippet) -> int:
         # load our file content and check for differences
         file_path = parsed_data.docs_path
-        file_contents = self._read_text(file_path)
-        if file_contents == parsed_data.data.get("docs", ""):
+        with tracing.span("read", "item"):
+            local_contents = self._read_text(file_path)
+        with tracing.span("compare", "item"):
+            file_contents = self._canonical_upload(local_contents, parsed_data.data.get("docs", ""))
+        if file_contents is None:
             return -1
         # update file via POST request
-        update_response = self.patch_request(
-            f"https://api.avrae.io/workshop/{type_}/{parsed_data.data['_id']}",
-            {"name": parsed_data.name, "docs": file_contents},
-        )
+        with tracing.span("docs PATCH", "item"):
+            update_response = self.patch_request(
+                f"{self.api_url}/workshop/{type_}/{parsed_data.data['_id']}",
+                {"name": parsed_data.name, "docs": file_contents},
+            )
         self._require_success(update_response, f"Could not update docs of {file_path}")
         logger.info(f"Docs updated ({parsed_data.name})")
+        if self.planner is None:
+            self._remember(file_path, "docs", parsed_data.data["_id"], file_contents)
+        parsed_data.data["docs"] = file_contents
         return 0
 
+    def list_gvars(self) -> Dict[str, Dict[str, Any]]:
+        """Index every owned and editable GVAR by id, following listing pages until exhausted."""
+        with self._get_lock:
+            if self._gvar_index is not None:
+                return self._gvar_index
+        index: Dict[str, Dict[str, Any]] = {}
+        path: Optional[str] = f"{self.api_url}/customizations/gvars"
+        while path:
+            listing = self._require_success(self.get_request_shared(path), "GVAR listing did not succeed.")
+            for group in ("owned", "editable", "subscribed"):
+                for gvar in listing.get(group) or []:
+                    if isinstance(gvar, dict) and "key" in gvar and "value" in gvar:
+                        index.setdefault(gvar["key"], gvar)
+            next_page = listing.get("next")
+            path = urljoin(path, next_page) if isinstance(next_page, str) and next_page else None
+        logger.info(f"Indexed {len(index)} GVARs from the bulk listing.")
+        with self._get_lock:
+            if self._gvar_index is None:
+                self._gvar_index = index
+            return self._gvar_index
+
     def get_gvar(self, gvar_id: str) -> Dict[str, Any]:
-        path = f"https://api.avrae.io/customizations/gvars/{gvar_id}"
-        request_data = self.client.request_json("get", path)
+        if self.bulk_gvars:
+            listed_gvar = self.list_gvars().get(gvar_id)
+            if listed_gvar is not None:
+                return listed_gvar
+            logger.info(f"GVAR {gvar_id} is missing from the bulk listing; fetching it directly.")
+        path = f"{self.api_url}/customizations/gvars/{gvar_id}"
+        request_data = self.get_request_shared(path)
         if request_data.get("success") is False:
             raise AvraeResponseError(f"{gvar_id} GVAR data grab did not succeed.\n{json.dumps(request_data, indent=2)}")
         return request_data
 
     def check_and_maybe_update_gvar(self, gvar_path: Path, gvar_id: str) -> int:
+        with tracing.span(f"gvar {gvar_id}", "item", path=gvar_path.as_posix()):
+            return self._check_and_maybe_update_gvar(gvar_path, gvar_id)
+
+    def _check_and_maybe_update_gvar(self, gvar_path: Path, gvar_id: str) -> int:
         # load existing data
         gvar_response = self.get_gvar(gvar_id)
         try:
@@ -259,31 +600,157 @@ class Avrae:
                 f"Unexpected GVAR response for {gvar_id}\n{json.dumps(gvar_response, indent=2)}"
             ) from exc
 
-        file_contents = self._read_text(gvar_path)
-        if file_contents == gvar_data:
+        self._remember(gvar_path, "gvar", gvar_id, gvar_data)
+        if self.gvar_build:
+            return self._build_and_update_gvar(gvar_path, gvar_id, gvar_response)
+        file_contents = self._canonical_upload(self._read_text(gvar_path), gvar_data)
+        if file_contents is None:
             return -1
         # update file via POST request
         logger.info(f"Updating GVAR {gvar_id} at {gvar_path.as_posix()}")
-        update_response = self.post_request_str(
-            f"https://api.avrae.io/customizations/gvars/{gvar_id}",
-            {"value": file_contents},
+        self._post_gvar(gvar_id, file_contents)
+        gvar_response["value"] = file_contents
+        if self.planner is None:
+            self._remember(gvar_path, "gvar", gvar_id, file_contents)
+        return 0
+
+    def _build_and_update_gvar(self, gvar_path: Path, gvar_id: str, gvar_response: Dict[str, Any]) -> int:
+        """Upload the built GVAR, shards before the index that points at them, skipping values Avrae already holds."""
+        source = self.normalize(self._read_text(gvar_path))
+        try:
+            values = build_gvar(source, gvar_id, self.gvar_shards.get(gvar_path, ()))
+        except GvarBuildError as exc:
+            raise AvraeResponseError(f"Could not build GVAR {gvar_id} from {gvar_path.as_posix()}: {exc}") from exc
+        built_length = sum(len(value) for value in values.values())
+        logger.info(
+            f"Built {gvar_path.as_posix()}: {len(source)} -> {built_length} characters in {len(values)} GVAR(s)"
         )
+        updated = 0
+        for target_id, value in values.items():
+            # the index was read by the caller; shards are only needed once their value is compared
+            response = gvar_response if target_id == gvar_id else self.get_gvar(target_id)
+            # built values are already canonical, and normalizing a text shard on its own could change the joined text
+            if response.get("value") == value:
+                continue
+            logger.info(f"Updating GVAR {target_id} from {gvar_path.as_posix()}")
+            self._post_gvar(target_id, value)
+            response["value"] = value
+            updated += 1
+        if not updated:
+            return -1
+        if self.planner is None:
+            self._remember(gvar_path, "gvar", gvar_id, values[gvar_id])
+        return 0
+
+    def _post_gvar(self, gvar_id: str, value: str) -> None:
+        with tracing.span("value POST", "item", gvar=gvar_id):
+            update_response = self.post_request_str(
+                f"{self.api_url}/customizations/gvars/{gvar_id}",
+                {"value": value},
+            )
         if update_response != "Gvar updated.":
             raise AvraeResponseError(f"Could not update GVAR {gvar_id}\n{update_response}")
-        return 0
 
     def get_collection_info(self, collection_id: str) -> Dict[str, Any]:
-        path = f"https://api.avrae.io/workshop/collection/{collection_id}/full"
-        request_data = self.client.request_json("get", path)
+        path = f"{self.api_url}/workshop/collection/{collection_id}/full"
+        request_data = self.get_request_shared(path)
         if request_data.get("success") is False:
             raise AvraeResponseError(
                 f"{collection_id} collection data grab did not succeed.\n{json.dumps(request_data, indent=2)}"
             )
         return request_data
 
+    def _fetch_locked_items(
+        self, collection_id: str, parser: Parser, modified_paths: set
+    ) -> Optional[tuple[Dict[Path, ParsedAlias], Dict[Path, ParsedSnippet]]]:
+        """Fetch only the modified items through per-item endpoints; None when the lockfile cannot be trusted."""
+        assert self.lock is not None
+        if self.lock.missing_paths(get_collection_path(parser, collection_id), modified_paths):
+            return None
+        needed = {
+            path: entry
+            for path, entry in self.lock.entries_for(collection_id).items()
+            if path in modified_paths or Path(entry.docs) in modified_paths
+        }
+        if len(needed) > LOCKED_FETCH_LIMIT:
+            return None
+        alias_outputs: Dict[Path, ParsedAlias] = {}
+        snippet_outputs: Dict[Path, ParsedSnippet] = {}
+        for path, entry in needed.items():
+            try:
+                response = self.get_request_shared(f"{self.api_url}/workshop/{entry.type}/{entry.id}")
+            except AvraeRequestError as exc:
+                logger.info(f"Lockfile entry for {path.as_posix()} is stale ({exc}); fetching the full collection.")
+                return None
+            item = response.get("data") if response.get("success") is not False else None
+            if (
+                not isinstance(item, dict)
+                or item.get("_id") != entry.id
+                or item.get("name") != entry.name
+                or item.get("parent_id") != entry.parent_id
+            ):
+                logger.info(f"Lockfile entry for {path.as_posix()} is stale; fetching the full collection.")
+                return None
+            if entry.type == "alias":
+                alias_outputs[path] = ParsedAlias(entry.name, item, path.parent, path, Path(entry.docs))
+            else:
+                snippet_outputs[path] = ParsedSnippet(entry.name, item, path, Path(entry.docs))
+        logger.info(f"Fetched {len(needed)} item(s) of collection {collection_id} through the lockfile.")
+        return alias_outputs, snippet_outputs
+
     def parse_collection(
-        self, collection_id: str, parser: Parser
+        self, collection_id: str, parser: Parser, modified_paths: Optional[set] = None
+    ) -> tuple[Dict[Path, ParsedAlias], Dict[Path, ParsedSnippet]]:
+        """Return the local alias/snippet file mappings of one collection, fetching as little as possible."""
+        with tracing.span(f"collection {collection_id}", "fetch"):
+            return self._parse_collection(collection_id, parser, modified_paths)
+
+    def _parse_collection(
+        self, collection_id: str, parser: Parser, modified_paths: Optional[set] = None
     ) -> tuple[Dict[Path, ParsedAlias], Dict[Path, ParsedSnippet]]:
-        """Fetch one collection and return the local alias/snippet file mappings."""
+        if self.lock is not None and modified_paths is not None:
+            outputs = self._fetch_locked_items(collection_id, parser, modified_paths)
+            if outputs is not None:
+                self._remember_collection(collection_id, *outputs)
+                return outputs
+        outputs_key = (self.token_alias, "outputs", collection_id, get_collection_path(parser, collection_id))
+        cached = self.payloads.get(outputs_key)
+        if cached is not None:
+            return cached
         collection_data = self.get_collection_info(collection_id)["data"]
-        return build_collection_outputs(collection_id, parser, collection_data)
+        alias_outputs, snippet_outputs = build_collection_outputs(collection_id, parser, collection_data)
+        # the parsed outputs wrap the same dicts, so only they stay cached
+        self.payloads.pop((self.token_alias, f"{self.api_url}/workshop/collection/{collection_id}/full"))
+        outputs = (alias_outputs, snippet_outputs)
+        self.payloads.put(outputs_key, outputs)
+        if self.lock is not None:
+            self.lock.replace_collection(collection_id, lock_entries(collection_id, alias_outputs, snippet_outputs))
+        self._remember_collection(collection_id, alias_outputs, snippet_outputs)
+        return outputs
+
+
+def create_clients(
+    config, aliases: Iterable[str], share_with: Optional[Mapping[str, Avrae]] = None
+) -> Dict[str, Avrae]:
+    """Build one client per token alias; clients built `share_with` others reuse their pools, limits and caches."""
+    tokens: Dict[str, str] = getattr(config, "tokens", None) or {DEFAULT_TOKEN_ALIAS: config.token}
+    missing = sorted(set(aliases) - set(tokens))
+    if missing:
+        raise AvraeError(f"No token configured for alias(es): {', '.join(missing)}. Add them to avrae_tokens.")
+    if share_with:
+        shared = next(iter(share_with.values()))
+        return {
+            alias: Avrae(config, tokens[alias], alias, shared.state, shared.payloads, share_with[alias].client)
+            for alias in sorted(set(aliases))
+        }
+    state_db = getattr(config, "state_db", None)
+    state = StateStore(Path(state_db)) if state_db else None
+    # one memory budget for the whole process, however many accounts it serves
+    payloads = PayloadCache(payload_cache_bytes(config))
+    return {alias: Avrae(config, tokens[alias], alias, state, payloads) for alias in sorted(set(aliases))}
+
+
+def close_clients(accounts: Mapping[str, Avrae]) -> None:
+    """Close every distinct client once; accounts built with `share_with` share theirs."""
+    for client in {id(avrae.client): avrae.client for avrae in accounts.values()}.values():
+        client.close()
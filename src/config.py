@@ -1,20 +1,87 @@
+import copy
 import json
 import logging
 import os
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional
 
-from dotenv import load_dotenv
+import utils as utils
+
+from hedging import DEFAULT_HEDGE_AFTER_MS
+from normalize import DEFAULT_NORMALIZATION, Normalizer
+from payloadcache import DEFAULT_PAYLOAD_CACHE_MB
 
 logger = logging.getLogger("config")
 
 
+def load_dotenv(dotenv_path: str | Path) -> bool:
+    """Load a .env file, only importing python-dotenv when there is one to load."""
+    if not Path(dotenv_path).is_file():
+        return False
+    from dotenv import load_dotenv as _load_dotenv
+
+    return _load_dotenv(dotenv_path)
+
+
+@dataclass(frozen=True, slots=True)
+class Project:
+    """One collections/GVAR map pair of a repository that holds several independent projects."""
+
+    name: str
+    collections_file_path: str
+    gvars_file_path: str
+    lock_file: Path
+
+
+def _project_name(collections_file_path: str) -> str:
+    parent = Path(collections_file_path).parent
+    return parent.as_posix() if parent != Path(".") else Path(collections_file_path).stem
+
+
 class Config:
     def __init__(self):
         self.token: Optional[str] = None
+        self.tokens: Dict[str, str] = {}
+        self.rate_limit: Optional[float] = None
+        self.shared_rate_limit_dir: Optional[Path] = None
         self.collections_file_path: Optional[str] = None
         self.gvars_file_path: Optional[str] = None
         self.modified_files: Optional[List[str]] = None
+        self.modified_files_path: Optional[Path] = None
+        self.plan_file: Path = Path("avrae-plan.json")
+        self.lock_file: Path = Path("avrae-lock.json")
+        # several map pairs processed in one run; empty for the usual single pair
+        self.projects: List[Project] = []
+        # service mode
+        self.server_repos: Dict[str, Path] = {}
+        self.server_host: str = "127.0.0.1"
+        self.server_port: int = 8080
+        self.server_workers: int = 2
+        self.server_checkout: bool = True
+        self.server_branch: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.change_detection: str = "input"
+        self.diff_base: Optional[str] = None
+        self.diff_head: str = "HEAD"
+        self.api_url: Optional[str] = None
+        self.bulk_gvars: bool = False
+        self.max_workers: int = 4
+        self.payload_cache_mb: float = DEFAULT_PAYLOAD_CACHE_MB
+        self.hedge_rate: float = 0.0
+        self.hedge_after_ms: float = DEFAULT_HEDGE_AFTER_MS
+        self.cache_dir: Path = Path(".avrae-cache")
+        self.state_db: Optional[Path] = None
+        self.reuse_versions: bool = False
+        self.preflight: bool = True
+        self.minify: bool = False
+        self.gvar_build: bool = False
+        self.includes: bool = False
+        self.normalization: tuple[str, ...] = DEFAULT_NORMALIZATION
+        self.http_mode: str = "live"
+        self.http_cassette: Optional[Path] = None
+        self.replay_latency: bool = False
+        self.trace_file: Optional[Path] = None
 
     @staticmethod
     def _ensure_file_exists(path_str: str, label: str) -> None:
@@ -22,7 +89,14 @@ class Config:
         if not path.is_file():
             raise FileNotFoundError(f"{label} file not found at {path.as_posix()}. Please verify your workflow inputs.")
 
-    def load_config(self):
+    @staticmethod
+    def _env_flag(name: str, default: bool = False) -> bool:
+        value = os.environ.get(name, None)
+        if value is None or value.strip() == "":
+            return default
+        return value.strip().lower() in ("1", "true", "yes", "on")
+
+    def load_config(self, require_modified_files: bool = True, require_token: bool = True, require_maps: bool = True):
         logger.info("Loading config...")
 
         # Allow us to be in the correct base path.
@@ -35,10 +109,20 @@ class Config:
 
         # Load Avrae Token
         self.token = os.environ.get("INPUT_AVRAE_TOKEN", None)
-        if self.token is None:
+        if self.token is None and require_token:
             raise Exception(
                 "Avrae token not found. Please see README.md in the project repo for help with setup. Exiting..."
             )
+        self.tokens = {"default": self.token} if self.token is not None else {}
+        tokens_raw = os.environ.get("INPUT_AVRAE_TOKENS", None)
+        if tokens_raw:
+            try:
+                extra_tokens = json.loads(tokens_raw)
+            except json.JSONDecodeError as exc:
+                raise ValueError("Avrae tokens ENV could not be parsed as JSON.") from exc
+            if not isinstance(extra_tokens, dict) or not all(isinstance(v, str) for v in extra_tokens.values()):
+                raise ValueError("Avrae tokens ENV must be a JSON object mapping token aliases to tokens.")
+            self.tokens.update(extra_tokens)
 
         logger.info("Loading file paths...")
         self.collections_file_path = os.environ.get("INPUT_COLLECTIONS_ID_FILE_NAME", None)
@@ -49,11 +133,107 @@ class Config:
         if self.gvars_file_path is None:
             logger.warning("GVAR file path not set. Defaulting to gvars.json")
             self.gvars_file_path = "gvars.json"
-        self._ensure_file_exists(self.collections_file_path, "Collection map")
-        self._ensure_file_exists(self.gvars_file_path, "GVAR map")
+        self._load_projects()
+        if require_maps:
+            map_files = [(project.collections_file_path, project.gvars_file_path) for project in self.projects]
+            for collections_map, gvars_map in map_files or [(self.collections_file_path, self.gvars_file_path)]:
+                self._ensure_file_exists(collections_map, "Collection map")
+                self._ensure_file_exists(gvars_map, "GVAR map")
+
+        self.api_url = os.environ.get("INPUT_API_URL", None) or None
+        self.bulk_gvars = self._env_flag("INPUT_BULK_GVARS")
+        self.cache_dir = Path(os.environ.get("INPUT_CACHE_DIR", None) or ".avrae-cache")
+        # opt-in: a database inside the workspace is easily committed or cached by accident
+        state_db_raw = os.environ.get("INPUT_STATE_DB", None)
+        self.state_db = Path(state_db_raw) if state_db_raw else None
+        self.reuse_versions = self._env_flag("INPUT_REUSE_VERSIONS")
+        self.preflight = self._env_flag("INPUT_PREFLIGHT", True)
+        self.minify = self._env_flag("INPUT_MINIFY")
+        self.gvar_build = self._env_flag("INPUT_GVAR_BUILD")
+        self.includes = self._env_flag("INPUT_INCLUDES")
+        normalization_raw = os.environ.get("INPUT_NORMALIZE", None)
+        if normalization_raw:
+            self.normalization = tuple(sorted(Normalizer.from_spec(normalization_raw).rules))
+        self.http_mode = (os.environ.get("INPUT_HTTP_MODE", None) or "live").strip().lower()
+        if self.http_mode not in ("live", "record", "replay"):
+            raise ValueError("HTTP mode must be one of live, record, or replay.")
+        cassette_raw = os.environ.get("INPUT_HTTP_CASSETTE", None)
+        self.http_cassette = Path(cassette_raw) if cassette_raw else None
+        if self.http_mode != "live" and self.http_cassette is None:
+            raise ValueError(f"HTTP mode {self.http_mode} requires INPUT_HTTP_CASSETTE to be set.")
+        self.replay_latency = self._env_flag("INPUT_REPLAY_LATENCY")
+        trace_raw = os.environ.get("INPUT_TRACE_FILE", None)
+        self.trace_file = Path(trace_raw) if trace_raw else None
+        self.plan_file = Path(os.environ.get("INPUT_PLAN_FILE", None) or "avrae-plan.json")
+        self.lock_file = Path(os.environ.get("INPUT_LOCK_FILE", None) or "avrae-lock.json")
+        rate_limit_raw = os.environ.get("INPUT_RATE_LIMIT", None)
+        if rate_limit_raw:
+            try:
+                self.rate_limit = float(rate_limit_raw)
+            except ValueError as exc:
+                raise ValueError("Rate limit must be a number of requests per second.") from exc
+            if self.rate_limit <= 0:
+                raise ValueError("Rate limit must be positive.")
+        payload_cache_raw = os.environ.get("INPUT_PAYLOAD_CACHE_MB", None)
+        if payload_cache_raw:
+            try:
+                self.payload_cache_mb = float(payload_cache_raw)
+            except ValueError as exc:
+                raise ValueError("Payload cache size must be a number of megabytes.") from exc
+            if self.payload_cache_mb < 0:
+                raise ValueError("Payload cache size cannot be negative.")
+        hedge_rate_raw = os.environ.get("INPUT_HEDGE_RATE", None)
+        if hedge_rate_raw:
+            try:
+                self.hedge_rate = float(hedge_rate_raw)
+            except ValueError as exc:
+                raise ValueError("Hedge rate must be a fraction of requests, such as 0.05.") from exc
+            if not 0 <= self.hedge_rate <= 1:
+                raise ValueError("Hedge rate must be between 0 and 1.")
+        hedge_after_raw = os.environ.get("INPUT_HEDGE_AFTER_MS", None)
+        if hedge_after_raw:
+            try:
+                self.hedge_after_ms = float(hedge_after_raw)
+            except ValueError as exc:
+                raise ValueError("Hedge delay must be a number of milliseconds.") from exc
+            if self.hedge_after_ms <= 0:
+                raise ValueError("Hedge delay must be positive.")
+        shared_rate_limit_raw = os.environ.get("INPUT_SHARED_RATE_LIMIT_DIR", None)
+        if shared_rate_limit_raw:
+            if self.rate_limit is None:
+                raise ValueError("A shared rate limit directory needs rate_limit to be set.")
+            self.shared_rate_limit_dir = Path(shared_rate_limit_raw)
+        max_workers_raw = os.environ.get("INPUT_MAX_WORKERS", None)
+        if max_workers_raw:
+            try:
+                self.max_workers = int(max_workers_raw)
+            except ValueError as exc:
+                raise ValueError("Max workers must be a whole number.") from exc
+            if self.max_workers < 1:
+                raise ValueError("Max workers must be at least 1.")
+
+        self.change_detection = (os.environ.get("INPUT_CHANGE_DETECTION", None) or "input").strip().lower()
+        if self.change_detection not in ("input", "git"):
+            raise ValueError("Change detection must be either input or git.")
+        if self.change_detection == "git":
+            self._load_diff_range()
+            logger.info("Config loaded.")
+            return
 
-        modified_files_raw = os.environ.get("INPUT_MODIFIED_FILES", None)
+        modified_files_path_raw = os.environ.get("INPUT_MODIFIED_FILES_PATH", None)
+        if modified_files_path_raw:
+            self._ensure_file_exists(modified_files_path_raw, "Modified files list")
+            self.modified_files_path = Path(modified_files_path_raw)
+            logger.info("Config loaded.")
+            return
+
+        # unset action inputs arrive as empty strings
+        modified_files_raw = os.environ.get("INPUT_MODIFIED_FILES", None) or None
         if modified_files_raw is None:
+            if not require_modified_files:
+                # watch mode discovers modified files itself
+                logger.info("Config loaded.")
+                return
             raise Exception("Modified files ENV not found. Exiting...")
         try:
             self.modified_files = json.loads(modified_files_raw)
@@ -64,3 +244,99 @@ class Config:
         if not isinstance(self.modified_files, list):
             raise ValueError("Modified files ENV must be a JSON list.")
         logger.info("Config loaded.")
+
+    def _load_projects(self) -> None:
+        projects_raw = os.environ.get("INPUT_PROJECTS", None)
+        if not projects_raw:
+            return
+        try:
+            entries = json.loads(projects_raw)
+        except json.JSONDecodeError as exc:
+            raise ValueError("Projects ENV could not be parsed as JSON.") from exc
+        if not isinstance(entries, list) or not entries:
+            raise ValueError("Projects ENV must be a non-empty JSON list.")
+        self.projects = []
+        for entry in entries:
+            if isinstance(entry, list) and len(entry) == 2:
+                entry = {"collections": entry[0], "gvars": entry[1]}
+            if not isinstance(entry, dict) or not all(isinstance(entry.get(k), str) for k in ("collections", "gvars")):
+                raise ValueError("Each project must be a [collections, gvars] pair or an object with both paths.")
+            collections_path = entry["collections"]
+            name = entry.get("name") or _project_name(collections_path)
+            # each project keeps its own lockfile, next to its collection map unless given
+            lock_file = Path(entry.get("lock_file") or Path(collections_path).parent / "avrae-lock.json")
+            self.projects.append(Project(str(name), collections_path, entry["gvars"], lock_file))
+        names = [project.name for project in self.projects]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Project names must be unique: {', '.join(names)}")
+
+    def for_project(self, project: Project) -> "Config":
+        """This config narrowed to one project, with its own maps, lockfile and cache directory."""
+        narrowed = copy.copy(self)
+        narrowed.projects = []
+        narrowed.collections_file_path = project.collections_file_path
+        narrowed.gvars_file_path = project.gvars_file_path
+        narrowed.lock_file = project.lock_file
+        narrowed.cache_dir = self.cache_dir / project.name
+        return narrowed
+
+    def load_server_config(self) -> None:
+        """Read the service mode settings: which repository checkouts to serve and how."""
+        repos_raw = os.environ.get("INPUT_SERVER_REPOS", None)
+        if not repos_raw:
+            raise ValueError("Server mode needs INPUT_SERVER_REPOS, a JSON object of repository name to checkout.")
+        try:
+            repos = json.loads(repos_raw)
+        except json.JSONDecodeError as exc:
+            raise ValueError("Server repos ENV could not be parsed as JSON.") from exc
+        if not isinstance(repos, dict) or not all(isinstance(v, str) for v in repos.values()):
+            raise ValueError("Server repos ENV must be a JSON object mapping repository names to paths.")
+        self.server_repos = {name: Path(path).resolve() for name, path in repos.items()}
+        for name, path in self.server_repos.items():
+            if not path.is_dir():
+                raise FileNotFoundError(f"Checkout of {name} not found at {path.as_posix()}")
+        self.server_host = os.environ.get("INPUT_SERVER_HOST", None) or self.server_host
+        try:
+            self.server_port = int(os.environ.get("INPUT_SERVER_PORT", None) or self.server_port)
+            self.server_workers = int(os.environ.get("INPUT_SERVER_WORKERS", None) or self.server_workers)
+        except ValueError as exc:
+            raise ValueError("Server port and workers must be whole numbers.") from exc
+        if self.server_workers < 1:
+            raise ValueError("Server workers must be at least 1.")
+        # without checking out each push, the server would sync whatever happens to be on disk
+        self.server_checkout = self._env_flag("INPUT_SERVER_CHECKOUT", True)
+        self.server_branch = os.environ.get("INPUT_SERVER_BRANCH", None) or None
+        self.webhook_secret = os.environ.get("INPUT_WEBHOOK_SECRET", None) or None
+
+    def _load_diff_range(self) -> None:
+        """Pick the commits to diff: explicit inputs first, then the triggering push or pull request event."""
+        event = {}
+        event_path = os.environ.get("GITHUB_EVENT_PATH", None)
+        if event_path and Path(event_path).is_file():
+            with open(event_path, "r", encoding="utf-8") as fp:
+                event = json.load(fp)
+        pull_request = event.get("pull_request") or {}
+        self.diff_base = (
+            os.environ.get("INPUT_BEFORE_SHA", None)
+            or event.get("before")
+            or (pull_request.get("base") or {}).get("sha")
+        )
+        self.diff_head = (
+            os.environ.get("INPUT_AFTER_SHA", None)
+            or event.get("after")
+            or (pull_request.get("head") or {}).get("sha")
+            or os.environ.get("GITHUB_SHA", None)
+            or "HEAD"
+        )
+        if self.diff_base is None:
+            self.diff_base = f"{self.diff_head}~1"
+            logger.warning(f"No base commit found; diffing against {self.diff_base}")
+
+    def has_modified_files(self) -> bool:
+        return self.change_detection == "git" or self.modified_files is not None or self.modified_files_path is not None
+
+    def iter_modified_files(self) -> Iterator[str]:
+        """Yield the modified paths, streaming them from the list file when one was given."""
+        if self.modified_files_path is not None:
+            return utils.iter_path_list_file(self.modified_files_path)
+        return iter(self.modified_files or [])
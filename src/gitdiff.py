@@ -0,0 +1,109 @@
+####
+# Change detection from local git history
+###
+
+import logging
+import re
+import subprocess
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+logger = logging.getLogger("gitdiff")
+
+# git's well-known empty tree, used as the base for pushes that create a branch
+EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+_ZERO_SHA = re.compile(r"^0+$")
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+class GitDiffError(Exception):
+    """Raised when git cannot compute the changed files between two commits."""
+
+    pass
+
+
+def _iter_nul_fields(stream) -> Iterator[str]:
+    pending = b""
+    while True:
+        chunk = stream.read(_READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        fields = (pending + chunk).split(b"\0")
+        pending = fields.pop()
+        for field in fields:
+            yield field.decode("utf-8", errors="surrogateescape")
+    if pending:
+        yield pending.decode("utf-8", errors="surrogateescape")
+
+
+def parse_name_status(fields: Iterable[str]) -> Iterator[str]:
+    """Turn `git diff --name-status -z` fields into the paths that exist after the change."""
+    iterator = iter(fields)
+    for status in iterator:
+        kind = status[:1]
+        if kind in ("R", "C"):
+            # renames and copies list the old path, then the new one
+            next(iterator, None)
+            new_path = next(iterator, None)
+            if new_path is not None:
+                yield new_path
+            continue
+        path = next(iterator, None)
+        if path is None:
+            break
+        if kind == "D":
+            continue
+        yield path
+
+
+def iter_changed_files(
+    before: str | None,
+    after: str,
+    roots: Iterable[Path],
+    cwd: Path | None = None,
+) -> Iterator[str]:
+    """Yield files added, modified or renamed between two commits under the given roots, in one git call."""
+    base = EMPTY_TREE if not before or _ZERO_SHA.match(before) else before
+    pathspecs = [root.as_posix() for root in roots]
+    if not pathspecs:
+        return
+    command = [
+        "git",
+        # checkouts mounted into the action container are owned by another user
+        "-c",
+        "safe.directory=*",
+        "diff",
+        "--name-status",
+        "-z",
+        "-M",
+        "--no-color",
+        base,
+        after,
+        "--",
+        *pathspecs,
+    ]
+    logger.info(f"Computing changed files between {base[:12]} and {after[:12]}...")
+    process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert process.stdout is not None and process.stderr is not None
+    try:
+        yield from parse_name_status(_iter_nul_fields(process.stdout))
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode("utf-8", errors="replace").strip()
+        process.stderr.close()
+        return_code = process.wait()
+    if return_code != 0:
+        raise GitDiffError(
+            f"git diff {base}..{after} failed: {stderr}\n"
+            "Make sure both commits are fetched (for example with `fetch-depth: 0` on actions/checkout)."
+        )
+
+
+def checkout(repo_dir: Path, commit: str) -> None:
+    """Fetch and check out a pushed commit in a long-lived clone."""
+    for command in (["fetch", "--quiet", "origin"], ["checkout", "--quiet", "--force", "--detach", commit]):
+        result = subprocess.run(
+            ["git", "-c", "safe.directory=*", *command], cwd=repo_dir, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise GitDiffError(f"git {command[0]} in {repo_dir.as_posix()} failed: {result.stderr.strip()}")
@@ -0,0 +1,87 @@
+####
+# GVAR data compiler
+###
+
+import json
+import logging
+from collections.abc import Sequence
+from typing import Any
+
+logger = logging.getLogger("gvarbuild")
+
+# bump when the index layout changes; aliases can check it before loading shards
+GVAR_INDEX_FORMAT = 1
+MAX_GVAR_LENGTH = 100_000
+
+
+class GvarBuildError(Exception):
+    """Raised when a GVAR source cannot be built into values Avrae accepts."""
+
+    pass
+
+
+def _dump(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _parse_structured(text: str) -> Any | None:
+    """The decoded value of a JSON object or array; None for anything else, which is uploaded as written."""
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return None
+    return value if isinstance(value, (dict, list)) else None
+
+
+def minify_json(text: str) -> str:
+    """Re-serialize a JSON object or array without insignificant whitespace, keeping key order."""
+    value = _parse_structured(text)
+    return text if value is None else _dump(value)
+
+
+def _pack(parts: list[str], opener: str, closer: str, limit: int) -> list[str] | None:
+    """Greedily pack serialized members into as few JSON documents as fit the limit; None if one cannot fit."""
+    documents: list[str] = []
+    current: list[str] = []
+    length = len(opener) + len(closer)
+    for part in parts:
+        added = len(part) + (1 if current else 0)
+        if current and length + added > limit:
+            documents.append(opener + ",".join(current) + closer)
+            current, length, added = [], len(opener) + len(closer), len(part)
+        if len(opener) + len(part) + len(closer) > limit:
+            return None
+        current.append(part)
+        length += added
+    documents.append(opener + ",".join(current) + closer)
+    return documents
+
+
+def split_data(text: str, limit: int = MAX_GVAR_LENGTH) -> tuple[str, list[str]]:
+    """Split GVAR data into (type, shards): arrays and objects into valid JSON pieces, anything else into text."""
+    value = _parse_structured(text)
+    if isinstance(value, list):
+        documents = _pack([_dump(item) for item in value], "[", "]", limit)
+        if documents is not None:
+            return "list", documents
+    elif isinstance(value, dict):
+        documents = _pack([f"{_dump(key)}:{_dump(item)}" for key, item in value.items()], "{", "}", limit)
+        if documents is not None:
+            return "dict", documents
+    # a single member larger than a GVAR: fall back to plain slices that must be joined before parsing
+    minified = minify_json(text)
+    return "text", [minified[start : start + limit] for start in range(0, max(len(minified), 1), limit)]
+
+
+def build_gvar(text: str, gvar_id: str, shard_ids: Sequence[str] = (), limit: int = MAX_GVAR_LENGTH) -> dict[str, str]:
+    """Map every GVAR id to the value it should hold, shards before the index that points at them."""
+    if not shard_ids:
+        return {gvar_id: minify_json(text)}
+    # with shards configured the index is always written, so aliases read one layout however large the data is
+    data_type, shards = split_data(text, limit)
+    if len(shards) > len(shard_ids):
+        raise GvarBuildError(f"needs {len(shards)} shard GVARs but only {len(shard_ids)} are configured")
+    values = dict(zip(shard_ids, shards))
+    used = list(shard_ids[: len(shards)])
+    values[gvar_id] = _dump({"format": GVAR_INDEX_FORMAT, "type": data_type, "shards": used})
+    return values
@@ -0,0 +1,141 @@
+####
+# Hedged requests
+###
+
+import logging
+import threading
+from collections import deque
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from time import monotonic
+from typing import Any
+
+logger = logging.getLogger("hedging")
+
+# latencies kept for the hedge threshold; old samples age out as the API speeds up or slows down
+LATENCY_WINDOW = 200
+# too few samples make a p95 meaningless, so the floor alone is the threshold until this many requests have completed
+MIN_SAMPLES = 20
+# the least a request waits before it is hedged, and the whole threshold before there are enough samples
+DEFAULT_HEDGE_AFTER_MS = 1000
+# hedges allowed beyond `max_rate`, so a run of a handful of requests can still hedge its slowest one
+HEDGE_BURST = 1
+
+
+def percentile(samples: Iterable[float], q: float) -> float | None:
+    """Nearest-rank percentile, or None without samples."""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+class Hedger:
+    """Duplicates an idempotent request that outlasts the observed p95, using whichever copy answers first.
+
+    Requests are never hedged sooner than `floor` seconds, which is also the threshold until enough latencies have
+    been seen. At most `max_rate` of the requests (plus `HEDGE_BURST`) are hedged, so a slow API never sees more
+    than that much extra load.
+    """
+
+    def __init__(self, max_rate: float, floor: float | None = None, min_samples: int = MIN_SAMPLES):
+        self.max_rate = max_rate
+        self.floor = floor
+        self.min_samples = min_samples
+        self._closed = False
+        # how long each first attempt took, whether or not it was hedged: the latency without hedging
+        self._unhedged: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        # how long callers actually waited
+        self._observed: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def threshold(self) -> float | None:
+        """Seconds to wait before hedging, or None while there are too few samples and no floor."""
+        with self._lock:
+            p95 = percentile(self._unhedged, 95) if len(self._unhedged) >= self.min_samples else None
+        if p95 is None:
+            return self.floor
+        return p95 if self.floor is None else max(p95, self.floor)
+
+    def _record(self, samples: deque[float], started: float) -> None:
+        with self._lock:
+            samples.append(monotonic() - started)
+
+    def _take_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.max_rate * self.requests + HEDGE_BURST:
+                return False
+            self.hedges += 1
+            return True
+
+    def send(self, attempt: Callable[[], Any], hedge: Callable[[], Any] | None = None) -> Any:
+        """Run `attempt`, racing `hedge` (by default the same call) against it when it is slow."""
+        started = monotonic()
+        with self._lock:
+            self.requests += 1
+        delay = None if self._closed else self.threshold()
+        if delay is None:
+            try:
+                return attempt()
+            finally:
+                self._record(self._unhedged, started)
+                self._record(self._observed, started)
+        primary = self._start(attempt)
+        primary.add_done_callback(lambda _: self._record(self._unhedged, started))
+        try:
+            done, _ = wait([primary], timeout=delay)
+            if done or not self._take_hedge():
+                return primary.result()
+            logger.debug(f"No response after {delay:.3f}s; sending a hedged request")
+            backup = self._start(hedge or attempt)
+            return self._first_success(primary, backup)
+        finally:
+            self._record(self._observed, started)
+
+    @staticmethod
+    def _start(call: Callable[[], Any]) -> Future:
+        # daemon threads, so a losing request still waiting on the network never holds up exit
+        future: Future = Future()
+
+        def run() -> None:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(call())
+            except BaseException as exc:
+                future.set_exception(exc)
+
+        threading.Thread(target=run, name="hedge", daemon=True).start()
+        return future
+
+    def _first_success(self, primary: Future, backup: Future) -> Any:
+        pending = {primary, backup}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    # the loser cannot be interrupted mid-request; its response is dropped when it arrives
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result()
+        # both failed: report the original request's error, as an unhedged call would
+        return primary.result()
+
+    def close(self) -> None:
+        """Stop hedging; later requests run unhedged on the caller's thread."""
+        self._closed = True
+
+    def summary(self) -> str:
+        with self._lock:
+            unhedged = percentile(self._unhedged, 99)
+            observed = percentile(self._observed, 99)
+            text = f"{self.hedges} of {self.requests} GET(s) hedged, {self.hedge_wins} won by the hedge"
+        if unhedged is None or observed is None:
+            return text
+        return f"{text}; p99 {unhedged * 1000:.0f} ms without hedging, {observed * 1000:.0f} ms with"
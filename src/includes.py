@@ -0,0 +1,136 @@
+####
+# Shared fragment includes
+###
+
+import json
+import logging
+import os
+import re
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+
+logger = logging.getLogger("includes")
+
+FRAGMENT_SUFFIX = ".drac"
+_INCLUDE_DIRECTIVE = re.compile(r'^([ \t]*)#include[ \t]+"([^"]+)"[ \t]*\r?$', re.MULTILINE)
+
+
+class IncludeError(Exception):
+    """Raised when an include directive cannot be resolved."""
+
+    pass
+
+
+def resolve_include(including_file: Path, target: str, root: Path | None = None) -> Path:
+    """Paths are relative to the including file, or to the repository root when they start with `/`.
+
+    The repository root is the working directory unless `root` is given.
+    """
+    if target.startswith("/"):
+        return Path(os.path.normpath((root or Path()) / target.lstrip("/")))
+    return Path(os.path.normpath(including_file.parent / target))
+
+
+def expand_includes(
+    path: Path, text: str, fragments: set[Path] | None = None, stack: tuple = (), root: Path | None = None
+) -> str:
+    """Replace every include directive with the fragment's (indented, recursively expanded) content."""
+    fragments = fragments if fragments is not None else set()
+
+    def replace(match: re.Match) -> str:
+        indent, target = match.group(1), match.group(2)
+        fragment = resolve_include(path, target, root)
+        if fragment in stack or fragment == path:
+            raise IncludeError(f"{path.as_posix()} includes {fragment.as_posix()} in a cycle")
+        try:
+            with open(fragment, "r", encoding="utf-8", newline="") as fp:
+                content = fp.read()
+        except OSError as exc:
+            raise IncludeError(f"{path.as_posix()} includes missing fragment {fragment.as_posix()}") from exc
+        fragments.add(fragment)
+        content = expand_includes(fragment, content, fragments, stack + (path,), root).rstrip("\r\n")
+        return "\n".join(indent + line if line else line for line in content.split("\n"))
+
+    return _INCLUDE_DIRECTIVE.sub(replace, text)
+
+
+class IncludeGraph:
+    """Which fragments every alias and snippet includes, persisted so fragment changes map to their dependents."""
+
+    def __init__(
+        self, path: Path | None = None, dependencies: dict[str, list[str]] | None = None, root: Path | None = None
+    ):
+        self.path = path
+        # where `/`-rooted includes resolve; the working directory when unset
+        self.root = root
+        self._dependencies: dict[Path, set[Path]] = {
+            Path(source): {Path(fragment) for fragment in fragments}
+            for source, fragments in (dependencies or {}).items()
+        }
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path: Path, roots: Iterable[Path], root: Path | None = None) -> "IncludeGraph":
+        """Load the persisted graph, or build it by scanning every alias and snippet under the roots."""
+        if path.is_file():
+            try:
+                with open(path, "r", encoding="utf-8") as fp:
+                    dependencies = json.load(fp)
+                if isinstance(dependencies, dict):
+                    return cls(path, dependencies, root)
+            except (OSError, json.JSONDecodeError) as exc:
+                logger.warning(f"Ignoring unreadable include graph at {path.as_posix()}: {exc}")
+        graph = cls(path, root=root)
+        graph.scan(roots)
+        return graph
+
+    def scan(self, roots: Iterable[Path]) -> None:
+        logger.info("Building the include graph from scratch...")
+        for root in roots:
+            for source in sorted(list(root.rglob("*.alias")) + list(root.rglob("*.snippet"))):
+                try:
+                    self.expand(source, source.read_text(encoding="utf-8"))
+                except (IncludeError, OSError, UnicodeDecodeError) as exc:
+                    logger.warning(f"Skipping {source.as_posix()} while building the include graph: {exc}")
+
+    def expand(self, path: Path, text: str) -> str:
+        """Expand a source file's includes, recording what it now depends on."""
+        fragments: set[Path] = set()
+        expanded = expand_includes(path, text, fragments, root=self.root)
+        with self._lock:
+            if self._dependencies.get(path, set()) != fragments:
+                if fragments:
+                    self._dependencies[path] = fragments
+                else:
+                    self._dependencies.pop(path, None)
+                self._dirty = True
+        return expanded
+
+    def dependents(self, fragment: Path) -> list[Path]:
+        """Every alias or snippet that includes the fragment, directly or through another fragment."""
+        with self._lock:
+            return sorted(source for source, fragments in self._dependencies.items() if fragment in fragments)
+
+    def fragments(self) -> list[Path]:
+        with self._lock:
+            return sorted(set().union(*self._dependencies.values()))
+
+    def save(self) -> None:
+        with self._lock:
+            if self.path is None or not self._dirty:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                json.dump(
+                    {
+                        source.as_posix(): sorted(fragment.as_posix() for fragment in fragments)
+                        for source, fragments in self._dependencies.items()
+                    },
+                    fp,
+                    sort_keys=True,
+                )
+            tmp_path.replace(self.path)
+            self._dirty = False
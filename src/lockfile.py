@@ -0,0 +1,135 @@
+####
+# Path to workshop id lockfile
+###
+
+import json
+import logging
+import threading
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger("lockfile")
+
+LOCKFILE_VERSION = 1
+
+
+@dataclass(frozen=True, slots=True)
+class LockEntry:
+    """What the workshop knows about one local alias or snippet file."""
+
+    type: str
+    id: str
+    name: str
+    collection: str
+    docs: str
+    parent_id: str | None = None
+    version: int | None = None
+
+
+def active_version(item_data: dict[str, Any]) -> int | None:
+    """The current code version of a workshop item payload, when it lists its versions."""
+    for version in item_data.get("versions") or []:
+        if isinstance(version, dict) and version.get("is_current") and isinstance(version.get("version"), int):
+            return version["version"]
+    return None
+
+
+class LockFile:
+    """Maps local alias/snippet paths to workshop ids so single items can be fetched without `/full`."""
+
+    def __init__(self, path: Path, entries: dict[str, LockEntry] | None = None, root: Path | None = None):
+        self.path = path
+        # entries are stored relative to this checkout when callers work with absolute paths
+        self.root = root
+        self._entries: dict[str, LockEntry] = entries or {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path: Path, root: Path | None = None) -> "LockFile":
+        try:
+            with open(path, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+            entries = {item_path: LockEntry(**entry) for item_path, entry in data["items"].items()}
+        except (OSError, json.JSONDecodeError, KeyError, TypeError) as exc:
+            logger.warning(f"Ignoring unreadable lockfile at {path.as_posix()}: {exc}")
+            return cls(path, root=root)
+        return cls(path, entries, root)
+
+    def _key(self, path: Path) -> str:
+        if self.root is not None and path.is_absolute():
+            return path.relative_to(self.root).as_posix()
+        return path.as_posix()
+
+    def _resolve(self, key: str) -> Path:
+        return self.root / key if self.root is not None else Path(key)
+
+    def get(self, path: Path) -> LockEntry | None:
+        with self._lock:
+            return self._entries.get(self._key(path))
+
+    def entries_for(self, collection_id: str) -> dict[Path, LockEntry]:
+        with self._lock:
+            return {
+                self._resolve(path): replace(entry, docs=self._resolve(entry.docs).as_posix())
+                for path, entry in self._entries.items()
+                if entry.collection == collection_id
+            }
+
+    def missing_paths(self, collection_path: Path, paths: Iterable[Path]) -> list[Path]:
+        """Modified files under a collection that should map to an item but have no entry."""
+        with self._lock:
+            known_docs = {entry.docs for entry in self._entries.values()}
+            missing = []
+            for path in paths:
+                if collection_path not in path.parents or self._key(path) in self._entries:
+                    continue
+                if path.suffix in (".alias", ".snippet"):
+                    missing.append(path)
+                elif path.suffix == ".md" and self._key(path) not in known_docs:
+                    # docs only matter when they sit next to an alias or snippet file
+                    if path.with_suffix(".alias").is_file() or path.with_suffix(".snippet").is_file():
+                        missing.append(path)
+            return missing
+
+    def replace_collection(self, collection_id: str, entries: Iterable[tuple]) -> None:
+        """Swap every entry of a collection for a freshly fetched set of (path, entry) pairs."""
+        fresh = {self._key(path): replace(entry, docs=self._key(Path(entry.docs))) for path, entry in entries}
+        with self._lock:
+            current = {path: entry for path, entry in self._entries.items() if entry.collection == collection_id}
+            if current == fresh:
+                return
+            for path in current:
+                del self._entries[path]
+            self._entries.update(fresh)
+            self._dirty = True
+
+    def record_version(self, path: Path, version: Any) -> None:
+        if not isinstance(version, int):
+            return
+        with self._lock:
+            entry = self._entries.get(self._key(path))
+            if entry is not None and entry.version != version:
+                self._entries[self._key(path)] = replace(entry, version=version)
+                self._dirty = True
+
+    def to_json(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "version": LOCKFILE_VERSION,
+                "items": {path: asdict(entry) for path, entry in sorted(self._entries.items())},
+            }
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        data = self.to_json()
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump(data, fp, indent=2)
+            fp.write("\n")
+        tmp_path.replace(self.path)
+        self._dirty = False
+        logger.info(f"Updated lockfile {self.path.as_posix()}")
@@ -9,13 +9,28 @@
 
 import logging
 import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Tuple, Union
 
-from config import Config
-from parsing import Parser
-from api import Avrae
+import gitdiff
+import tracing
 import utils as utils
+from config import Config, Project
+from parsing import DEFAULT_TOKEN_ALIAS, Parser, load_parser
+from scheduler import UpdateJob, link_gvar_dependencies, run_prioritized
 from sys import exit
 
+if TYPE_CHECKING:
+    # `api` pulls in requests; it is imported lazily so runs with nothing to do exit fast
+    from concurrent.futures import ProcessPoolExecutor
+
+    from api import Avrae
+    from preflight import PreflightChecker
+
 logger = logging.getLogger("main")
 parser_logger = logging.getLogger("parser")
 api_logger = logging.getLogger("api")
@@ -33,70 +48,475 @@ def setup_logging() -> None:
     logging.basicConfig(level=logging.INFO, handlers=[handler], force=True)
 
 
-def update_collections(avrae: Avrae, parser: Parser, modified_paths: set) -> None:
-    """Update changed aliases, snippets, and docs for each configured collection."""
+Accounts = Union["Avrae", Mapping[str, "Avrae"]]
+
+
+def as_accounts(avrae: Accounts) -> Mapping[str, "Avrae"]:
+    """Accept a single client or a mapping of token alias to client."""
+    if isinstance(avrae, Mapping):
+        return avrae
+    return {DEFAULT_TOKEN_ALIAS: avrae}
+
+
+def collection_jobs(avrae: Accounts, parser: Parser, modified_paths: set) -> List[UpdateJob]:
+    """Fetch each configured collection and build update jobs for its changed code and docs."""
     api_logger.info("Checking collections...")
+    accounts = as_accounts(avrae)
+    jobs: List[UpdateJob] = []
     for path, collection_id in parser.collections.items():
+        avrae = accounts[parser.token_alias(path)]
         api_logger.info(f"Checking Collection {collection_id} at {path.as_posix()}")
         # create mapping of local file paths to collection contents
-        alias_outputs, snippet_outputs = avrae.parse_collection(collection_id, parser)
+        alias_outputs, snippet_outputs = avrae.parse_collection(collection_id, parser, modified_paths)
 
-        # check each file if it was modified, and update if it doesn't match the remote
-        for alias_path, parsed_alias in alias_outputs.items():
-            if alias_path in modified_paths:
-                avrae.check_and_maybe_update("alias", parsed_alias)
-            if parsed_alias.docs_path in modified_paths:
-                avrae.check_and_maybe_update_docs("alias", parsed_alias)
-        for snippet_path, parsed_snippet in snippet_outputs.items():
-            if snippet_path in modified_paths:
-                avrae.check_and_maybe_update("snippet", parsed_snippet)
-            if parsed_snippet.docs_path in modified_paths:
-                avrae.check_and_maybe_update_docs("snippet", parsed_snippet)
+        # queue each modified file; the update itself checks for differences against the remote
+        for type_, outputs in (("alias", alias_outputs), ("snippet", snippet_outputs)):
+            for file_path, parsed in outputs.items():
+                if file_path in modified_paths:
+                    jobs.append(
+                        UpdateJob(
+                            f"code:{file_path.as_posix()}",
+                            "code",
+                            file_path,
+                            parsed.data["_id"],
+                            partial(avrae.check_and_maybe_update, type_, parsed),
+                        )
+                    )
+                if parsed.docs_path in modified_paths:
+                    jobs.append(
+                        UpdateJob(
+                            f"docs:{parsed.docs_path.as_posix()}",
+                            "docs",
+                            parsed.docs_path,
+                            parsed.data["_id"],
+                            partial(avrae.check_and_maybe_update_docs, type_, parsed),
+                        )
+                    )
+    return jobs
 
 
-def run() -> None:
-    logger.info("Starting Avrae Auto-Updater!")
+def gvar_jobs(avrae: Accounts, parser: Parser, modified_paths: set) -> List[UpdateJob]:
+    """Build update jobs for every modified GVAR."""
+    accounts = as_accounts(avrae)
+    return [
+        UpdateJob(
+            f"gvar:{gvar_path.as_posix()}",
+            "gvar",
+            gvar_path,
+            gvar_id,
+            partial(accounts[parser.token_alias(gvar_path)].check_and_maybe_update_gvar, gvar_path, gvar_id),
+        )
+        for gvar_path, gvar_id in parser.gvars.items()
+        if gvar_path in modified_paths
+    ]
+
+
+def read_local_code(accounts: Mapping[str, "Avrae"], parser: Parser, path: Path) -> str:
+    """The code a job will upload, includes expanded, read by the account that owns its collection."""
+    root = next((root for root in parser.collections if root in path.parents), path)
+    return accounts[parser.token_alias(root)].local_code(path)
+
+
+def sync(
+    avrae: Accounts,
+    parser: Parser,
+    modified_paths: set,
+    max_workers: int = 1,
+    preflight: Optional["PreflightChecker"] = None,
+) -> Dict[str, int]:
+    """Push all modified files, GVARs before the code that loads them, each level in parallel."""
+    if preflight is not None:
+        # a batch with any file Avrae would reject fails before the first request
+        with tracing.span("preflight", "phase", files=len(modified_paths)):
+            preflight.check(modified_paths, parser.includes, parser.gvar_shards)
+    accounts = as_accounts(avrae)
+    for account in accounts.values():
+        account.includes = parser.includes
+        account.lock = parser.lock
+        account.gvar_shards = parser.gvar_shards
+    with tracing.span("fetch", "phase"):
+        jobs = collection_jobs(accounts, parser, modified_paths) + gvar_jobs(accounts, parser, modified_paths)
+        jobs = link_gvar_dependencies(jobs, partial(read_local_code, accounts, parser))
+    kinds = Counter(job.kind for job in jobs)
+    api_logger.info(
+        f"Running {len(jobs)} update(s) across {len(accounts)} account(s): "
+        f"{kinds['code']} code, {kinds['gvar']} GVAR, {kinds['docs']} docs, in that order..."
+    )
+    try:
+        # every account runs its share concurrently; each is still held to its own rate limit
+        with tracing.span("update", "phase", jobs=len(jobs)):
+            results = run_prioritized(jobs, max_workers * len(accounts))
+    finally:
+        with tracing.span("save caches", "phase"):
+            for account in accounts.values():
+                account.save_caches()
+            if parser.includes is not None:
+                parser.includes.save()
+            if parser.lock is not None:
+                parser.lock.save()
+    uploads_avoided = sum(account.stats["uploads_avoided"] for account in accounts.values())
+    if uploads_avoided:
+        api_logger.info(f"Skipped {uploads_avoided} upload(s) that only differed by line endings or whitespace.")
+    report_minified_sizes(accounts, parser)
+    # accounts usually share one cache; report each distinct one once
+    for payloads in {id(account.payloads): account.payloads for account in accounts.values()}.values():
+        api_logger.info(f"Payload cache: {payloads.summary()}")
+    for alias, account in accounts.items():
+        if account.client.hedger is not None:
+            api_logger.info(f"Hedged requests ({alias}): {account.client.hedger.summary()}")
+    return results
 
-    # Step One: Validate our Environment & Load our config
-    config = Config()
-    config.load_config()
 
+def report_minified_sizes(accounts: Mapping[str, "Avrae"], parser: Parser) -> None:
+    """Log how many bytes minification removed from each collection's modified code."""
+    from minify import savings_by_collection
+
+    savings: Dict = {}
+    for account in accounts.values():
+        if account.builder is not None:
+            savings.update(account.builder.savings)
+    totals = savings_by_collection(savings, parser.collections)
+    for collection_id, (source_bytes, built_bytes) in sorted(totals.items()):
+        saved = source_bytes - built_bytes
+        api_logger.info(
+            f"Minified collection {collection_id}: {source_bytes} -> {built_bytes} bytes "
+            f"({saved} saved, {saved / max(source_bytes, 1):.0%})"
+        )
+
+
+def find_modified_paths(config: Config) -> tuple[Parser, set]:
+    """Resolve the configured change source to the modified files of configured collections and GVARs."""
     # Step Two: Find our workspaces & check our modified files.
     logger.info("Parsing modified files.")
-    if config.modified_files is None:
+    if not config.has_modified_files():
         logger.info("No modified files provided. Quitting...")
         exit(1)
-    modified_files = utils.parse_paths(config.modified_files)
-    if len(modified_files) == 0:
+    parser: Optional[Parser] = None
+    if config.change_detection == "git":
+        # git only needs to look under the configured roots
+        parser = load_parser(config)
+        roots = parser.source_roots() + (parser.includes.fragments() if parser.includes is not None else [])
+        changed_files = gitdiff.iter_changed_files(config.diff_base, config.diff_head, roots)
+    else:
+        changed_files = config.iter_modified_files()
+    # paths are streamed straight into the parser so huge change lists stay out of memory
+    modified_files = utils.iter_paths(changed_files)
+    first_modified_file = next(modified_files, None)
+    if first_modified_file is None:
         logger.info("No modified Avrae files detected. Quitting...")
         exit(0)
 
-    logger.info(f"Found {len(modified_files)} relevant modified files.")
-
     # Step Three: Parse our collections and gvars!
-    parser_logger.info("Loading data from configuration files...")
-    parser = Parser(config)
-    parser.load_collections()
-    parser.load_gvars()
-    parser.find_connected_files(modified_files)
+    if parser is None:
+        parser = load_parser(config)
+    parser.find_connected_files(chain([first_modified_file], modified_files))
     if len(parser.connected_files) == 0:
         parser_logger.info("No modified files matched configured collections or GVARs. Quitting...")
         exit(0)
+    logger.info(f"Found {len(parser.connected_files)} relevant modified files.")
 
     modified_paths = set(x.path for x in parser.connected_files)
     parser_logger.info("Data loaded.")
+    return parser, modified_paths
+
+
+def find_project_changes(config: Config) -> List[Tuple[Project, Config, Parser, set]]:
+    """Resolve the change source once and split the modified files between every configured project."""
+    logger.info(f"Parsing modified files for {len(config.projects)} project(s).")
+    if not config.has_modified_files():
+        logger.info("No modified files provided. Quitting...")
+        exit(1)
+    projects = []
+    for project in config.projects:
+        parser_logger.info(f"Project {project.name}:")
+        project_config = config.for_project(project)
+        projects.append((project, project_config, load_parser(project_config)))
+    project_roots = [
+        set(parser.source_roots()) | set(parser.includes.fragments() if parser.includes else [])
+        for _, _, parser in projects
+    ]
+    if config.change_detection == "git":
+        roots = [root for roots in project_roots for root in roots]
+        changed_files = gitdiff.iter_changed_files(config.diff_base, config.diff_head, roots)
+    else:
+        changed_files = config.iter_modified_files()
+    # stream the change list once, keeping each path only for the projects it falls under
+    project_files: List[List[Path]] = [[] for _ in projects]
+    for path in utils.iter_paths(changed_files):
+        owners = {path, *path.parents}
+        for files, roots in zip(project_files, project_roots):
+            if not roots.isdisjoint(owners):
+                files.append(path)
+    changes = []
+    for (project, project_config, parser), files in zip(projects, project_files):
+        parser.find_connected_files(files)
+        modified_paths = set(x.path for x in parser.connected_files)
+        if modified_paths:
+            logger.info(f"Project {project.name}: {len(modified_paths)} relevant modified file(s).")
+            changes.append((project, project_config, parser, modified_paths))
+    if not changes:
+        parser_logger.info("No modified files matched any project's collections or GVARs. Quitting...")
+        exit(0)
+    return changes
+
+
+def run_projects(config: Config) -> None:
+    """Sync every project with changes concurrently, sharing connections, rate limits and caches."""
+    from api import close_clients, create_clients
+
+    with tracing.span("find modified files", "phase"):
+        changes = find_project_changes(config)
+    shared = create_clients(config, {alias for _, _, parser, _ in changes for alias in parser.used_token_aliases()})
+    # made once there is something to check, before the project threads start
+    pool = create_check_pool(config)
+
+    def sync_project(project: Project, project_config: Config, parser: Parser, modified_paths: set) -> Dict[str, int]:
+        accounts = create_clients(project_config, parser.used_token_aliases(), shared)
+        with tracing.span(f"project {project.name}", "phase"):
+            return sync(accounts, parser, modified_paths, config.max_workers, create_preflight(project_config, pool))
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(changes)) as project_pool:
+            futures = {change[0].name: project_pool.submit(sync_project, *change) for change in changes}
+    finally:
+        close_clients(shared)
+        if pool is not None:
+            pool.shutdown()
+    failed = []
+    for name, future in futures.items():
+        exc = future.exception()
+        if exc is not None:
+            logger.error(f"Project {name} failed: {exc}")
+            failed.append(name)
+            continue
+        results = future.result().values()
+        updated = sum(1 for result in results if result == 0)
+        logger.info(f"Project {name}: {updated} updated, {len(results) - updated} already up to date.")
+    if failed:
+        logger.error(f"{len(failed)} of {len(futures)} project(s) failed: {', '.join(failed)}")
+        exit(1)
+
+
+def create_preflight(config: Config, pool: Optional["ProcessPoolExecutor"] = None) -> Optional["PreflightChecker"]:
+    if not config.preflight:
+        return None
+    from preflight import PreflightChecker
+
+    return PreflightChecker.from_config(config, pool)
+
+
+def create_check_pool(config: Config) -> Optional["ProcessPoolExecutor"]:
+    """One process pool for every preflight check of this process, made before any worker threads start."""
+    if not config.preflight:
+        return None
+    from preflight import create_check_pool
+
+    return create_check_pool(config.max_workers)
+
+
+def run() -> None:
+    logger.info("Starting Avrae Auto-Updater!")
+
+    # Step One: Validate our Environment & Load our config
+    config = Config()
+    config.load_config()
+    if config.trace_file is not None:
+        tracing.start(config.trace_file)
+    pool = None
+    try:
+        if config.projects:
+            run_projects(config)
+            return
+        with tracing.span("find modified files", "phase"):
+            parser, modified_paths = find_modified_paths(config)
+        # made only once there is something to check, so a run with nothing to do stays fast
+        pool = create_check_pool(config)
+
+        # Step Four: Update the workshop, then GVARs
+        from api import close_clients, create_clients
+
+        accounts = create_clients(config, parser.used_token_aliases())
+        try:
+            sync(accounts, parser, modified_paths, config.max_workers, create_preflight(config, pool))
+        finally:
+            close_clients(accounts)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        tracing.stop()
+
+
+def plan() -> None:
+    """Compute every write a run would issue, without issuing any, and save it for `apply`."""
+    from api import close_clients, create_clients
+    from plan import Plan, PlanRecorder
+
+    logger.info("Starting Avrae Auto-Updater in plan mode!")
+    config = Config()
+    config.load_config()
+    parser, modified_paths = find_modified_paths(config)
+
+    accounts = create_clients(config, parser.used_token_aliases())
+    recorder = PlanRecorder()
+    for avrae in accounts.values():
+        avrae.planner = recorder
+    try:
+        sync(accounts, parser, modified_paths, config.max_workers, create_preflight(config))
+    finally:
+        close_clients(accounts)
+
+    update_plan = Plan(recorder.operations, config.max_workers * len(accounts))
+    update_plan.save(config.plan_file)
+    summary = update_plan.summary()
+    requests = ", ".join(f"{count} {method}" for method, count in sorted(summary["requests"].items())) or "none"
+    logger.info(f"Plan saved to {config.plan_file.as_posix()}")
+    logger.info(f"Requests: {requests}")
+    logger.info(f"Upload size: {summary['upload_bytes']} bytes")
+    logger.info(f"Estimated duration with {config.max_workers} worker(s): {summary['estimated_seconds']}s")
+
+
+def apply() -> None:
+    """Execute a plan saved by `plan` without recomputing it."""
+    from api import close_clients, create_clients
+    from plan import Plan
+
+    logger.info("Starting Avrae Auto-Updater in apply mode!")
+    config = Config()
+    config.load_config(require_modified_files=False)
+    saved_plan = Plan.load(config.plan_file)
+    logger.info(f"Applying {len(saved_plan.operations)} planned request(s) from {config.plan_file.as_posix()}")
+    accounts = create_clients(config, {operation.token_alias for operation in saved_plan.operations})
+    try:
+        if accounts:
+            next(iter(accounts.values())).apply_plan(saved_plan, accounts)
+    finally:
+        close_clients(accounts)
+
+
+def lock() -> None:
+    """Write the lockfile from every configured collection, for committing next to collections.json."""
+    from api import close_clients, create_clients
+    from lockfile import LockFile
+
+    logger.info("Starting Avrae Auto-Updater in lock mode!")
+    config = Config()
+    config.load_config(require_modified_files=False)
+    parser = load_parser(config)
+    parser.lock = LockFile(config.lock_file)
+    accounts = create_clients(config, parser.used_token_aliases())
+    try:
+        for path, collection_id in parser.collections.items():
+            avrae = accounts[parser.token_alias(path)]
+            avrae.lock = parser.lock
+            avrae.parse_collection(collection_id, parser)
+    finally:
+        close_clients(accounts)
+    parser.lock.save()
+
+
+def status() -> None:
+    """Report which local files differ from what Avrae last held, without any network access."""
+    from time import monotonic
+
+    from gvarbuild import GvarBuildError, build_gvar
+    from minify import CodeBuilder
+    from normalize import Normalizer
+    from state import StateStore, find_drift
+    from versions import content_hash
+
+    started = monotonic()
+    config = Config()
+    config.load_config(require_modified_files=False, require_token=False)
+    if config.state_db is None:
+        logger.error("No remote state is recorded. Set INPUT_STATE_DB for runs and for `status`.")
+        exit(1)
+    parser = load_parser(config)
+    normalize = Normalizer(config.normalization)
+    builder = CodeBuilder(config.cache_dir / "build") if config.minify else None
+    # GVARs whose source cannot be built, and why; they are reported instead of compared
+    broken: Dict[Path, str] = {}
+
+    def local_hash(path, kind: str) -> str:
+        with open(path, "r", encoding="utf-8", errors="replace", newline="") as fp:
+            text = fp.read()
+        if kind in ("alias", "snippet"):
+            # compare what would be uploaded, exactly as `run` builds it
+            if parser.includes is not None:
+                text = parser.includes.expand(path, text)
+            if builder is not None:
+                text = builder.build(path, normalize(text))
+        elif kind == "gvar" and config.gvar_build:
+            gvar_id = parser.gvars[path]
+            try:
+                text = build_gvar(normalize(text), gvar_id, parser.gvar_shards.get(path, ()))[gvar_id]
+            except GvarBuildError as exc:
+                broken[path] = f"could not build GVAR {gvar_id}: {exc}"
+                # nothing that could be uploaded matches the remote value
+                return ""
+        return content_hash(normalize(text))
+
+    store = StateStore(config.state_db)
+    drift = find_drift(store, list(parser.collections), list(parser.gvars), local_hash)
+    store.close()
+    for change in drift:
+        if change.path in broken:
+            logger.error(f"{'broken':>9}: {change.path.as_posix()}: {broken[change.path]}")
+        else:
+            logger.info(f"{change.state:>9}: {change.path.as_posix()}")
+    logger.info(f"{len(drift)} file(s) differ from the last known remote state ({monotonic() - started:.3f}s).")
+    if broken:
+        logger.error(f"{len(broken)} GVAR(s) could not be built and would be rejected by a run.")
+        exit(1)
+
+
+def watch() -> None:
+    """Run as a local daemon, pushing saved files as soon as they change."""
+    from watch import WatchSession
+
+    logger.info("Starting Avrae Auto-Updater in watch mode!")
+    config = Config()
+    config.load_config(require_modified_files=False)
+    pool = create_check_pool(config)
+    sync_changes = partial(sync, max_workers=config.max_workers, preflight=create_preflight(config, pool))
+    WatchSession(config, sync_changes).serve_forever()
+
+
+def serve() -> None:
+    """Run as a long-lived service, updating every configured repository on its push webhooks."""
+    from server import RepoWorkspace, UpdateServer, repo_config
+
+    logger.info("Starting Avrae Auto-Updater in service mode!")
+    config = Config()
+    config.load_config(require_modified_files=False, require_maps=False)
+    config.load_server_config()
+    # shared by every repository and made before the server's worker threads exist
+    pool = create_check_pool(config)
+    workspaces = {}
+    for name, root in config.server_repos.items():
+        repo = repo_config(config, root)
+        sync_changes = partial(sync, max_workers=config.max_workers, preflight=create_preflight(repo, pool))
+        workspaces[name] = RepoWorkspace(name, root, repo, sync_changes, config.server_checkout)
+        logger.info(f"Serving {name} from {root.as_posix()}")
+    UpdateServer(workspaces, config.server_workers, config.webhook_secret, config.server_branch).serve_forever(
+        config.server_host, config.server_port
+    )
 
-    # step four: update workshop
-    avrae = Avrae(config)
-    update_collections(avrae, parser, modified_paths)
 
-    # Step Five: Update GVARs
-    api_logger.info("Checking GVARs...")
-    for gvar_path, gvar_id in parser.gvars.items():
-        if gvar_path in modified_paths:
-            avrae.check_and_maybe_update_gvar(gvar_path, gvar_id)
+ENTRY_POINTS = {
+    "run": run,
+    "watch": watch,
+    "plan": plan,
+    "apply": apply,
+    "lock": lock,
+    "status": status,
+    "serve": serve,
+}
 
 
 if __name__ == "__main__":
     setup_logging()
-    run()
+    entry_point = sys.argv[1] if len(sys.argv) > 1 else "run"
+    if entry_point not in ENTRY_POINTS:
+        logger.error(f"Unknown command {entry_point!r}. Expected one of: {', '.join(ENTRY_POINTS)}")
+        exit(2)
+    ENTRY_POINTS[entry_point]()
@@ -0,0 +1,123 @@
+####
+# Alias and snippet minification
+###
+
+import ast
+import hashlib
+import io
+import logging
+import re
+import threading
+import tokenize
+from pathlib import Path
+
+logger = logging.getLogger("minify")
+
+# bump when the output changes so cached artifacts are rebuilt
+MINIFY_VERSION = 2
+
+_DRAC2_BLOCK = re.compile(r"(<drac2>)(.*?)(</drac2>)", re.DOTALL)
+_ARGUMENT_PLACEHOLDER = re.compile(r"&(?:\d+|\*|ARGS)&|%(?:\d+|\*)%")
+_SKIPPED_TOKENS = (tokenize.NL, tokenize.NEWLINE, tokenize.COMMENT, tokenize.INDENT, tokenize.DEDENT)
+
+
+def _syntax_tree(code: str) -> str:
+    return ast.dump(ast.parse(_ARGUMENT_PLACEHOLDER.sub("_", code)))
+
+
+def _minify_block(code: str) -> str:
+    """Drop comments and blank lines and indent one space per level, keeping string contents intact."""
+    lines = code.split("\n")
+    verbatim: set[int] = set()
+    comment_columns: dict[int, int] = {}
+    logical_depths: dict[int, int] = {}
+    depth = 0
+    at_line_start = True
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        if token.type == tokenize.INDENT:
+            depth += 1
+        elif token.type == tokenize.DEDENT:
+            depth -= 1
+        elif token.type == tokenize.NEWLINE:
+            at_line_start = True
+        elif token.type == tokenize.COMMENT:
+            comment_columns[token.start[0]] = token.start[1]
+        elif token.type not in _SKIPPED_TOKENS and token.type != tokenize.ENDMARKER:
+            if at_line_start:
+                logical_depths[token.start[0]] = depth
+                at_line_start = False
+            # the inside of multi-line strings is never touched
+            verbatim.update(range(token.start[0] + 1, token.end[0] + 1))
+
+    output: list[str] = []
+    for row, line in enumerate(lines, start=1):
+        line = line[: comment_columns[row]] if row in comment_columns else line
+        if row in verbatim:
+            output.append(line.rstrip() if row in comment_columns else line)
+            continue
+        line = line.strip()
+        if line:
+            output.append(" " * logical_depths.get(row, 0) + line)
+    return "\n".join(output)
+
+
+def minify_code(text: str) -> str:
+    """Minify every draconic block of an alias or snippet; blocks that cannot be minified safely are kept as is."""
+
+    def replace(match: re.Match) -> str:
+        code = match.group(2)
+        try:
+            minified = _minify_block(code)
+            if _syntax_tree(minified) != _syntax_tree(code):
+                return match.group(0)
+        except (SyntaxError, tokenize.TokenError, ValueError):
+            return match.group(0)
+        return match.group(1) + minified + match.group(3)
+
+    return _DRAC2_BLOCK.sub(replace, text)
+
+
+def savings_by_collection(
+    savings: dict[Path, tuple[int, int]], collections: dict[Path, str]
+) -> dict[str, tuple[int, int]]:
+    """Sum (source bytes, built bytes) of built files per collection id."""
+    totals: dict[str, tuple[int, int]] = {}
+    for path, (source_bytes, built_bytes) in savings.items():
+        for collection_path, collection_id in collections.items():
+            if collection_path in path.parents:
+                source_total, built_total = totals.get(collection_id, (0, 0))
+                totals[collection_id] = (source_total + source_bytes, built_total + built_bytes)
+                break
+    return totals
+
+
+class CodeBuilder:
+    """Builds the deployed form of alias and snippet code, caching artifacts by source hash."""
+
+    def __init__(self, cache_dir: Path | None = None):
+        self.cache_dir = cache_dir
+        # (source bytes, built bytes) per file built this run
+        self.savings: dict[Path, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def _artifact_path(self, source: bytes) -> Path | None:
+        if self.cache_dir is None:
+            return None
+        digest = hashlib.sha256(f"{MINIFY_VERSION}\0".encode("utf-8") + source).hexdigest()
+        return self.cache_dir / f"{digest}.min"
+
+    def build(self, path: Path, source: str) -> str:
+        source_bytes = source.encode("utf-8")
+        artifact = self._artifact_path(source_bytes)
+        if artifact is not None and artifact.is_file():
+            built = artifact.read_bytes().decode("utf-8")
+        else:
+            built = minify_code(source)
+            if artifact is not None:
+                artifact.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = artifact.with_suffix(f".{threading.get_ident()}.tmp")
+                tmp_path.write_bytes(built.encode("utf-8"))
+                tmp_path.replace(artifact)
+        with self._lock:
+            self.savings[path] = (len(source_bytes), len(built.encode("utf-8")))
+        return built
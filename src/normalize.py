@@ -0,0 +1,50 @@
+####
+# Content canonicalization
+###
+
+import re
+from collections.abc import Iterable
+
+NORMALIZATION_RULES = ("eol", "bom", "final_newline", "trailing_whitespace")
+DEFAULT_NORMALIZATION = ("eol", "bom", "final_newline")
+
+_TRAILING_WHITESPACE = re.compile(r"[ \t]+$", re.MULTILINE)
+
+
+class Normalizer:
+    """Canonicalizes text so that encoding-only differences never trigger an upload.
+
+    Rules:
+    - eol: convert CRLF and lone CR line endings to LF
+    - bom: drop a leading UTF-8 byte order mark
+    - final_newline: drop trailing newlines at the end of the file
+    - trailing_whitespace: drop spaces and tabs at the end of every line
+    """
+
+    def __init__(self, rules: Iterable[str] = DEFAULT_NORMALIZATION):
+        self.rules = frozenset(rules)
+        unknown = self.rules - set(NORMALIZATION_RULES)
+        if unknown:
+            raise ValueError(
+                f"Unknown normalization rule(s): {', '.join(sorted(unknown))}. "
+                f"Expected any of: {', '.join(NORMALIZATION_RULES)}"
+            )
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "Normalizer":
+        """Build from a comma separated rule list; `none` disables normalization."""
+        rules = [rule.strip().lower() for rule in spec.split(",") if rule.strip()]
+        if rules == ["none"]:
+            return cls(())
+        return cls(rules)
+
+    def __call__(self, text: str) -> str:
+        if "bom" in self.rules and text.startswith("\ufeff"):
+            text = text[1:]
+        if "eol" in self.rules:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        if "trailing_whitespace" in self.rules:
+            text = _TRAILING_WHITESPACE.sub("", text)
+        if "final_newline" in self.rules:
+            text = text.rstrip("\r\n")
+        return text
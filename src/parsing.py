@@ -1,10 +1,17 @@
 # Class that handles a majority of the file logic
+import logging
 from dataclasses import dataclass
 from json import load
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from config import Config
+from includes import FRAGMENT_SUFFIX, IncludeGraph
+from lockfile import LockFile
+
+logger = logging.getLogger("parser")
+
+DEFAULT_TOKEN_ALIAS = "default"
 
 
 @dataclass(frozen=True, slots=True)
@@ -18,12 +25,43 @@ class ConnectedFile:
 
 
 class Parser:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, base_dir: Optional[Path] = None):
         self.config = config
+        # map entries are relative to this directory instead of the working directory when set
+        self.base_dir = base_dir
         self.collections: Dict[Path, str] = {}
         self.gvars: Dict[Path, str] = {}
+        # entries that name a non-default Avrae account
+        self.token_aliases: Dict[Path, str] = {}
+        # extra GVAR ids a built GVAR may split its data across
+        self.gvar_shards: Dict[Path, Tuple[str, ...]] = {}
+        # set when include directives are enabled
+        self.includes: Optional[IncludeGraph] = None
+        # set when a committed lockfile is present
+        self.lock: Optional[LockFile] = None
         self.connected_files: List[ConnectedFile] = []
 
+    def _add_entry(self, mapping: Dict[Path, str], path: str, value, label: str) -> None:
+        """Accept either a bare id or an {"id": ..., "token": ...} object."""
+        if isinstance(value, dict):
+            if not isinstance(value.get("id"), str):
+                raise ValueError(f"{label} entry for {path} must have a string 'id'.")
+            mapping[self._entry_path(path)] = value["id"]
+            if isinstance(value.get("token"), str):
+                self.token_aliases[self._entry_path(path)] = value["token"]
+        else:
+            mapping[self._entry_path(path)] = value
+
+    def _entry_path(self, path: str) -> Path:
+        return self.base_dir / path if self.base_dir is not None else Path(path)
+
+    def token_alias(self, path: Path) -> str:
+        """The token alias whose account owns a configured collection or GVAR path."""
+        return self.token_aliases.get(path, DEFAULT_TOKEN_ALIAS)
+
+    def used_token_aliases(self) -> List[str]:
+        return sorted({self.token_alias(path) for path in self.source_roots()})
+
     def load_collections(self):
         if self.config.collections_file_path is None:
             raise ValueError("Collection file path is not configured.")
@@ -33,7 +71,7 @@ class Parser:
         with open(collections_path, "r") as fp:
             collections = load(fp)
         for k, v in collections.items():
-            self.collections[Path(k)] = v
+            self._add_entry(self.collections, k, v, "Collection")
 
     def load_gvars(self):
         if self.config.gvars_file_path is None:
@@ -44,30 +82,90 @@ class Parser:
         with open(gvars_path, "r") as fp:
             gvars = load(fp)
         for k, v in gvars.items():
-            self.gvars[Path(k)] = v
+            self._add_entry(self.gvars, k, v, "GVAR")
+            if isinstance(v, dict) and "shards" in v:
+                shards = v["shards"]
+                if not isinstance(shards, list) or not all(isinstance(shard, str) for shard in shards):
+                    raise ValueError(f"GVAR entry for {k} must list its 'shards' as string ids.")
+                self.gvar_shards[self._entry_path(k)] = tuple(shards)
+
+    def load_includes(self):
+        cache_dir = Path(getattr(self.config, "cache_dir", ".avrae-cache"))
+        self.includes = IncludeGraph.load(cache_dir / "includes.json", self.collections.keys(), self.base_dir)
 
-    def find_connected_files(self, modified_files: List[Path]):
+    def load_lock(self):
+        lock_path = Path(getattr(self.config, "lock_file", "avrae-lock.json"))
+        if lock_path.is_file():
+            self.lock = LockFile.load(lock_path, self.base_dir)
+
+    def source_roots(self) -> List[Path]:
+        """Every configured collection directory and GVAR file."""
+        return list(self.collections.keys()) + list(self.gvars.keys())
+
+    def find_duplicate_targets(self) -> List[Tuple[str, str, List[Path]]]:
+        """List (kind, id, paths) for every collection or GVAR id mapped from more than one path."""
+        duplicates = []
+        for kind, mapping in (("collection", self.collections), ("gvar", self.gvars)):
+            paths_by_id: Dict[str, List[Path]] = {}
+            for path, _id in mapping.items():
+                paths_by_id.setdefault(_id, []).append(path)
+            for _id, paths in paths_by_id.items():
+                if len(paths) > 1:
+                    duplicates.append((kind, _id, paths))
+        return duplicates
+
+    def _connect_file(self, file: Path) -> Optional[ConnectedFile]:
+        file_type = str(file).rsplit(".", 1)[1]
+        if str(file).endswith(".gvar"):
+            if file in self.gvars.keys():
+                return ConnectedFile("gvar", file, None, None)
+            return None
+        for path, _id in self.collections.items():
+            file_parents = list(file.parents)[:-2]  # we remove the base directory and `.`
+            if path in file_parents:
+                # we found our collection for this file.
+                # Let's connect them
+                return ConnectedFile(
+                    file_type,
+                    file,
+                    {"id": _id, "path": path},
+                    file.relative_to(path),
+                )
+        return None
+
+    def find_connected_files(self, modified_files: Iterable[Path]):
         connected_files = []
+        seen = set()
         # first handle aliases, snippets, and docs.
         # next, handle GVARS.
         for file in modified_files:
-            file_type = str(file).rsplit(".", 1)[1]
-            if str(file).endswith(".gvar"):
-                if file in self.gvars.keys():
-                    connected_files.append(ConnectedFile("gvar", file, None, None))
-                continue
-            for path, _id in self.collections.items():
-                file_parents = list(file.parents)[:-2]  # we remove the base directory and `.`
-                if path in file_parents:
-                    # we found our collection for this file.
-                    # Let's connect them
-                    connected = ConnectedFile(
-                        file_type,
-                        file,
-                        {"id": _id, "path": path},
-                        file.relative_to(path),
-                    )
+            # a changed fragment stands for every alias and snippet that includes it
+            candidates = self.includes.dependents(file) if self.includes is not None else []
+            if file.suffix != FRAGMENT_SUFFIX:
+                candidates.append(file)
+            for candidate in candidates:
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                connected = self._connect_file(candidate)
+                if connected is not None:
                     connected_files.append(connected)
-                    break
 
         self.connected_files = connected_files
+
+
+def load_parser(config: Config, base_dir: Optional[Path] = None) -> Parser:
+    """Load the collection and GVAR maps, warning about ids mapped from several paths."""
+    logger.info("Loading data from configuration files...")
+    parser = Parser(config, base_dir)
+    parser.load_collections()
+    parser.load_gvars()
+    if config.includes:
+        parser.load_includes()
+    parser.load_lock()
+    for kind, target_id, paths in parser.find_duplicate_targets():
+        logger.warning(
+            f"{kind.capitalize()} {target_id} is mapped from {len(paths)} paths: "
+            f"{', '.join(path.as_posix() for path in paths)}. It will only be fetched once."
+        )
+    return parser
@@ -0,0 +1,95 @@
+####
+# Byte-bounded payload cache
+###
+
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+logger = logging.getLogger("payloadcache")
+
+DEFAULT_PAYLOAD_CACHE_MB = 128
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate the memory held by a decoded JSON payload, counting objects shared within it once."""
+    seen = set()
+    total = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__slots__") and not isinstance(item, (str, bytes, int, float)):
+            # parsed aliases and snippets are slotted dataclasses around the payload
+            stack.extend(getattr(item, slot) for slot in item.__slots__ if hasattr(item, slot))
+    return total
+
+
+class PayloadCache:
+    """LRU cache of decoded API payloads that evicts the least recently used entries past a byte budget."""
+
+    def __init__(self, max_bytes: int = DEFAULT_PAYLOAD_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = estimate_size(value)
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                # never worth flushing the whole cache for one payload
+                logger.debug(f"Not caching {key}: {size} bytes exceeds the {self.max_bytes} byte budget")
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def summary(self) -> str:
+        with self._lock:
+            return (
+                f"{self.hits} hit(s), {self.misses} miss(es), {self.evictions} eviction(s), "
+                f"{len(self._entries)} payload(s) using {self.size / (1024 * 1024):.1f} of "
+                f"{self.max_bytes / (1024 * 1024):.0f} MB"
+            )
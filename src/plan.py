@@ -0,0 +1,114 @@
+####
+# Dry-run plans
+###
+
+import heapq
+import json
+import logging
+import threading
+from collections import Counter
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger("plan")
+
+PLANNED_VERSION = "$planned_version"
+DEFAULT_REQUEST_LATENCY = 0.3
+
+
+@dataclass(frozen=True, slots=True)
+class PlannedOperation:
+    """One write request a run would issue, in the order it would be issued."""
+
+    method: str
+    path: str
+    request_data: dict[str, Any]
+    expect: str
+    depends_on: int | None = None
+    token_alias: str = "default"
+
+    @property
+    def upload_bytes(self) -> int:
+        return len(json.dumps(self.request_data).encode("utf-8"))
+
+
+def _planned_version_source(request_data: dict[str, Any]) -> int | None:
+    version = request_data.get("version")
+    if isinstance(version, dict) and PLANNED_VERSION in version:
+        return version[PLANNED_VERSION]
+    return None
+
+
+class PlanRecorder:
+    """Stands in for write requests during a dry run, recording them and answering as Avrae would."""
+
+    def __init__(self):
+        self.operations: list[PlannedOperation] = []
+        self._lock = threading.Lock()
+
+    def record(
+        self, method: str, path: str, request_data: dict[str, Any], expect: str, token_alias: str = "default"
+    ) -> Any:
+        with self._lock:
+            index = len(self.operations)
+            self.operations.append(
+                PlannedOperation(method, path, request_data, expect, _planned_version_source(request_data), token_alias)
+            )
+        if expect == "text":
+            return "Gvar updated."
+        # code POSTs answer with a placeholder version that the following active-code PUT refers back to
+        return {"success": True, "data": {"version": {PLANNED_VERSION: index}}}
+
+
+@dataclass
+class Plan:
+    operations: list[PlannedOperation]
+    max_workers: int = 1
+
+    def chains(self) -> list[list[int]]:
+        """Group operations that must run back to back (a code POST and its active-code PUT)."""
+        chains: dict[int, list[int]] = {}
+        for index, operation in enumerate(self.operations):
+            root = operation.depends_on if operation.depends_on is not None else index
+            chains.setdefault(root, []).append(index)
+        return list(chains.values())
+
+    def estimated_duration(self, request_latency: float = DEFAULT_REQUEST_LATENCY) -> float:
+        """Longest-chain-first schedule of every chain across the configured workers."""
+        workers = [0.0] * max(1, self.max_workers)
+        for chain in sorted(self.chains(), key=len, reverse=True):
+            heapq.heapreplace(workers, workers[0] + len(chain) * request_latency)
+        return max(workers)
+
+    def summary(self, request_latency: float = DEFAULT_REQUEST_LATENCY) -> dict[str, Any]:
+        return {
+            "requests": dict(Counter(operation.method.upper() for operation in self.operations)),
+            "total_requests": len(self.operations),
+            "upload_bytes": sum(operation.upload_bytes for operation in self.operations),
+            "max_workers": self.max_workers,
+            "estimated_seconds": round(self.estimated_duration(request_latency), 3),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "max_workers": self.max_workers,
+                "summary": self.summary(),
+                "operations": [asdict(operation) for operation in self.operations],
+            },
+            indent=2,
+        )
+
+    @classmethod
+    def from_json(cls, raw: str) -> "Plan":
+        data = json.loads(raw)
+        return cls([PlannedOperation(**operation) for operation in data["operations"]], data.get("max_workers", 1))
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.to_json(), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> "Plan":
+        return cls.from_json(path.read_text(encoding="utf-8"))
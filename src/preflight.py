@@ -0,0 +1,230 @@
+####
+# Local upload validation
+###
+
+import ast
+import hashlib
+import json
+import logging
+import multiprocessing
+import re
+import textwrap
+from collections.abc import Iterable, Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from time import monotonic
+
+from gvarbuild import MAX_GVAR_LENGTH, GvarBuildError, build_gvar
+from includes import IncludeError, IncludeGraph
+from minify import minify_code
+from normalize import DEFAULT_NORMALIZATION, Normalizer
+
+logger = logging.getLogger("preflight")
+
+# bump when the checks change so cached verdicts are recomputed
+PREFLIGHT_VERSION = 4
+# Avrae rejects workshop code and GVAR values longer than this many characters
+MAX_CODE_LENGTH = 100_000
+MAX_CACHE_ENTRIES = 10_000
+
+_DRAC2_BLOCK = re.compile(r"<drac2>(.*?)</drac2>", re.DOTALL)
+# argument placeholders are substituted by Avrae before the code is parsed
+_ARGUMENT_PLACEHOLDER = re.compile(r"&(?:\d+|\*|ARGS)&|%(?:\d+|\*)%")
+
+
+class PreflightError(Exception):
+    """Raised when pending uploads would be rejected by Avrae, before any request is sent."""
+
+    pass
+
+
+def upload_kind(path: Path) -> str | None:
+    """Which kind of upload a modified file turns into."""
+    if path.suffix in (".alias", ".snippet"):
+        return "code"
+    if path.suffix == ".md":
+        return "docs"
+    if path.suffix == ".gvar":
+        return "gvar"
+    return None
+
+
+def _check_drac2_blocks(code: str) -> list[str]:
+    problems = []
+    for match in _DRAC2_BLOCK.finditer(code):
+        block = textwrap.dedent(_ARGUMENT_PLACEHOLDER.sub("_", match.group(1)))
+        try:
+            ast.parse(block)
+        except SyntaxError as exc:
+            line = code.count("\n", 0, match.start(1)) + (exc.lineno or 1)
+            problems.append(f"line {line}: draconic syntax error: {exc.msg}")
+    return problems
+
+
+def check_upload(
+    kind: str, raw: bytes, normalize: Normalizer, minify: bool = False, gvar_shards: int | None = None
+) -> list[str]:
+    """Every reason Avrae would reject this file's upload; empty when it looks fine.
+
+    `gvar_shards` is the number of shard GVARs of a built GVAR, or None when GVARs are uploaded as written.
+    """
+    try:
+        text = normalize(raw.decode("utf-8"))
+    except UnicodeDecodeError as exc:
+        return [f"not valid UTF-8 (byte {exc.start})"]
+    if minify and kind == "code":
+        # the size limit applies to what is deployed
+        text = minify_code(text)
+    if gvar_shards is not None and kind == "gvar":
+        try:
+            # shards always fit, so only an unsharded value or the index can be too long
+            text = build_gvar(text, "index", [f"shard-{index}" for index in range(gvar_shards)])["index"]
+        except GvarBuildError as exc:
+            return [str(exc)]
+    problems = []
+    limit = MAX_GVAR_LENGTH if kind == "gvar" else MAX_CODE_LENGTH if kind == "code" else None
+    if limit is not None and len(text) > limit:
+        problems.append(f"{len(text)} characters, over Avrae's limit of {limit}")
+    if kind == "code":
+        problems.extend(_check_drac2_blocks(text))
+    return problems
+
+
+def create_check_pool(max_workers: int) -> ProcessPoolExecutor | None:
+    """A process pool for checks, or None to check inline.
+
+    Its workers are started by a fork server or spawned, never forked from a process that may be running threads.
+    """
+    if max_workers <= 1:
+        return None
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(start_method))
+
+
+class PreflightChecker:
+    """Validates pending uploads across a process pool, remembering verdicts by content hash."""
+
+    def __init__(
+        self,
+        cache_path: Path | None = None,
+        normalize: Normalizer | None = None,
+        max_workers: int = 1,
+        minify: bool = False,
+        gvar_build: bool = False,
+        pool: ProcessPoolExecutor | None = None,
+    ):
+        self.cache_path = cache_path
+        self.normalize = normalize or Normalizer(DEFAULT_NORMALIZATION)
+        self.max_workers = max_workers
+        self.minify = minify
+        self.gvar_build = gvar_build
+        # created once by the caller and shared; checks run inline without one
+        self.pool = pool
+        self._verdicts: dict[str, list[str]] = self._load_cache()
+        self._dirty = False
+
+    @classmethod
+    def from_config(cls, config, pool: ProcessPoolExecutor | None = None) -> "PreflightChecker":
+        return cls(
+            Path(config.cache_dir) / "preflight.json",
+            Normalizer(getattr(config, "normalization", DEFAULT_NORMALIZATION)),
+            config.max_workers,
+            getattr(config, "minify", False),
+            getattr(config, "gvar_build", False),
+            pool,
+        )
+
+    def _load_cache(self) -> dict[str, list[str]]:
+        if self.cache_path is None or not self.cache_path.is_file():
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as fp:
+                verdicts = json.load(fp)
+        except (OSError, json.JSONDecodeError) as exc:
+            logger.warning(f"Ignoring unreadable preflight cache at {self.cache_path.as_posix()}: {exc}")
+            return {}
+        return verdicts if isinstance(verdicts, dict) else {}
+
+    def _digest(self, kind: str, raw: bytes, shards: int | None) -> str:
+        rules = ",".join(sorted(self.normalize.rules))
+        header = f"{PREFLIGHT_VERSION}\0{kind}\0{rules}\0{self.minify}\0{shards}\0"
+        return hashlib.sha256(header.encode("utf-8") + raw).hexdigest()
+
+    def _run_checks(self, pending: list[tuple[str, str, bytes, int | None]]) -> list[list[str]]:
+        kinds = [kind for _, kind, _, _ in pending]
+        contents = [raw for _, _, raw, _ in pending]
+        normalizers = [self.normalize] * len(pending)
+        minify = [self.minify] * len(pending)
+        shards = [shard_count for _, _, _, shard_count in pending]
+        if self.pool is None or len(pending) <= 1:
+            return list(map(check_upload, kinds, contents, normalizers, minify, shards))
+        chunksize = max(1, len(pending) // (self.max_workers * 4))
+        return list(self.pool.map(check_upload, kinds, contents, normalizers, minify, shards, chunksize=chunksize))
+
+    def check(
+        self,
+        paths: Iterable[Path],
+        includes: IncludeGraph | None = None,
+        gvar_shards: Mapping[Path, Sequence[str]] | None = None,
+    ) -> None:
+        """Raise PreflightError listing every problem in the given files; unchanged files are not re-checked."""
+        started = monotonic()
+        problems: dict[Path, list[str]] = {}
+        pending: list[tuple[str, str, bytes, int | None]] = []
+        pending_paths: dict[str, list[Path]] = {}
+        checked = 0
+        for path in sorted(paths):
+            kind = upload_kind(path)
+            if kind is None or not path.is_file():
+                continue
+            checked += 1
+            raw = path.read_bytes()
+            if includes is not None and kind == "code":
+                # check what will be deployed, fragments included
+                try:
+                    raw = includes.expand(path, raw.decode("utf-8")).encode("utf-8")
+                except UnicodeDecodeError:
+                    pass
+                except IncludeError as exc:
+                    problems[path] = [str(exc)]
+                    continue
+            shards = len((gvar_shards or {}).get(path, ())) if self.gvar_build and kind == "gvar" else None
+            digest = self._digest(kind, raw, shards)
+            if digest in self._verdicts:
+                if self._verdicts[digest]:
+                    problems[path] = self._verdicts[digest]
+                continue
+            if digest not in pending_paths:
+                pending.append((digest, kind, raw, shards))
+            pending_paths.setdefault(digest, []).append(path)
+
+        for (digest, _, _, _), verdict in zip(pending, self._run_checks(pending)):
+            self._verdicts[digest] = verdict
+            self._dirty = True
+            for path in pending_paths[digest]:
+                if verdict:
+                    problems[path] = verdict
+        logger.info(
+            f"Preflight checked {checked} file(s) ({checked - sum(map(len, pending_paths.values()))} cached) "
+            f"in {(monotonic() - started) * 1000:.0f}ms"
+        )
+        self.save()
+        if problems:
+            details = "\n".join(
+                f"  {path.as_posix()}: {problem}"
+                for path, path_problems in sorted(problems.items())
+                for problem in path_problems
+            )
+            raise PreflightError(f"{len(problems)} file(s) would be rejected by Avrae:\n{details}")
+
+    def save(self) -> None:
+        if self.cache_path is None or not self._dirty:
+            return
+        # oldest verdicts go first
+        verdicts = dict(list(self._verdicts.items())[-MAX_CACHE_ENTRIES:])
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump(verdicts, fp)
+        tmp_path.replace(self.cache_path)
+        self._dirty = False
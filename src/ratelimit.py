@@ -0,0 +1,90 @@
+####
+# Request rate limiting
+###
+
+import hashlib
+import json
+import threading
+from pathlib import Path
+from time import monotonic, sleep, time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+NO_FCNTL = "Sharing a rate limit between processes needs fcntl, which this platform lacks."
+
+
+def _lock_exclusive(fp) -> None:
+    """Block until this process holds an exclusive lock on the open file; closing the file releases it."""
+    if fcntl is None:
+        raise RuntimeError(NO_FCNTL)
+    fcntl.flock(fp, fcntl.LOCK_EX)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second on average, bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        if rate <= 0:
+            raise ValueError("Rate limit must be positive.")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take one token, returning how long the caller must wait before using it."""
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        wait_seconds = self._reserve()
+        if wait_seconds > 0:
+            sleep(wait_seconds)
+
+
+class SharedTokenBucket(TokenBucket):
+    """Token bucket kept in a locked file, so every process on the host shares one budget, served in lock order."""
+
+    def __init__(self, path: Path, rate: float, burst: float | None = None):
+        super().__init__(rate, burst)
+        if fcntl is None:
+            raise RuntimeError(NO_FCNTL)
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def for_token(cls, directory: Path, token: str, rate: float) -> "SharedTokenBucket":
+        """One state file per account, named by a hash so the token itself never touches the disk."""
+        digest = hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+        return cls(directory / f"{digest}.bucket", rate)
+
+    def _reserve(self) -> float:
+        # each call opens its own file description, so the lock also separates threads of this process
+        with open(self.path, "a+", encoding="utf-8") as fp:
+            _lock_exclusive(fp)
+            fp.seek(0)
+            try:
+                state = json.loads(fp.read() or "{}")
+                tokens, updated = float(state["tokens"]), float(state["updated"])
+            except (ValueError, KeyError, TypeError):
+                tokens, updated = self.burst, time()
+            # wall time, since monotonic clocks are not comparable across processes; never refill backwards
+            now = time()
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate) - 1
+            fp.seek(0)
+            fp.truncate()
+            json.dump({"tokens": tokens, "updated": max(now, updated)}, fp)
+            fp.flush()
+        if tokens >= 0:
+            return 0.0
+        return -tokens / self.rate
@@ -0,0 +1,157 @@
+####
+# Dependency-aware update scheduling
+###
+
+import heapq
+import logging
+import re
+from collections.abc import Callable, Iterable, Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from statistics import median
+from time import monotonic
+
+logger = logging.getLogger("scheduler")
+
+
+@dataclass(frozen=True, slots=True)
+class UpdateJob:
+    """One remote update and the keys of the jobs that must finish before it."""
+
+    key: str
+    kind: str
+    path: Path
+    target_id: str
+    action: Callable[[], int]
+    depends_on: frozenset[str] = field(default_factory=frozenset)
+
+
+class SchedulingError(Exception):
+    """Raised when update jobs cannot be ordered, e.g. because of a cycle."""
+
+    pass
+
+
+def find_gvar_references(code: str, gvar_ids: Iterable[str]) -> set[str]:
+    """Return the GVAR ids that appear as quoted literals in alias or snippet code."""
+    return {gvar_id for gvar_id in gvar_ids if re.search(rf"[\"']{re.escape(gvar_id)}[\"']", code)}
+
+
+def link_gvar_dependencies(jobs: list[UpdateJob], read_code: Callable[[Path], str]) -> list[UpdateJob]:
+    """Make each code job depend on the GVAR jobs whose ids its local code loads."""
+    gvar_jobs: dict[str, set[str]] = {}
+    for job in jobs:
+        if job.kind == "gvar":
+            gvar_jobs.setdefault(job.target_id, set()).add(job.key)
+    if not gvar_jobs:
+        return jobs
+
+    linked = []
+    for job in jobs:
+        if job.kind == "code":
+            references = find_gvar_references(read_code(job.path), gvar_jobs.keys())
+            if references:
+                logger.info(
+                    f"{job.path.as_posix()} loads GVAR(s) {', '.join(sorted(references))}; updating them first."
+                )
+                job = replace(job, depends_on=job.depends_on.union(*(gvar_jobs[ref] for ref in references)))
+        linked.append(job)
+    return linked
+
+
+def build_levels(jobs: Iterable[UpdateJob]) -> list[list[UpdateJob]]:
+    """Group jobs into levels so every job runs after all of its dependencies."""
+    pending: Mapping[str, UpdateJob] = {job.key: job for job in jobs}
+    done: set[str] = set()
+    levels: list[list[UpdateJob]] = []
+    remaining = dict(pending)
+    while remaining:
+        level = [job for job in remaining.values() if all(dep in done or dep not in pending for dep in job.depends_on)]
+        if not level:
+            raise SchedulingError(f"Dependency cycle between: {', '.join(sorted(remaining))}")
+        levels.append(level)
+        for job in level:
+            done.add(job.key)
+            del remaining[job.key]
+    return levels
+
+
+# lower runs first: users wait on code going live, GVAR data next, docs last
+KIND_PRIORITY = {"code": 0, "gvar": 1, "docs": 2}
+
+
+def file_cost(job: UpdateJob) -> int:
+    """Estimate a job's duration by the size of the file it uploads."""
+    try:
+        return job.path.stat().st_size
+    except OSError:
+        return 0
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_prioritized(
+    jobs: Iterable[UpdateJob], max_workers: int = 1, cost: Callable[[UpdateJob], int] = file_cost
+) -> dict[str, int]:
+    """Run every job once its dependencies finish, picking code before GVARs before docs, smallest first."""
+    jobs = list(jobs)
+    # fails fast on dependency cycles
+    build_levels(jobs)
+    pending: dict[str, UpdateJob] = {job.key: job for job in jobs}
+    waiting_on = {job.key: {dep for dep in job.depends_on if dep in pending} for job in jobs}
+    dependants: dict[str, list[str]] = {}
+    for key, deps in waiting_on.items():
+        for dep in deps:
+            dependants.setdefault(dep, []).append(key)
+    ready: list[tuple[int, int, int, str]] = []
+    order = {job.key: index for index, job in enumerate(jobs)}
+
+    def make_ready(key: str) -> None:
+        job = pending[key]
+        heapq.heappush(ready, (KIND_PRIORITY.get(job.kind, len(KIND_PRIORITY)), cost(job), order[key], key))
+
+    for key, deps in waiting_on.items():
+        if not deps:
+            make_ready(key)
+
+    results: dict[str, int] = {}
+    errors: list[BaseException] = []
+    code_live: list[float] = []
+    started = monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        running: dict[Future, UpdateJob] = {}
+        while ready or running:
+            # only hand the pool as many jobs as it can start, so later, more urgent jobs can still overtake
+            while ready and len(running) < max(1, max_workers) and not errors:
+                job = pending[heapq.heappop(ready)[3]]
+                running[pool.submit(job.action)] = job
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                exc = future.exception()
+                if exc is not None:
+                    # dependants must not go live against a failed dependency; nothing new is started
+                    logger.error(f"Update of {job.path.as_posix()} failed: {exc}")
+                    errors.append(exc)
+                    continue
+                results[job.key] = future.result()
+                if job.kind == "code" and results[job.key] == 0:
+                    code_live.append(monotonic() - started)
+                for key in dependants.get(job.key, []):
+                    waiting_on[key].discard(job.key)
+                    if not waiting_on[key]:
+                        make_ready(key)
+    if errors:
+        raise errors[0]
+    if code_live:
+        logger.info(
+            f"Time to live for {len(code_live)} code change(s): median {median(code_live):.2f}s, "
+            f"p90 {_percentile(code_live, 0.9):.2f}s, last {max(code_live):.2f}s"
+        )
+    return results
@@ -0,0 +1,322 @@
+####
+# Self-hosted service mode
+###
+
+import copy
+import hashlib
+import hmac
+import json
+import logging
+import threading
+from collections import deque
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+import gitdiff
+import utils as utils
+from api import Avrae, close_clients, create_clients
+from config import Config
+from parsing import Parser, load_parser
+
+logger = logging.getLogger("server")
+
+
+@dataclass(frozen=True, slots=True)
+class PushEvent:
+    """The parts of a GitHub push webhook the updater needs."""
+
+    repository: str
+    after: str | None
+    paths: frozenset
+    ref: str | None = None
+    default_branch: str | None = None
+    # a push that deleted its branch; `after` is then all zeros
+    deleted: bool = False
+
+
+def parse_push_event(payload: dict[str, Any]) -> PushEvent:
+    """Collect every added or modified path of a push; removed files have nothing to upload."""
+    try:
+        repository = payload["repository"]["full_name"]
+    except (KeyError, TypeError) as exc:
+        raise ValueError("Push payload has no repository.full_name") from exc
+    default_branch = payload["repository"].get("default_branch")
+    commits = payload.get("commits") or []
+    if not isinstance(commits, list):
+        raise ValueError("Push payload commits must be a list")
+    paths: set[str] = set()
+    # commits are listed oldest first, so a later removal cancels an earlier change
+    for commit in commits:
+        if not isinstance(commit, dict):
+            raise ValueError("Push payload commits must be objects")
+        changes = {key: commit.get(key) or [] for key in ("added", "modified", "removed")}
+        if not all(isinstance(listed, list) for listed in changes.values()):
+            raise ValueError("Push payload commits must list added, modified and removed paths")
+        paths.update(path for key in ("added", "modified") for path in changes[key] if isinstance(path, str))
+        paths.difference_update(path for path in changes["removed"] if isinstance(path, str))
+    after = payload.get("after")
+    after = after if isinstance(after, str) else None
+    ref = payload.get("ref")
+    deleted = payload.get("deleted") is True or (after is not None and after.strip("0") == "")
+    return PushEvent(
+        repository,
+        None if deleted else after,
+        frozenset(paths),
+        ref if isinstance(ref, str) else None,
+        default_branch if isinstance(default_branch, str) else None,
+        deleted,
+    )
+
+
+@dataclass
+class PendingJob:
+    """Everything pushed to one repository since a worker last picked it up."""
+
+    paths: set[str] = field(default_factory=set)
+    after: str | None = None
+    pushes: int = 0
+
+
+class JobQueue:
+    """Per-repository job queue; pushes to a repository that is waiting or running merge into one job."""
+
+    def __init__(self):
+        self._pending: dict[str, PendingJob] = {}
+        self._ready: deque[str] = deque()
+        self._running: set[str] = set()
+        # jobs whose sync failed, retried with the repository's next push
+        self._failed: dict[str, PendingJob] = {}
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def submit(self, event: PushEvent) -> bool:
+        """Queue a push; returns True when it was coalesced into a job that had not started yet."""
+        with self._condition:
+            job = self._pending.get(event.repository)
+            coalesced = job is not None
+            if job is None:
+                job = self._pending[event.repository] = self._failed.pop(event.repository, None) or PendingJob()
+                # a repository being worked on is re-queued when its worker is done
+                if event.repository not in self._running:
+                    self._ready.append(event.repository)
+                    self._condition.notify()
+            job.paths.update(event.paths)
+            job.after = event.after or job.after
+            job.pushes += 1
+            return coalesced
+
+    def take(self) -> tuple[str, PendingJob] | None:
+        """Block until a repository has work, or return None once the queue is closed."""
+        with self._condition:
+            while not self._ready and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return None
+            repository = self._ready.popleft()
+            self._running.add(repository)
+            return repository, self._pending.pop(repository)
+
+    def retry(self, repository: str, job: PendingJob) -> None:
+        """Keep a failed job's paths, so they are synced with the next push instead of being lost."""
+        with self._condition:
+            waiting = self._pending.get(repository) or self._failed.get(repository)
+            if waiting is None:
+                self._failed[repository] = job
+                return
+            waiting.paths.update(job.paths)
+            # the waiting job holds the newer push
+            waiting.after = waiting.after or job.after
+            waiting.pushes += job.pushes
+
+    def done(self, repository: str) -> None:
+        with self._condition:
+            self._running.discard(repository)
+            if repository in self._pending:
+                self._ready.append(repository)
+            self._condition.notify_all()
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._running, timeout)
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+def repo_config(config: Config, root: Path) -> Config:
+    """The server config with map files and caches resolved inside one repository checkout."""
+    repo = copy.copy(config)
+    repo.collections_file_path = str(root / str(config.collections_file_path))
+    repo.gvars_file_path = str(root / str(config.gvars_file_path))
+    repo.cache_dir = root / config.cache_dir
+    repo.lock_file = root / config.lock_file
+    repo.state_db = root / config.state_db if config.state_db is not None else None
+    return repo
+
+
+class RepoWorkspace:
+    """Keeps the parser, Avrae clients and collection payloads of one repository warm between jobs."""
+
+    def __init__(
+        self,
+        name: str,
+        root: Path,
+        config: Config,
+        sync: Callable[[Mapping[str, Avrae], Parser, set], dict[str, int]],
+        checkout: bool = True,
+    ):
+        self.name = name
+        self.root = root
+        self.config = config
+        self.sync = sync
+        self.checkout = checkout
+        self.parser = self._load_parser()
+        self.accounts: dict[str, Avrae] = create_clients(config, self.parser.used_token_aliases())
+
+    def _load_parser(self) -> Parser:
+        # paths are absolute, since workers for different repositories share one working directory
+        return load_parser(self.config, self.root)
+
+    @property
+    def map_files(self) -> list[str]:
+        return [
+            Path(str(path)).relative_to(self.root).as_posix()
+            for path in (self.config.collections_file_path, self.config.gvars_file_path)
+        ]
+
+    def process(self, job: PendingJob) -> None:
+        if self.checkout and job.after:
+            gitdiff.checkout(self.root, job.after)
+        if any(path in job.paths for path in self.map_files):
+            logger.info(f"[{self.name}] Configuration changed; reloading collection and GVAR maps.")
+            self.parser = self._load_parser()
+            new_aliases = set(self.parser.used_token_aliases()) - set(self.accounts)
+            self.accounts.update(create_clients(self.config, new_aliases))
+        self.parser.find_connected_files(self.root / path for path in utils.iter_paths(sorted(job.paths)))
+        modified_paths = set(x.path for x in self.parser.connected_files)
+        if not modified_paths:
+            logger.info(f"[{self.name}] No configured files changed in {job.pushes} push(es).")
+            return
+        self.sync(self.accounts, self.parser, modified_paths)
+        logger.info(f"[{self.name}] Synced {len(modified_paths)} file(s) from {job.pushes} push(es).")
+
+
+def verify_signature(secret: str, body: bytes, signature: str | None) -> bool:
+    """Check GitHub's `X-Hub-Signature-256` header."""
+    expected = "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return signature is not None and hmac.compare_digest(expected, signature)
+
+
+class UpdateServer:
+    """Accepts push webhooks and works through the queued repositories with a pool of workers."""
+
+    def __init__(
+        self,
+        workspaces: dict[str, RepoWorkspace],
+        workers: int = 2,
+        secret: str | None = None,
+        branch: str | None = None,
+    ):
+        self.workspaces = workspaces
+        self.secret = secret
+        # the branch deployed to Avrae; by default each repository's default branch
+        self.branch = branch
+        self.queue = JobQueue()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        self._http: ThreadingHTTPServer | None = None
+
+    def _work(self) -> None:
+        while True:
+            item = self.queue.take()
+            if item is None:
+                return
+            repository, job = item
+            try:
+                self.workspaces[repository].process(job)
+            except Exception:
+                logger.exception(f"[{repository}] Update failed; its files are retried with the next push")
+                self.queue.retry(repository, job)
+            finally:
+                self.queue.done(repository)
+
+    def handle_webhook(self, event_type: str | None, body: bytes, signature: str | None) -> tuple[int, dict]:
+        """Validate and queue one webhook delivery, returning the HTTP status and JSON reply."""
+        if self.secret is not None and not verify_signature(self.secret, body, signature):
+            return 401, {"error": "bad signature"}
+        if event_type != "push":
+            return 200, {"ignored": event_type}
+        try:
+            event = parse_push_event(json.loads(body))
+        except ValueError as exc:
+            return 400, {"error": str(exc)}
+        if event.repository not in self.workspaces:
+            return 404, {"error": f"unknown repository {event.repository}"}
+        if event.deleted:
+            return 200, {"ignored": "deleted", "ref": event.ref}
+        branch = self.branch or event.default_branch
+        if branch is None or event.ref != f"refs/heads/{branch}":
+            # only the deployed branch goes live; feature branches and tags are left alone
+            return 200, {"ignored": "branch", "ref": event.ref}
+        coalesced = self.queue.submit(event)
+        logger.info(
+            f"[{event.repository}] Queued {len(event.paths)} changed path(s)"
+            + (", merged with a waiting job" if coalesced else "")
+        )
+        return 202, {"queued": True, "coalesced": coalesced, "paths": len(event.paths)}
+
+    def start(self, host: str = "127.0.0.1", port: int = 8080) -> tuple[str, int]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != "/webhook":
+                    self._reply(404, {"error": "not found"})
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status, reply = server.handle_webhook(
+                    self.headers.get("X-GitHub-Event"), body, self.headers.get("X-Hub-Signature-256")
+                )
+                self._reply(status, reply)
+
+            def _reply(self, status: int, reply: dict) -> None:
+                payload = json.dumps(reply).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        for worker in self._workers:
+            worker.start()
+        self._http = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._http.serve_forever, daemon=True).start()
+        bound_host, bound_port = self._http.server_address[:2]
+        # typed as str or bytes, though an IPv4 server always reports a str
+        bound_host = bound_host if isinstance(bound_host, str) else bytes(bound_host).decode()
+        logger.info(f"Listening for push webhooks on http://{bound_host}:{bound_port}/webhook")
+        return bound_host, bound_port
+
+    def stop(self) -> None:
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+        self.queue.close()
+        for workspace in self.workspaces.values():
+            close_clients(workspace.accounts)
+
+    def serve_forever(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        self.start(host, port)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            logger.info("Stopping server.")
+        finally:
+            self.stop()
@@ -0,0 +1,153 @@
+####
+# Local record of remote state
+###
+
+import logging
+import sqlite3
+import threading
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from time import time
+
+logger = logging.getLogger("state")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    remote_hash TEXT NOT NULL,
+    collection_id TEXT,
+    parent_id TEXT,
+    version INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_by_id ON items (item_id);
+CREATE INDEX IF NOT EXISTS items_by_hash ON items (remote_hash);
+"""
+_COLUMNS = "path, kind, item_id, remote_hash, collection_id, parent_id, version"
+
+
+@dataclass(frozen=True, slots=True)
+class StateRow:
+    """The last known remote state of one local file."""
+
+    path: Path
+    kind: str
+    item_id: str
+    remote_hash: str
+    collection_id: str | None = None
+    parent_id: str | None = None
+    version: int | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class Drift:
+    """A local file whose content differs from what Avrae last held; `state` is modified, untracked or deleted."""
+
+    state: str
+    path: Path
+
+
+def _to_row(record: tuple) -> StateRow:
+    return StateRow(Path(record[0]), *record[1:])
+
+
+class StateStore:
+    """SQLite store of what every alias, snippet, doc and GVAR looked like remotely, indexed by path, id and hash."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # one connection shared by the update workers; every access holds the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        path: Path,
+        kind: str,
+        item_id: str,
+        remote_hash: str,
+        collection_id: str | None = None,
+        parent_id: str | None = None,
+        version: int | None = None,
+    ) -> None:
+        with self._lock:
+            self._connection.execute(
+                f"INSERT INTO items ({_COLUMNS}, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET kind = excluded.kind, item_id = excluded.item_id, "
+                "remote_hash = excluded.remote_hash, "
+                "collection_id = COALESCE(excluded.collection_id, items.collection_id), "
+                "parent_id = COALESCE(excluded.parent_id, items.parent_id), "
+                "version = COALESCE(excluded.version, items.version), updated_at = excluded.updated_at",
+                (path.as_posix(), kind, item_id, remote_hash, collection_id, parent_id, version, time()),
+            )
+
+    def _select(self, where: str = "", parameters: tuple = ()) -> list[StateRow]:
+        with self._lock:
+            cursor = self._connection.execute(f"SELECT {_COLUMNS} FROM items {where} ORDER BY path", parameters)
+            return [_to_row(record) for record in cursor.fetchall()]
+
+    def get(self, path: Path) -> StateRow | None:
+        rows = self._select("WHERE path = ?", (path.as_posix(),))
+        return rows[0] if rows else None
+
+    def find_by_id(self, item_id: str) -> list[StateRow]:
+        return self._select("WHERE item_id = ?", (item_id,))
+
+    def find_by_hash(self, remote_hash: str) -> list[StateRow]:
+        return self._select("WHERE remote_hash = ?", (remote_hash,))
+
+    def rows(self) -> list[StateRow]:
+        return self._select()
+
+    def save(self) -> None:
+        with self._lock:
+            self._connection.commit()
+
+    def close(self) -> None:
+        self.save()
+        with self._lock:
+            self._connection.close()
+
+
+def iter_local_files(collections: list[Path], gvars: list[Path]) -> Iterator[tuple[Path, str]]:
+    """Every local file that maps to remote state, with its kind."""
+    for root in collections:
+        for path in sorted(root.rglob("*")):
+            if path.suffix in (".alias", ".snippet"):
+                yield path, path.suffix[1:]
+            elif path.suffix == ".md":
+                yield path, "docs"
+    for path in gvars:
+        if path.is_file():
+            yield path, "gvar"
+
+
+def find_drift(
+    store: StateStore,
+    collections: list[Path],
+    gvars: list[Path],
+    local_hash: Callable[[Path, str], str],
+) -> list[Drift]:
+    """Compare local files against the last known remote state, without touching the network."""
+    known = {row.path: row for row in store.rows()}
+    drift: list[Drift] = []
+    seen = set()
+    for path, kind in iter_local_files(collections, gvars):
+        seen.add(path)
+        row = known.get(path)
+        if row is None:
+            # docs without a known item are just markdown files
+            if kind != "docs":
+                drift.append(Drift("untracked", path))
+        elif local_hash(path, kind) != row.remote_hash:
+            drift.append(Drift("modified", path))
+    roots = tuple(collections)
+    for path in known:
+        if path not in seen and (path in gvars or any(root in path.parents for root in roots)):
+            drift.append(Drift("deleted", path))
+    return drift
@@ -0,0 +1,99 @@
+####
+# Chrome trace-event spans
+###
+
+import json
+import logging
+import os
+import threading
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from pathlib import Path
+from time import perf_counter_ns
+from typing import Any
+
+logger = logging.getLogger("tracing")
+
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    """Collects timed spans from every thread as Chrome trace events (`chrome://tracing`, Perfetto)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._events: list[dict[str, Any]] = []
+        self._threads: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._origin = perf_counter_ns()
+
+    def _now(self) -> float:
+        return (perf_counter_ns() - self._origin) / 1000
+
+    @contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[None]:
+        """Time the body, recording the exception on the span when it fails."""
+        thread = threading.current_thread()
+        start = self._now()
+        try:
+            yield
+        except BaseException as exc:
+            args["error"] = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start,
+                "dur": self._now() - start,
+                "pid": os.getpid(),
+                "tid": thread.ident,
+                "args": {key: value if isinstance(value, (int, float)) else str(value) for key, value in args.items()},
+            }
+            with self._lock:
+                self._threads.setdefault(thread.ident or 0, thread.name)
+                self._events.append(event)
+
+    def to_json(self) -> dict[str, Any]:
+        with self._lock:
+            names = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in sorted(self._threads.items())
+            ]
+            events = sorted(self._events, key=lambda event: event["ts"])
+        return {"traceEvents": names + events, "displayTimeUnit": "ms"}
+
+    def save(self) -> None:
+        data = self.to_json()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump(data, fp)
+        tmp_path.replace(self.path)
+        logger.info(f"Saved {len(data['traceEvents'])} trace event(s) to {self.path.as_posix()}")
+
+
+_tracer: Tracer | None = None
+
+
+def start(path: Path) -> Tracer:
+    """Record spans from every thread until `stop` is called."""
+    global _tracer
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def stop() -> None:
+    """Save the active trace, if any, and stop recording."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.save()
+
+
+def span(name: str, category: str, **args: Any) -> AbstractContextManager:
+    """A span of the active trace, or a no-op when tracing is off."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, category, **args)
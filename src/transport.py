@@ -0,0 +1,169 @@
+####
+# Pluggable HTTP transports
+###
+
+import json
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from time import monotonic, sleep
+from typing import Any, Protocol
+
+from requests import RequestException, Session
+
+logger = logging.getLogger("transport")
+
+REDACTED = "<redacted>"
+
+
+class CassetteError(Exception):
+    """Raised when a replayed request has no matching recorded interaction."""
+
+    pass
+
+
+class Transport(Protocol):
+    def send(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        json_data: dict[str, Any] | None,
+        timeout: float,
+    ) -> Any: ...
+
+
+class SessionTransport:
+    """Default transport: a pooled requests session talking to the real API."""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def send(self, method, url, headers, json_data, timeout):
+        return self.session.request(method, url=url, headers=headers, json=json_data, timeout=timeout)
+
+
+class RecordedResponse:
+    """Replayed stand-in for `requests.Response`, exposing what the client reads."""
+
+    def __init__(self, status_code: int, text: str):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+
+def _interaction_key(method: str, url: str, json_data: dict[str, Any] | None) -> tuple[str, str, str]:
+    return method.lower(), url, json.dumps(json_data, sort_keys=True)
+
+
+class Cassette:
+    """A JSON-lines cassette being recorded, emptied once per process and shared by every client writing to it."""
+
+    _open: dict[Path, "Cassette"] = {}
+    _open_lock = threading.Lock()
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("", encoding="utf-8")
+
+    @classmethod
+    def for_path(cls, path: Path) -> "Cassette":
+        """The cassette recording to this path, started empty the first time it is asked for."""
+        key = path.resolve()
+        with cls._open_lock:
+            cassette = cls._open.get(key)
+            if cassette is None:
+                cassette = cls._open[key] = cls(path)
+            return cassette
+
+    def append(self, interaction: dict[str, Any]) -> None:
+        with self._lock, open(self.path, "a", encoding="utf-8") as fp:
+            fp.write(json.dumps(interaction) + "\n")
+
+
+class RecordingTransport:
+    """Wraps another transport and appends every exchange to a JSON-lines cassette."""
+
+    def __init__(self, inner: Transport, cassette_path: Path):
+        self.inner = inner
+        self.cassette_path = cassette_path
+        # clients made later in the run, one per account or project, add to what earlier ones recorded
+        self.cassette = Cassette.for_path(cassette_path)
+
+    def send(self, method, url, headers, json_data, timeout):
+        started = monotonic()
+        request = {
+            "method": method.lower(),
+            "url": url,
+            "headers": {k: REDACTED if k.lower() == "authorization" else v for k, v in headers.items()},
+            "json": json_data,
+        }
+        try:
+            response = self.inner.send(method, url, headers, json_data, timeout)
+        except RequestException as exc:
+            self._append({"request": request, "error": str(exc), "duration": monotonic() - started})
+            raise
+        self._append(
+            {
+                "request": request,
+                "response": {"status_code": response.status_code, "text": response.text},
+                "duration": monotonic() - started,
+            }
+        )
+        return response
+
+    def _append(self, interaction: dict[str, Any]) -> None:
+        self.cassette.append(interaction)
+
+
+class ReplayTransport:
+    """Serves recorded interactions back in order for each (method, url, body), optionally at recorded speed."""
+
+    def __init__(self, cassette_path: Path, replay_latency: bool = False):
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._interactions: dict[tuple[str, str, str], deque[dict[str, Any]]] = {}
+        with open(cassette_path, "r", encoding="utf-8") as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                interaction = json.loads(line)
+                request = interaction["request"]
+                key = _interaction_key(request["method"], request["url"], request["json"])
+                self._interactions.setdefault(key, deque()).append(interaction)
+
+    def send(self, method, url, headers, json_data, timeout):
+        key = _interaction_key(method, url, json_data)
+        with self._lock:
+            recorded = self._interactions.get(key)
+            if not recorded:
+                raise CassetteError(f"No recorded interaction left for {method.upper()} {url}")
+            interaction = recorded.popleft()
+        if self.replay_latency:
+            sleep(interaction.get("duration", 0))
+        if "error" in interaction:
+            raise RequestException(interaction["error"])
+        response = interaction["response"]
+        return RecordedResponse(response["status_code"], response["text"])
+
+
+def create_transport(config, session: Session) -> Transport:
+    """Build the transport selected by the config's HTTP mode."""
+    mode = getattr(config, "http_mode", None)
+    cassette = getattr(config, "http_cassette", None)
+    if not mode or mode == "live":
+        return SessionTransport(session)
+    if cassette is None:
+        raise ValueError(f"HTTP mode {mode!r} requires a cassette path.")
+    if mode == "record":
+        logger.info(f"Recording HTTP traffic to {Path(cassette).as_posix()}")
+        return RecordingTransport(SessionTransport(session), Path(cassette))
+    if mode == "replay":
+        logger.info(f"Replaying HTTP traffic from {Path(cassette).as_posix()}")
+        return ReplayTransport(Path(cassette), getattr(config, "replay_latency", False))
+    raise ValueError(f"Unknown HTTP mode {mode!r}. Expected live, record, or replay.")
@@ -1,13 +1,73 @@
+import json
 from pathlib import Path
-from typing import Iterable, List
+from typing import IO, Iterable, Iterator, List
+
+_READ_CHUNK_SIZE = 64 * 1024
+_JSON_DECODER = json.JSONDecoder()
 
 
 def is_important_path(path: str) -> bool:
-    for ending in (".alias", ".snippet", ".gvar", ".md"):
+    # `.drac` fragments matter through the aliases and snippets that include them
+    for ending in (".alias", ".snippet", ".gvar", ".md", ".drac"):
         if path.endswith(ending):
             return True
     return False
 
 
 def parse_paths(paths: Iterable[str]) -> List[Path]:
-    return [Path(x) for x in paths if is_important_path(x)]
+    return list(iter_paths(paths))
+
+
+def iter_paths(paths: Iterable[str]) -> Iterator[Path]:
+    """Lazily keep only the paths the updater cares about."""
+    return (Path(x) for x in paths if is_important_path(x))
+
+
+def _iter_json_string_array(fp: IO[str], buffer: str) -> Iterator[str]:
+    """Incrementally decode a JSON array of strings, holding at most one element plus one chunk in memory."""
+    position = buffer.index("[") + 1
+    while True:
+        # skip separators, reading more input whenever the buffer runs dry
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer):
+                break
+            buffer, position = fp.read(_READ_CHUNK_SIZE), 0
+            if not buffer:
+                raise ValueError("Modified files list ended before the closing bracket.")
+        if buffer[position] == "]":
+            return
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError:
+                chunk = fp.read(_READ_CHUNK_SIZE)
+                if not chunk:
+                    raise ValueError("Modified files list is not a valid JSON array.") from None
+                buffer, position = buffer[position:] + chunk, 0
+        if not isinstance(value, str):
+            raise ValueError("Modified files list must only contain strings.")
+        yield value
+        buffer, position = buffer[end:], 0
+
+
+def iter_path_list_file(path: Path) -> Iterator[str]:
+    """Stream paths from a file holding either a JSON array or one path per line."""
+    with open(path, "r", encoding="utf-8") as fp:
+        buffer = fp.read(_READ_CHUNK_SIZE)
+        if buffer.lstrip().startswith("["):
+            yield from _iter_json_string_array(fp, buffer)
+            return
+        # newline-delimited: stitch the first chunk back onto the rest of the file
+        pending = ""
+        while buffer:
+            lines = (pending + buffer).split("\n")
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield line.strip()
+            buffer = fp.read(_READ_CHUNK_SIZE)
+        if pending.strip():
+            yield pending.strip()
@@ -0,0 +1,75 @@
+####
+# Persistent code version index
+###
+
+import hashlib
+import json
+import logging
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+
+logger = logging.getLogger("versions")
+
+
+def content_hash(content: str) -> str:
+    """Stable hash of alias or snippet code, used as the index key."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class VersionIndex:
+    """Maps each alias/snippet id to {content hash: existing code version}, persisted as JSON."""
+
+    def __init__(self, path: Path | None = None, items: dict[str, dict[str, int]] | None = None):
+        self.path = path
+        self._items: dict[str, dict[str, int]] = items or {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path: Path) -> "VersionIndex":
+        if not path.is_file():
+            return cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as fp:
+                items = json.load(fp)
+        except (OSError, json.JSONDecodeError) as exc:
+            logger.warning(f"Ignoring unreadable version index at {path.as_posix()}: {exc}")
+            return cls(path)
+        if not isinstance(items, dict):
+            logger.warning(f"Ignoring malformed version index at {path.as_posix()}")
+            return cls(path)
+        return cls(path, items)
+
+    def is_seeded(self, item_id: str) -> bool:
+        with self._lock:
+            return item_id in self._items
+
+    def lookup(self, item_id: str, content: str) -> int | None:
+        with self._lock:
+            return self._items.get(item_id, {}).get(content_hash(content))
+
+    def record(self, item_id: str, content: str, version: int) -> None:
+        with self._lock:
+            self._items.setdefault(item_id, {})[content_hash(content)] = version
+            self._dirty = True
+
+    def seed(self, item_id: str, versions: Iterable[tuple[str, int]]) -> None:
+        """Register every known (content, version) pair for an item, keeping the newest per hash."""
+        with self._lock:
+            known = self._items.setdefault(item_id, {})
+            for content, version in versions:
+                digest = content_hash(content)
+                known[digest] = max(version, known.get(digest, version))
+            self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if self.path is None or not self._dirty:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                json.dump(self._items, fp, sort_keys=True)
+            tmp_path.replace(self.path)
+            self._dirty = False
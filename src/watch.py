@@ -0,0 +1,255 @@
+####
+# Local watch mode
+###
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+from collections.abc import Callable, Iterable, Mapping
+from pathlib import Path
+from time import monotonic, sleep
+
+import utils as utils
+from api import Avrae, close_clients, create_clients
+from config import Config
+from parsing import Parser, load_parser
+
+logger = logging.getLogger("watch")
+
+DEFAULT_DEBOUNCE_SECONDS = 0.2
+DEFAULT_POLL_INTERVAL = 0.25
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class PollingWatcher:
+    """Portable watcher that diffs (mtime, size) snapshots of the watched trees."""
+
+    def __init__(self, dirs: Iterable[Path], files: Iterable[Path], interval: float = DEFAULT_POLL_INTERVAL):
+        self.dirs = list(dirs)
+        self.files = list(files)
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict[Path, tuple[int, int]]:
+        snapshot: dict[Path, tuple[int, int]] = {}
+        for path in self.files:
+            self._stat_into(snapshot, path)
+        for root in self.dirs:
+            for dir_path, _, file_names in os.walk(root):
+                for file_name in file_names:
+                    self._stat_into(snapshot, Path(dir_path) / file_name)
+        return snapshot
+
+    @staticmethod
+    def _stat_into(snapshot: dict[Path, tuple[int, int]], path: Path) -> None:
+        try:
+            stat = path.stat()
+        except OSError:
+            return
+        snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+
+    def poll(self, timeout: float) -> set[Path]:
+        """Return the files that changed, waiting at most `timeout` seconds for one."""
+        deadline = monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {
+                path
+                for path in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(path) != self._snapshot.get(path)
+            }
+            self._snapshot = snapshot
+            remaining = deadline - monotonic()
+            if changed or remaining <= 0:
+                return changed
+            sleep(min(self.interval, remaining))
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """Linux watcher backed by inotify, watching directory trees recursively."""
+
+    def __init__(self, dirs: Iterable[Path], files: Iterable[Path]):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches: dict[int, Path] = {}
+        self._tree_dirs: set[Path] = set()
+        # individual files are watched through their parent directory, non-recursively
+        self._files = set(files)
+        self._file_dirs = {path.parent for path in self._files}
+        for directory in self._file_dirs:
+            if directory.is_dir():
+                self._add_watch(directory)
+        for root in dirs:
+            self._add_tree(root)
+
+    def _add_watch(self, directory: Path) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch failed for {directory.as_posix()}: {os.strerror(errno)}")
+        self._watches[wd] = directory
+
+    def _add_tree(self, root: Path) -> None:
+        if not root.is_dir():
+            return
+        for dir_path, _, _ in os.walk(root):
+            self._add_watch(Path(dir_path))
+            self._tree_dirs.add(Path(dir_path))
+
+    def poll(self, timeout: float) -> set[Path]:
+        """Return the files that changed, waiting at most `timeout` seconds for one."""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed: set[Path] = set()
+        while True:
+            try:
+                buffer = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            changed |= self._decode(buffer)
+        return changed
+
+    def _decode(self, buffer: bytes) -> set[Path]:
+        changed: set[Path] = set()
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset : offset + name_len].rstrip(b"\0"))
+            offset += name_len
+            directory = self._watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = directory / name
+            if directory in self._tree_dirs:
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self._add_tree(path)
+                        changed |= {Path(d) / f for d, _, names in os.walk(path) for f in names}
+                    continue
+                changed.add(path)
+            elif path in self._files:
+                changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def create_watcher(dirs: Iterable[Path], files: Iterable[Path]) -> InotifyWatcher | PollingWatcher:
+    """Prefer inotify, falling back to polling where it is unavailable."""
+    dirs, files = list(dirs), list(files)
+    try:
+        return InotifyWatcher(dirs, files)
+    except (OSError, AttributeError) as exc:
+        logger.info(f"inotify unavailable ({exc}); falling back to polling.")
+        return PollingWatcher(dirs, files)
+
+
+def collect_changes(
+    watcher: InotifyWatcher | PollingWatcher,
+    debounce: float = DEFAULT_DEBOUNCE_SECONDS,
+    timeout: float | None = None,
+) -> set[Path]:
+    """Block until a change arrives, then gather the rest of the burst until it goes quiet."""
+    changed = watcher.poll(3600 if timeout is None else timeout)
+    while changed:
+        more = watcher.poll(debounce)
+        if not more:
+            break
+        changed |= more
+    return changed
+
+
+class WatchSession:
+    """Keeps the parser, collection payloads and HTTP pool warm between syncs."""
+
+    def __init__(
+        self,
+        config: Config,
+        sync: Callable[[Mapping[str, Avrae], Parser, set], dict[str, int]],
+        debounce: float = DEFAULT_DEBOUNCE_SECONDS,
+    ):
+        self.config = config
+        self.sync = sync
+        self.debounce = debounce
+        self.parser = load_parser(config)
+        self.avrae: dict[str, Avrae] = create_clients(config, self.parser.used_token_aliases())
+
+    @property
+    def config_files(self) -> list[Path]:
+        return [Path(str(self.config.collections_file_path)), Path(str(self.config.gvars_file_path))]
+
+    def watched_paths(self) -> tuple[list[Path], list[Path]]:
+        """Directories to watch recursively, and individual files to watch."""
+        dirs = list(self.parser.collections.keys())
+        files = self.config_files + list(self.parser.gvars.keys())
+        if self.parser.includes is not None:
+            files += self.parser.includes.fragments()
+        return dirs, files
+
+    def handle_changes(self, changed: set[Path]) -> bool:
+        """Push one debounced batch of changes; returns True if the watch set must be rebuilt."""
+        if any(path in changed for path in self.config_files):
+            logger.info("Configuration changed; reloading collection and GVAR maps.")
+            self.parser = load_parser(self.config)
+            # keep warm clients, only adding accounts the new maps refer to
+            new_aliases = set(self.parser.used_token_aliases()) - set(self.avrae)
+            self.avrae.update(create_clients(self.config, new_aliases))
+            return True
+
+        modified_files = utils.parse_paths(path.as_posix() for path in changed if path.is_file())
+        if not modified_files:
+            return False
+        started = monotonic()
+        self.parser.find_connected_files(modified_files)
+        modified_paths = set(x.path for x in self.parser.connected_files)
+        if not modified_paths:
+            return False
+        self.sync(self.avrae, self.parser, modified_paths)
+        logger.info(f"Synced {len(modified_paths)} file(s) in {monotonic() - started:.3f}s")
+        return False
+
+    def serve_forever(self) -> None:
+        while True:
+            dirs, files = self.watched_paths()
+            watcher = create_watcher(dirs, files)
+            logger.info(f"Watching {len(dirs)} collection(s) and {len(files)} file(s) for changes...")
+            try:
+                while True:
+                    changed = collect_changes(watcher, self.debounce)
+                    if not changed:
+                        continue
+                    try:
+                        if self.handle_changes(changed):
+                            break
+                    except Exception:
+                        # a daemon keeps going; the next save retries
+                        logger.exception("Sync failed")
+            except KeyboardInterrupt:
+                logger.info("Stopping watch mode.")
+                close_clients(self.avrae)
+                return
+            finally:
+                watcher.close()
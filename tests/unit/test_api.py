@@ -1,3 +1,7 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from types import SimpleNamespace
 from unittest.mock import MagicMock, call, patch
@@ -7,12 +11,20 @@ from requests import RequestException
 
 from api import (
     Avrae,
+    AvraeError,
     AvraeRequestError,
     AvraeResponseError,
     build_collection_outputs,
+    close_clients,
+    create_clients,
     get_collection_path,
 )
+from lockfile import LockEntry, LockFile
 from models import ParsedAlias
+from plan import Plan, PlanRecorder
+from state import StateStore
+import tracing
+from versions import content_hash
 
 
 class FakeResponse:
@@ -32,6 +44,62 @@ def api() -> Avrae:
     return Avrae(SimpleNamespace(token="token"))
 
 
+class StandInAvrae:
+    """Local stand-in for the Avrae API serving canned GET routes and recording every request."""
+
+    def __init__(self, routes: dict):
+        self.routes = routes
+        self.requests: list[tuple[str, str]] = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status: int, body: str) -> None:
+                encoded = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def do_GET(self):
+                stand_in.requests.append(("GET", self.path))
+                if self.path not in stand_in.routes:
+                    self._reply(404, "Not found")
+                    return
+                self._reply(200, json.dumps(stand_in.routes[self.path]))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self.rfile.read(length)
+                stand_in.requests.append(("POST", self.path))
+                self._reply(200, "Gvar updated.")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stand_in():
+    servers: list[StandInAvrae] = []
+
+    def start(routes: dict) -> StandInAvrae:
+        server = StandInAvrae(routes)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
 def test_request_returns_successful_response(api: Avrae):
     response = FakeResponse(200, json_data={"success": True})
     api.session.request = MagicMock(return_value=response)
@@ -48,6 +116,19 @@ def test_request_returns_successful_response(api: Avrae):
     )
 
 
+def test_request_hedges_only_gets():
+    api = Avrae(SimpleNamespace(token="token", hedge_rate=0.1))
+    api.session.request = MagicMock(return_value=FakeResponse(200, json_data={"success": True}))
+
+    api._request("get", "http://example.com")
+    api._request("post", "http://example.com", {"value": "x"})
+
+    assert api.client.hedger is not None
+    assert api.client.hedger.requests == 1
+    assert api.client.hedger.threshold() == 1.0
+    assert api.session.request.call_count == 2
+
+
 def test_request_retries_after_server_error_and_succeeds(api: Avrae):
     api.session.request = MagicMock(
         side_effect=[
@@ -179,6 +260,28 @@ def test_check_and_maybe_update_updates_code_and_active_version(api: Avrae):
     )
 
 
+def test_check_and_maybe_update_uploads_minified_code(tmp_path: Path):
+    api = Avrae(SimpleNamespace(token="token", minify=True, cache_dir=tmp_path))
+    parsed_alias = ParsedAlias(
+        "alias",
+        {"_id": "123", "code": "<drac2>x = 1</drac2>", "docs": "docs"},
+        Path("collections/cool/alias"),
+        Path("collections/cool/alias/alias.alias"),
+        Path("collections/cool/alias/alias.md"),
+    )
+
+    with (
+        patch.object(api, "_read_text", return_value="<drac2>\n# set x\nx = 1\n</drac2>\n"),
+        patch.object(api, "post_request") as mock_post,
+    ):
+        result = api.check_and_maybe_update("alias", parsed_alias)
+
+    assert result == -1
+    mock_post.assert_not_called()
+    assert api.builder.savings == {Path("collections/cool/alias/alias.alias"): (30, 20)}
+    assert len(list((tmp_path / "build").iterdir())) == 1
+
+
 def test_check_and_maybe_update_raises_when_update_response_fails(api: Avrae):
     parsed_alias = ParsedAlias(
         "alias",
@@ -351,6 +454,29 @@ def test_check_and_maybe_update_gvar_raises_for_bad_update_response(api: Avrae):
             api.check_and_maybe_update_gvar(Path("one.gvar"), "g1")
 
 
+def test_check_and_maybe_update_gvar_uploads_only_changed_shards(tmp_path: Path):
+    api = Avrae(SimpleNamespace(token="token", gvar_build=True))
+    gvar_path = tmp_path / "data.gvar"
+    gvar_path.write_text(json.dumps({"a": "x" * 60_000, "b": "y" * 60_000}, indent=2))
+    api.gvar_shards = {gvar_path: ("s1", "s2")}
+    remote = {
+        "g1": {"value": '{"format":1,"type":"dict","shards":["s1","s2"]}'},
+        "s1": {"value": json.dumps({"a": "x" * 60_000}, separators=(",", ":"))},
+        "s2": {"value": "stale"},
+    }
+    with (
+        patch.object(api, "get_gvar", side_effect=lambda gvar_id: remote[gvar_id]),
+        patch.object(api, "post_request_str", return_value="Gvar updated.") as mock_post,
+    ):
+        assert api.check_and_maybe_update_gvar(gvar_path, "g1") == 0
+        assert api.check_and_maybe_update_gvar(gvar_path, "g1") == -1
+
+    mock_post.assert_called_once_with(
+        "https://api.avrae.io/customizations/gvars/s2",
+        {"value": json.dumps({"b": "y" * 60_000}, separators=(",", ":"))},
+    )
+
+
 def test_get_collection_info_returns_data(api: Avrae):
     with patch.object(
         api.client,
@@ -450,3 +576,615 @@ def test_get_collection_path_raises_for_unknown_collection_id():
 
     with pytest.raises(AvraeResponseError, match="Unknown collection id: missing"):
         get_collection_path(parser, "missing")  # type: ignore[arg-type]
+
+
+def test_get_collection_info_shares_one_request_for_repeated_ids(api: Avrae):
+    with patch.object(api.client, "request_json", return_value={"success": True, "data": {}}) as mock_request:
+        first = api.get_collection_info("col-1")
+        second = api.get_collection_info("col-1")
+
+    assert first is second
+    mock_request.assert_called_once()
+
+
+def test_get_request_shared_refetches_evicted_payloads():
+    api = Avrae(SimpleNamespace(token="token", payload_cache_mb=0))
+    with patch.object(api.client, "request_json", return_value={"value": "data"}) as mock_request:
+        api.get_gvar("g1")
+        api.get_gvar("g1")
+
+    assert mock_request.call_count == 2
+    assert api.payloads.misses == 2
+
+
+def test_parse_collection_caches_outputs_instead_of_the_raw_payload(api: Avrae):
+    parser = SimpleNamespace(collections={Path("collections/cool"): "col-1"})
+    payload = {"success": True, "data": {"aliases": [], "snippets": [{"name": "spell", "_id": "s1"}]}}
+
+    with patch.object(api.client, "request_json", return_value=payload) as mock_request:
+        first = api.parse_collection("col-1", parser)  # type: ignore[arg-type]
+        second = api.parse_collection("col-1", parser)  # type: ignore[arg-type]
+
+    assert first is second
+    mock_request.assert_called_once()
+    assert len(api.payloads) == 1
+
+
+def test_create_clients_share_one_payload_cache():
+    config = SimpleNamespace(token="token", tokens={"default": "a", "guild": "b"})
+
+    accounts = create_clients(config, ["default", "guild"])
+
+    assert accounts["default"].payloads is accounts["guild"].payloads
+
+
+def test_get_request_shared_joins_concurrent_callers(api: Avrae):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_request(method, path):
+        started.set()
+        release.wait(5)
+        return {"value": "data"}
+
+    with patch.object(api.client, "request_json", side_effect=slow_request) as mock_request:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(api.get_gvar, "g1") for _ in range(4)]
+            started.wait(5)
+            release.set()
+            results = [future.result() for future in futures]
+
+    mock_request.assert_called_once_with("get", "https://api.avrae.io/customizations/gvars/g1")
+    assert all(result is results[0] for result in results)
+
+
+def test_get_request_shared_does_not_memoize_failures(api: Avrae):
+    with patch.object(
+        api.client,
+        "request_json",
+        side_effect=[AvraeRequestError("boom"), {"value": "data"}],
+    ) as mock_request:
+        with pytest.raises(AvraeRequestError, match="boom"):
+            api.get_gvar("g1")
+        assert api.get_gvar("g1") == {"value": "data"}
+
+    assert mock_request.call_count == 2
+
+
+def test_check_and_maybe_update_gvar_refreshes_shared_payload(api: Avrae):
+    with (
+        patch.object(api.client, "request_json", return_value={"value": "old"}),
+        patch.object(api, "_read_text", return_value="new"),
+        patch.object(api, "post_request_str", return_value="Gvar updated."),
+    ):
+        api.check_and_maybe_update_gvar(Path("one.gvar"), "g1")
+        # a second path pointing at the same gvar now compares against the new value
+        assert api.check_and_maybe_update_gvar(Path("two.gvar"), "g1") == -1
+
+
+def test_check_and_maybe_update_refreshes_payload_after_update(api: Avrae):
+    parsed_alias = ParsedAlias(
+        "alias",
+        {"_id": "123", "code": "old code", "docs": "old docs"},
+        Path("alias"),
+        Path("alias.alias"),
+        Path("alias.md"),
+    )
+
+    with (
+        patch.object(api, "_read_text", return_value="new"),
+        patch.object(api, "post_request", return_value={"success": True, "data": {"version": "v2"}}),
+        patch.object(api, "put_request", return_value={"success": True}),
+        patch.object(api, "patch_request", return_value={"success": True}),
+    ):
+        api.check_and_maybe_update("alias", parsed_alias)
+        api.check_and_maybe_update_docs("alias", parsed_alias)
+
+    assert parsed_alias.data["code"] == "new"
+    assert parsed_alias.data["docs"] == "new"
+
+
+def test_updates_are_traced_as_item_chains_with_http_attempts(tmp_path: Path):
+    api = Avrae(SimpleNamespace(token="token"))
+    api.session.request = MagicMock(
+        side_effect=[
+            FakeResponse(500, "server error"),
+            FakeResponse(200, json_data={"success": True, "data": {"version": 2}}),
+            FakeResponse(200, json_data={"success": True}),
+        ]
+    )
+    parsed_alias = ParsedAlias("alias", {"_id": "123", "code": "old"}, Path("alias"), Path("a.alias"), Path("a.md"))
+
+    tracer = tracing.start(tmp_path / "trace.json")
+    try:
+        with patch.object(api, "_read_text", return_value="new"), patch("api.sleep"):
+            api.check_and_maybe_update("alias", parsed_alias)
+    finally:
+        tracing.stop()
+
+    spans = [event["name"] for event in tracer.to_json()["traceEvents"] if event["ph"] == "X"]
+    assert spans == [
+        "alias alias",
+        "read",
+        "compare",
+        "code POST",
+        "POST /workshop/alias/123/code",
+        "retry sleep",
+        "POST /workshop/alias/123/code",
+        "active-code PUT",
+        "PUT /workshop/alias/123/active-code",
+    ]
+
+
+def test_bulk_gvars_replace_single_gets_with_listing_lookups(stand_in, tmp_path: Path):
+    server = stand_in(
+        {
+            "/customizations/gvars": {
+                "owned": [{"key": "g1", "value": "one"}],
+                "editable": [],
+                "next": "/customizations/gvars?page=2",
+            },
+            "/customizations/gvars?page=2": {"owned": [], "editable": [{"key": "g2", "value": "two"}]},
+            "/customizations/gvars/g3": {"key": "g3", "value": "three"},
+        }
+    )
+    api = Avrae(SimpleNamespace(token="token", api_url=server.url, bulk_gvars=True))
+    for name, value in (("one", "one"), ("two", "changed"), ("three", "three")):
+        (tmp_path / f"{name}.gvar").write_text(value)
+
+    results = [
+        api.check_and_maybe_update_gvar(tmp_path / "one.gvar", "g1"),
+        api.check_and_maybe_update_gvar(tmp_path / "two.gvar", "g2"),
+        api.check_and_maybe_update_gvar(tmp_path / "three.gvar", "g3"),
+    ]
+
+    assert results == [-1, 0, -1]
+    assert server.requests == [
+        ("GET", "/customizations/gvars"),
+        ("GET", "/customizations/gvars?page=2"),
+        ("POST", "/customizations/gvars/g2"),
+        ("GET", "/customizations/gvars/g3"),
+    ]
+
+
+def test_get_gvar_uses_single_request_when_bulk_listing_disabled(stand_in):
+    server = stand_in({"/customizations/gvars/g1": {"key": "g1", "value": "one"}})
+    api = Avrae(SimpleNamespace(token="token", api_url=server.url))
+
+    assert api.get_gvar("g1") == {"key": "g1", "value": "one"}
+    assert server.requests == [("GET", "/customizations/gvars/g1")]
+
+
+def test_list_gvars_raises_for_unsuccessful_listing(api: Avrae):
+    with patch.object(api.client, "request_json", return_value={"success": False}):
+        with pytest.raises(AvraeResponseError, match="GVAR listing did not succeed"):
+            api.list_gvars()
+
+
+def _versioned_api(tmp_path: Path) -> Avrae:
+    return Avrae(SimpleNamespace(token="token", reuse_versions=True, cache_dir=tmp_path))
+
+
+def test_check_and_maybe_update_reuses_existing_version_for_reverts(tmp_path: Path):
+    api = _versioned_api(tmp_path)
+    parsed_alias = ParsedAlias(
+        "alias",
+        {"_id": "123", "code": "bad deploy", "docs": "docs"},
+        Path("alias"),
+        Path("alias.alias"),
+        Path("alias.md"),
+    )
+    versions = {"success": True, "data": [{"version": 1, "content": "good"}, {"version": 2, "content": "bad deploy"}]}
+
+    with (
+        patch.object(api, "_read_text", return_value="good"),
+        patch.object(api.client, "request_json", return_value=versions) as mock_get,
+        patch.object(api, "post_request") as mock_post,
+        patch.object(api, "put_request", return_value={"success": True}) as mock_put,
+    ):
+        result = api.check_and_maybe_update("alias", parsed_alias)
+
+    assert result == 0
+    mock_get.assert_called_once_with("get", "https://api.avrae.io/workshop/alias/123/code")
+    mock_post.assert_not_called()
+    mock_put.assert_called_once_with(
+        path="https://api.avrae.io/workshop/alias/123/active-code",
+        request_data={"version": 1},
+    )
+
+
+def test_check_and_maybe_update_records_reused_version_in_lock(tmp_path: Path):
+    api = _versioned_api(tmp_path)
+    api.lock = LockFile(
+        tmp_path / "avrae-lock.json",
+        {"alias.alias": LockEntry("alias", "123", "alias", "col-1", "alias.md", None, 2)},
+    )
+    parsed_alias = ParsedAlias(
+        "alias",
+        {"_id": "123", "code": "bad deploy", "docs": "docs"},
+        Path("alias"),
+        Path("alias.alias"),
+        Path("alias.md"),
+    )
+    versions = {"success": True, "data": [{"version": 1, "content": "good"}, {"version": 2, "content": "bad deploy"}]}
+
+    with (
+        patch.object(api, "_read_text", return_value="good"),
+        patch.object(api.client, "request_json", return_value=versions),
+        patch.object(api, "post_request") as mock_post,
+        patch.object(api, "put_request", return_value={"success": True}),
+    ):
+        api.check_and_maybe_update("alias", parsed_alias)
+
+    mock_post.assert_not_called()
+    assert api.lock.get(Path("alias.alias")).version == 1
+
+
+@pytest.mark.parametrize("planning", [True, False])
+def test_check_and_maybe_update_leaves_lock_alone_unless_the_version_goes_live(tmp_path: Path, planning: bool):
+    api = _versioned_api(tmp_path)
+    api.lock = LockFile(
+        tmp_path / "avrae-lock.json",
+        {"alias.alias": LockEntry("alias", "123", "alias", "col-1", "alias.md", None, 2)},
+    )
+    parsed_alias = ParsedAlias(
+        "alias",
+        {"_id": "123", "code": "bad deploy", "docs": "docs"},
+        Path("alias"),
+        Path("alias.alias"),
+        Path("alias.md"),
+    )
+    versions = {"success": True, "data": [{"version": 1, "content": "good"}, {"version": 2, "content": "bad deploy"}]}
+    if planning:
+        api.planner = PlanRecorder()
+
+    with (
+        patch.object(api, "_read_text", return_value="good"),
+        patch.object(api.client, "request_json", return_value=versions),
+        patch.object(api, "put_request", return_value={"success": planning}),
+    ):
+        if planning:
+            api.check_and_maybe_update("alias", parsed_alias)
+        else:
+            with pytest.raises(AvraeResponseError):
+                api.check_and_maybe_update("alias", parsed_alias)
+
+    assert api.lock.get(Path("alias.alias")).version == 2
+
+
+def test_check_and_maybe_update_records_new_versions_across_runs(tmp_path: Path):
+    api = _versioned_api(tmp_path)
+    parsed_alias = ParsedAlias(
+        "alias",
+        {"_id": "123", "code": "old", "docs": "docs"},
+        Path("alias"),
+        Path("alias.alias"),
+        Path("alias.md"),
+    )
+
+    with (
+        patch.object(api, "_read_text", return_value="new"),
+        patch.object(api.client, "request_json", return_value={"success": True, "data": []}),
+        patch.object(api, "post_request", return_value={"success": True, "data": {"version": 5}}),
+        patch.object(api, "put_request", return_value={"success": True}),
+    ):
+        api.check_and_maybe_update("alias", parsed_alias)
+    api.save_caches()
+
+    next_run = _versioned_api(tmp_path)
+    assert next_run.versions is not None
+    assert next_run.versions.lookup("123", "new") == 5
+
+
+def test_read_text_keeps_line_endings_and_decodes_utf8(tmp_path: Path):
+    file_path = tmp_path / "data.alias"
+    file_path.write_bytes("héllo\r\n".encode("utf-8"))
+
+    assert Avrae._read_text(file_path) == "héllo\r\n"
+
+
+def test_check_and_maybe_update_counts_uploads_avoided_by_normalization(api: Avrae):
+    parsed_alias = ParsedAlias(
+        "alias",
+        {"_id": "123", "code": "line one\nline two", "docs": "docs"},
+        Path("alias"),
+        Path("alias.alias"),
+        Path("alias.md"),
+    )
+
+    with (
+        patch.object(api, "_read_text", return_value="\ufeffline one\r\nline two\r\n"),
+        patch.object(api, "post_request") as mock_post,
+    ):
+        result = api.check_and_maybe_update("alias", parsed_alias)
+
+    assert result == -1
+    mock_post.assert_not_called()
+    assert api.stats["uploads_avoided"] == 1
+
+
+def test_check_and_maybe_update_gvar_uploads_canonical_content(api: Avrae):
+    with (
+        patch.object(api, "get_gvar", return_value={"value": "old"}),
+        patch.object(api, "_read_text", return_value="new\r\nvalue\r\n"),
+        patch.object(api, "post_request_str", return_value="Gvar updated.") as mock_post,
+    ):
+        api.check_and_maybe_update_gvar(Path("one.gvar"), "g1")
+
+    mock_post.assert_called_once_with("https://api.avrae.io/customizations/gvars/g1", {"value": "new\nvalue"})
+    assert api.stats["uploads_avoided"] == 0
+
+
+def test_normalization_can_be_disabled():
+    api = Avrae(SimpleNamespace(token="token", normalization=()))
+    parsed_alias = ParsedAlias(
+        "alias",
+        {"_id": "123", "code": "code", "docs": "docs"},
+        Path("alias"),
+        Path("alias.alias"),
+        Path("alias.md"),
+    )
+
+    with (
+        patch.object(api, "_read_text", return_value="docs\n"),
+        patch.object(api, "patch_request", return_value={"success": True}) as mock_patch,
+    ):
+        assert api.check_and_maybe_update_docs("alias", parsed_alias) == 0
+
+    mock_patch.assert_called_once_with("https://api.avrae.io/workshop/alias/123", {"name": "alias", "docs": "docs\n"})
+
+
+def test_planner_records_writes_instead_of_sending_them(api: Avrae):
+    api.planner = PlanRecorder()
+    parsed_alias = ParsedAlias(
+        "alias",
+        {"_id": "123", "code": "old", "docs": "docs"},
+        Path("alias"),
+        Path("alias.alias"),
+        Path("alias.md"),
+    )
+
+    with (
+        patch.object(api, "_read_text", return_value="new"),
+        patch.object(api.client, "request_json") as mock_request,
+    ):
+        assert api.check_and_maybe_update("alias", parsed_alias) == 0
+
+    mock_request.assert_not_called()
+    assert [(op.method, op.path, op.depends_on) for op in api.planner.operations] == [
+        ("post", "https://api.avrae.io/workshop/alias/123/code", None),
+        ("put", "https://api.avrae.io/workshop/alias/123/active-code", 0),
+    ]
+
+
+def test_apply_plan_fills_in_created_versions(api: Avrae):
+    recorder = PlanRecorder()
+    created = recorder.record("post", "https://api.avrae.io/workshop/alias/123/code", {"content": "new"}, "json")
+    recorder.record(
+        "put", "https://api.avrae.io/workshop/alias/123/active-code", {"version": created["data"]["version"]}, "json"
+    )
+    recorder.record("post", "https://api.avrae.io/customizations/gvars/g1", {"value": "v"}, "text")
+
+    with (
+        patch.object(
+            api.client,
+            "request_json",
+            side_effect=[{"success": True, "data": {"version": 7}}, {"success": True}],
+        ) as mock_json,
+        patch.object(api.client, "request_text", return_value="Gvar updated.") as mock_text,
+    ):
+        api.apply_plan(Plan(recorder.operations))
+
+    assert mock_json.call_args_list == [
+        call("post", "https://api.avrae.io/workshop/alias/123/code", {"content": "new"}),
+        call("put", "https://api.avrae.io/workshop/alias/123/active-code", {"version": 7}),
+    ]
+    mock_text.assert_called_once_with("post", "https://api.avrae.io/customizations/gvars/g1", {"value": "v"})
+
+
+def test_apply_plan_raises_for_failed_operations(api: Avrae):
+    recorder = PlanRecorder()
+    recorder.record("patch", "https://api.avrae.io/workshop/alias/123", {"name": "a", "docs": "d"}, "json")
+
+    with patch.object(api.client, "request_json", return_value={"success": False}):
+        with pytest.raises(AvraeResponseError, match="Could not apply PATCH"):
+            api.apply_plan(Plan(recorder.operations))
+
+
+def test_apply_plan_routes_operations_to_their_account(api: Avrae):
+    guild = Avrae(SimpleNamespace(token="token"), "guild-token", "guild")
+    recorder = PlanRecorder()
+    recorder.record("post", "https://api.avrae.io/customizations/gvars/g1", {"value": "v"}, "text", "guild")
+
+    with (
+        patch.object(api.client, "request_text") as default_text,
+        patch.object(guild.client, "request_text", return_value="Gvar updated.") as guild_text,
+    ):
+        api.apply_plan(Plan(recorder.operations), {"default": api, "guild": guild})
+
+    default_text.assert_not_called()
+    guild_text.assert_called_once_with("post", "https://api.avrae.io/customizations/gvars/g1", {"value": "v"})
+
+
+def test_create_clients_builds_one_rate_limited_client_per_alias():
+    config = SimpleNamespace(token="token", tokens={"default": "token", "guild": "guild-token"}, rate_limit=5.0)
+
+    accounts = create_clients(config, ["guild", "default", "guild"])
+
+    assert list(accounts) == ["default", "guild"]
+    assert accounts["guild"].client.token == "guild-token"
+    assert accounts["guild"].client.session is not accounts["default"].client.session
+    assert accounts["guild"].client.rate_limiter is not accounts["default"].client.rate_limiter
+    assert accounts["guild"].client.rate_limiter.rate == 5.0
+
+
+def test_create_clients_share_a_host_wide_budget_when_configured(tmp_path: Path):
+    from ratelimit import SharedTokenBucket
+
+    config = SimpleNamespace(token="token", rate_limit=5.0, shared_rate_limit_dir=tmp_path)
+
+    first = create_clients(config, ["default"])["default"]
+    second = create_clients(config, ["default"])["default"]
+
+    assert isinstance(first.client.rate_limiter, SharedTokenBucket)
+    assert first.client.rate_limiter.path == second.client.rate_limiter.path
+
+
+def test_close_clients_closes_each_shared_client_once():
+    config = SimpleNamespace(token="token", tokens={"default": "token", "guild": "guild-token"}, hedge_rate=0.1)
+    shared = create_clients(config, ["default", "guild"])
+    project = create_clients(config, ["default"], shared)
+    for account in shared.values():
+        account.client.session.close = MagicMock()
+
+    close_clients({**shared, "project": project["default"]})
+
+    for account in shared.values():
+        account.client.session.close.assert_called_once_with()
+        assert account.client.hedger._closed
+
+
+def test_create_clients_raises_for_unknown_aliases():
+    with pytest.raises(AvraeError, match="No token configured for alias\\(es\\): guild"):
+        create_clients(SimpleNamespace(token="token"), ["default", "guild"])
+
+
+def _collection_parser() -> MagicMock:
+    parser = MagicMock()
+    parser.collections = {Path("collections/cool"): "col-1"}
+    return parser
+
+
+def test_parse_collection_fetches_only_locked_items(stand_in, tmp_path: Path):
+    server = stand_in(
+        {"/workshop/alias/a2": {"success": True, "data": {"_id": "a2", "name": "sub", "parent_id": "a1", "code": "c"}}}
+    )
+    api = Avrae(SimpleNamespace(token="token", api_url=server.url))
+    api.lock = LockFile(
+        tmp_path / "avrae-lock.json",
+        {
+            "collections/cool/root/sub/sub.alias": LockEntry(
+                "alias", "a2", "sub", "col-1", "collections/cool/root/sub/sub.md", "a1", 3
+            ),
+            "collections/cool/root/root.alias": LockEntry(
+                "alias", "a1", "root", "col-1", "collections/cool/root/root.md"
+            ),
+        },
+    )
+
+    alias_outputs, snippet_outputs = api.parse_collection(
+        "col-1", _collection_parser(), {Path("collections/cool/root/sub/sub.md")}
+    )
+
+    assert server.requests == [("GET", "/workshop/alias/a2")]
+    [parsed] = alias_outputs.values()
+    assert (parsed.file_path, parsed.docs_path, parsed.data["code"]) == (
+        Path("collections/cool/root/sub/sub.alias"),
+        Path("collections/cool/root/sub/sub.md"),
+        "c",
+    )
+    assert snippet_outputs == {}
+
+
+def test_parse_collection_falls_back_to_full_and_refreshes_stale_lock(stand_in, tmp_path: Path):
+    server = stand_in(
+        {
+            "/workshop/alias/a1": {"success": True, "data": {"_id": "a1", "name": "renamed", "code": "c"}},
+            "/workshop/collection/col-1/full": {
+                "success": True,
+                "data": {
+                    "aliases": [
+                        {
+                            "_id": "a1",
+                            "name": "renamed",
+                            "code": "c",
+                            "subcommands": [],
+                            "versions": [{"version": 4, "is_current": True}],
+                        }
+                    ],
+                    "snippets": [],
+                },
+            },
+        }
+    )
+    api = Avrae(SimpleNamespace(token="token", api_url=server.url))
+    api.lock = LockFile(
+        tmp_path / "avrae-lock.json",
+        {
+            "collections/cool/root/root.alias": LockEntry(
+                "alias", "a1", "root", "col-1", "collections/cool/root/root.md"
+            )
+        },
+    )
+
+    alias_outputs, _ = api.parse_collection("col-1", _collection_parser(), {Path("collections/cool/root/root.alias")})
+    api.lock.save()
+
+    assert server.requests == [("GET", "/workshop/alias/a1"), ("GET", "/workshop/collection/col-1/full")]
+    assert list(alias_outputs) == [Path("collections/cool/renamed/renamed.alias")]
+    assert json.loads((tmp_path / "avrae-lock.json").read_text())["items"] == {
+        "collections/cool/renamed/renamed.alias": {
+            "type": "alias",
+            "id": "a1",
+            "name": "renamed",
+            "collection": "col-1",
+            "docs": "collections/cool/renamed/renamed.md",
+            "parent_id": None,
+            "version": 4,
+        }
+    }
+
+
+def test_parse_collection_uses_full_when_a_modified_item_is_not_locked(stand_in, tmp_path: Path):
+    server = stand_in({"/workshop/collection/col-1/full": {"success": True, "data": {"aliases": [], "snippets": []}}})
+    api = Avrae(SimpleNamespace(token="token", api_url=server.url))
+    api.lock = LockFile(tmp_path / "avrae-lock.json")
+
+    api.parse_collection("col-1", _collection_parser(), {Path("collections/cool/new/new.alias")})
+
+    assert server.requests == [("GET", "/workshop/collection/col-1/full")]
+
+
+def test_state_store_tracks_fetched_and_uploaded_content(stand_in, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.chdir(tmp_path)
+    server = stand_in(
+        {
+            "/workshop/collection/col-1/full": {
+                "success": True,
+                "data": {
+                    "aliases": [{"_id": "a1", "name": "root", "code": "code\r\n", "docs": "docs", "subcommands": []}],
+                    "snippets": [],
+                },
+            },
+            "/customizations/gvars/g1": {"key": "g1", "value": "old"},
+        }
+    )
+    state = StateStore(tmp_path / "state.sqlite3")
+    api = Avrae(SimpleNamespace(token="token", api_url=server.url), state=state)
+    gvar_path = Path("one.gvar")
+    gvar_path.write_text("new")
+
+    api.parse_collection("col-1", _collection_parser())
+    api.check_and_maybe_update_gvar(gvar_path, "g1")
+
+    assert [(row.path, row.kind, row.item_id, row.collection_id) for row in state.rows()] == [
+        (Path("collections/cool/root/root.alias"), "alias", "a1", "col-1"),
+        (Path("collections/cool/root/root.md"), "docs", "a1", "col-1"),
+        (gvar_path, "gvar", "g1", None),
+    ]
+    assert state.get(Path("collections/cool/root/root.alias")).remote_hash == content_hash("code")
+    assert state.get(gvar_path).remote_hash == content_hash("new")
+    state.close()
+
+
+def test_state_store_ignores_planned_uploads(api: Avrae, tmp_path: Path):
+    api.state = StateStore(tmp_path / "state.sqlite3")
+    api.planner = PlanRecorder()
+    gvar_path = tmp_path / "one.gvar"
+    gvar_path.write_text("new")
+
+    with patch.object(api, "get_gvar", return_value={"value": "old"}):
+        api.check_and_maybe_update_gvar(gvar_path, "g1")
+
+    assert api.state.get(gvar_path).remote_hash == content_hash("old")
+    api.state.close()
@@ -1,4 +1,5 @@
 import json
+import os
 from pathlib import Path
 from unittest.mock import patch
 
@@ -129,3 +130,343 @@ def test_load_config_raises_when_modified_files_is_not_a_list(tmp_path: Path, mo
             config.load_config()
         finally:
             monkeypatch.chdir(original_cwd)
+
+
+def test_load_config_allows_missing_modified_files_when_not_required(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    _write_default_maps(tmp_path)
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.delenv("INPUT_MODIFIED_FILES", raising=False)
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        config.load_config(require_modified_files=False)
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    assert config.modified_files is None
+
+
+def test_load_config_reads_optional_api_settings(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    _write_default_maps(tmp_path)
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_MODIFIED_FILES", json.dumps([]))
+    monkeypatch.setenv("INPUT_API_URL", "http://127.0.0.1:8000")
+    monkeypatch.setenv("INPUT_BULK_GVARS", "true")
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        config.load_config()
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    assert config.api_url == "http://127.0.0.1:8000"
+    assert config.bulk_gvars is True
+    # nothing is written to the workspace unless asked for
+    assert config.state_db is None
+
+
+@pytest.mark.parametrize("value", ["zero", "0"])
+def test_load_config_rejects_invalid_max_workers(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, value: str):
+    _write_default_maps(tmp_path)
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_MODIFIED_FILES", json.dumps([]))
+    monkeypatch.setenv("INPUT_MAX_WORKERS", value)
+
+    config = Config()
+    original_cwd = Path.cwd()
+    with pytest.raises(ValueError, match="Max workers"):
+        try:
+            config.load_config()
+        finally:
+            monkeypatch.chdir(original_cwd)
+
+
+def test_load_config_reads_normalization_rules(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    _write_default_maps(tmp_path)
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_MODIFIED_FILES", json.dumps([]))
+    monkeypatch.setenv("INPUT_NORMALIZE", "eol,trailing_whitespace")
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        config.load_config()
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    assert config.normalization == ("eol", "trailing_whitespace")
+
+
+def test_load_dotenv_skips_missing_files(tmp_path: Path):
+    from config import load_dotenv
+
+    assert load_dotenv(tmp_path / ".env") is False
+
+
+def test_load_dotenv_loads_existing_files(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    from config import load_dotenv
+
+    monkeypatch.delenv("AVRAE_DOTENV_TEST", raising=False)
+    (tmp_path / ".env").write_text("AVRAE_DOTENV_TEST=loaded\n")
+
+    assert load_dotenv(tmp_path / ".env") is True
+    assert os.environ["AVRAE_DOTENV_TEST"] == "loaded"
+    monkeypatch.delenv("AVRAE_DOTENV_TEST")
+
+
+def test_load_config_streams_modified_files_from_a_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    _write_default_maps(tmp_path)
+    (tmp_path / "modified.txt").write_text("collections/path.alias\nREADME\n")
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.delenv("INPUT_MODIFIED_FILES", raising=False)
+    monkeypatch.setenv("INPUT_MODIFIED_FILES_PATH", "modified.txt")
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        config.load_config()
+        streamed = list(config.iter_modified_files())
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    assert config.has_modified_files()
+    assert config.modified_files is None
+    assert streamed == ["collections/path.alias", "README"]
+
+
+def test_load_config_raises_when_modified_files_path_is_missing(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    _write_default_maps(tmp_path)
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_MODIFIED_FILES_PATH", "missing.txt")
+
+    config = Config()
+    original_cwd = Path.cwd()
+    with pytest.raises(FileNotFoundError, match="Modified files list"):
+        try:
+            config.load_config()
+        finally:
+            monkeypatch.chdir(original_cwd)
+
+
+def test_load_config_reads_diff_range_from_push_event(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    _write_default_maps(tmp_path)
+    event_path = tmp_path / "event.json"
+    event_path.write_text(json.dumps({"before": "abc", "after": "def"}))
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("GITHUB_EVENT_PATH", str(event_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_CHANGE_DETECTION", "git")
+    monkeypatch.delenv("INPUT_MODIFIED_FILES", raising=False)
+    monkeypatch.delenv("INPUT_BEFORE_SHA", raising=False)
+    monkeypatch.delenv("INPUT_AFTER_SHA", raising=False)
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        config.load_config()
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    assert config.has_modified_files()
+    assert (config.diff_base, config.diff_head) == ("abc", "def")
+
+
+def test_load_config_prefers_explicit_diff_range(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    _write_default_maps(tmp_path)
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.delenv("GITHUB_EVENT_PATH", raising=False)
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_CHANGE_DETECTION", "git")
+    monkeypatch.delenv("INPUT_BEFORE_SHA", raising=False)
+    monkeypatch.setenv("INPUT_AFTER_SHA", "main")
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        config.load_config()
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    assert (config.diff_base, config.diff_head) == ("main~1", "main")
+
+
+def test_load_config_reads_token_aliases_and_rate_limit(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    _write_default_maps(tmp_path)
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_AVRAE_TOKENS", json.dumps({"guild": "guild-token"}))
+    monkeypatch.setenv("INPUT_RATE_LIMIT", "2.5")
+    monkeypatch.delenv("INPUT_MODIFIED_FILES", raising=False)
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        config.load_config(require_modified_files=False)
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    assert config.tokens == {"default": "token", "guild": "guild-token"}
+    assert config.rate_limit == 2.5
+
+
+@pytest.mark.parametrize("tokens", ["not-json", json.dumps(["token"]), json.dumps({"guild": 3})])
+def test_load_config_rejects_invalid_token_aliases(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, tokens: str):
+    _write_default_maps(tmp_path)
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_AVRAE_TOKENS", tokens)
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        with pytest.raises(ValueError, match="Avrae tokens"):
+            config.load_config(require_modified_files=False)
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+
+def test_load_server_config_reads_repositories(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    (tmp_path / "one").mkdir()
+    monkeypatch.setenv("INPUT_SERVER_REPOS", json.dumps({"org/one": str(tmp_path / "one")}))
+    monkeypatch.setenv("INPUT_SERVER_PORT", "9000")
+    monkeypatch.setenv("INPUT_SERVER_WORKERS", "4")
+    monkeypatch.setenv("INPUT_WEBHOOK_SECRET", "secret")
+    monkeypatch.setenv("INPUT_SERVER_BRANCH", "release")
+
+    config = Config()
+    config.load_server_config()
+
+    assert config.server_repos == {"org/one": (tmp_path / "one").resolve()}
+    assert (config.server_port, config.server_workers, config.webhook_secret) == (9000, 4, "secret")
+    assert config.server_branch == "release"
+
+
+@pytest.mark.parametrize("repos", ["", "not-json", json.dumps(["org/one"]), json.dumps({"org/one": "missing"})])
+def test_load_server_config_rejects_invalid_repositories(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, repos: str):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("INPUT_SERVER_REPOS", repos)
+
+    with pytest.raises((ValueError, FileNotFoundError)):
+        Config().load_server_config()
+
+
+@pytest.mark.parametrize("value", ["lots", "-1"])
+def test_load_config_rejects_invalid_payload_cache_size(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, value: str):
+    _write_default_maps(tmp_path)
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_PAYLOAD_CACHE_MB", value)
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        with pytest.raises(ValueError, match="Payload cache size"):
+            config.load_config(require_modified_files=False)
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+
+@pytest.mark.parametrize("value", ["often", "1.5"])
+def test_load_config_rejects_invalid_hedge_rate(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, value: str):
+    _write_default_maps(tmp_path)
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_HEDGE_RATE", value)
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        with pytest.raises(ValueError, match="Hedge rate"):
+            config.load_config(require_modified_files=False)
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+
+@pytest.mark.parametrize("value", ["soon", "0"])
+def test_load_config_rejects_invalid_hedge_delay(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, value: str):
+    _write_default_maps(tmp_path)
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_HEDGE_AFTER_MS", value)
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        with pytest.raises(ValueError, match="Hedge delay"):
+            config.load_config(require_modified_files=False)
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+
+def test_load_config_reads_projects(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    for name in ("one", "two"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "collections.json").write_text("{}")
+        (tmp_path / name / "gvars.json").write_text("{}")
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv(
+        "INPUT_PROJECTS",
+        json.dumps(
+            [
+                ["one/collections.json", "one/gvars.json"],
+                {"name": "second", "collections": "two/collections.json", "gvars": "two/gvars.json"},
+            ]
+        ),
+    )
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        config.load_config(require_modified_files=False)
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    assert [project.name for project in config.projects] == ["one", "second"]
+    narrowed = config.for_project(config.projects[1])
+    assert narrowed.collections_file_path == "two/collections.json"
+    assert narrowed.lock_file == Path("two/avrae-lock.json")
+    assert narrowed.cache_dir == Path(".avrae-cache/second")
+    assert narrowed.projects == [] and config.collections_file_path == "collections.json"
+
+
+@pytest.mark.parametrize(
+    "projects",
+    ["not-json", "[]", json.dumps([["a.json"]]), json.dumps([["a.json", "b.json"], ["a.json", "c.json"]])],
+)
+def test_load_config_rejects_invalid_projects(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, projects: str):
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_PROJECTS", projects)
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        with pytest.raises(ValueError, match="[Pp]roject"):
+            config.load_config(require_modified_files=False)
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+
+def test_load_config_requires_a_rate_limit_for_a_shared_budget(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    _write_default_maps(tmp_path)
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.delenv("INPUT_RATE_LIMIT", raising=False)
+    monkeypatch.setenv("INPUT_SHARED_RATE_LIMIT_DIR", str(tmp_path / "buckets"))
+
+    config = Config()
+    original_cwd = Path.cwd()
+    try:
+        with pytest.raises(ValueError, match="rate_limit"):
+            config.load_config(require_modified_files=False)
+    finally:
+        monkeypatch.chdir(original_cwd)
@@ -0,0 +1,95 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from gitdiff import GitDiffError, iter_changed_files, parse_name_status
+
+
+def _git(repo: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=repo,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def _commit(repo: Path, message: str) -> str:
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "--allow-empty", "-m", message)
+    return _git(repo, "rev-parse", "HEAD")
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Path:
+    _git(tmp_path, "init", "-q")
+    (tmp_path / "collections" / "cool" / "old").mkdir(parents=True)
+    (tmp_path / "collections" / "cool" / "old" / "old.alias").write_text("alias code\n" * 20)
+    (tmp_path / "collections" / "cool" / "gone.snippet").write_text("snippet")
+    (tmp_path / "gvars").mkdir()
+    (tmp_path / "gvars" / "one.gvar").write_text("one")
+    (tmp_path / "README.md").write_text("readme")
+    return tmp_path
+
+
+def test_parse_name_status_keeps_new_paths_of_renames_and_drops_deletions():
+    fields = [
+        "M",
+        "a.alias",
+        "R097",
+        "old.alias",
+        "new.alias",
+        "D",
+        "gone.md",
+        "C100",
+        "src.md",
+        "copy.md",
+        "A",
+        "b.md",
+    ]
+
+    assert list(parse_name_status(fields)) == ["a.alias", "new.alias", "copy.md", "b.md"]
+
+
+def test_iter_changed_files_follows_renames_within_roots(repo: Path):
+    before = _commit(repo, "initial")
+    (repo / "collections" / "cool" / "new").mkdir()
+    (repo / "collections" / "cool" / "old" / "old.alias").rename(repo / "collections" / "cool" / "new" / "new.alias")
+    (repo / "collections" / "cool" / "gone.snippet").unlink()
+    (repo / "gvars" / "one.gvar").write_text("changed")
+    (repo / "README.md").write_text("outside the roots")
+    after = _commit(repo, "rename")
+
+    changed = list(iter_changed_files(before, after, [Path("collections/cool"), Path("gvars/one.gvar")], cwd=repo))
+
+    assert sorted(changed) == ["collections/cool/new/new.alias", "gvars/one.gvar"]
+
+
+def test_iter_changed_files_spans_many_commits_in_one_diff(repo: Path):
+    before = _commit(repo, "initial")
+    for index in range(5):
+        (repo / "gvars" / "one.gvar").write_text(f"value {index}")
+        _commit(repo, f"change {index}")
+
+    assert list(iter_changed_files(before, "HEAD", [Path("gvars")], cwd=repo)) == ["gvars/one.gvar"]
+
+
+def test_iter_changed_files_treats_zero_sha_as_new_branch(repo: Path):
+    after = _commit(repo, "initial")
+
+    changed = list(iter_changed_files("0" * 40, after, [Path("gvars")], cwd=repo))
+
+    assert changed == ["gvars/one.gvar"]
+
+
+def test_iter_changed_files_without_roots_runs_nothing(repo: Path):
+    assert list(iter_changed_files("HEAD~1", "HEAD", [], cwd=repo)) == []
+
+
+def test_iter_changed_files_raises_for_unknown_commits(repo: Path):
+    _commit(repo, "initial")
+
+    with pytest.raises(GitDiffError, match="fetch-depth"):
+        list(iter_changed_files("f" * 40, "HEAD", [Path("gvars")], cwd=repo))
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from gvarbuild import GVAR_INDEX_FORMAT, GvarBuildError, build_gvar, minify_json, split_data
+
+
+def test_minify_json_drops_whitespace_and_keeps_key_order():
+    assert minify_json('{\n  "b": [1, 2],\n  "a": "caf\\u00e9"\n}\n') == '{"b":[1,2],"a":"café"}'
+
+
+def test_minify_json_leaves_non_structured_values_alone():
+    assert minify_json("  plain text  ") == "  plain text  "
+    assert minify_json(' "a json string" ') == ' "a json string" '
+
+
+def test_split_data_packs_members_into_valid_json_shards():
+    data = json.dumps({f"key{index}": "x" * 10 for index in range(10)})
+
+    data_type, shards = split_data(data, limit=60)
+
+    assert data_type == "dict"
+    assert all(len(shard) <= 60 for shard in shards)
+    merged = {}
+    for shard in shards:
+        merged.update(json.loads(shard))
+    assert merged == json.loads(data)
+
+
+def test_split_data_falls_back_to_text_slices_for_oversized_members():
+    data = json.dumps(["x" * 50, "y"])
+
+    data_type, shards = split_data(data, limit=20)
+
+    assert data_type == "text"
+    assert "".join(shards) == minify_json(data)
+    assert all(len(shard) <= 20 for shard in shards)
+
+
+def test_build_gvar_without_shards_only_minifies():
+    assert build_gvar("[1, 2]", "g1") == {"g1": "[1,2]"}
+
+
+def test_build_gvar_writes_shards_before_their_index():
+    values = build_gvar(json.dumps(list(range(30))), "g1", ["s1", "s2", "s3", "s4"], limit=40)
+
+    *shard_ids, index_id = values
+    assert index_id == "g1"
+    assert json.loads(values["g1"]) == {"format": GVAR_INDEX_FORMAT, "type": "list", "shards": shard_ids}
+    assert [item for shard_id in shard_ids for item in json.loads(values[shard_id])] == list(range(30))
+
+
+def test_build_gvar_raises_when_too_few_shards_are_configured():
+    with pytest.raises(GvarBuildError, match="needs 3 shard GVARs but only 1"):
+        build_gvar("x" * 25, "g1", ["s1"], limit=10)
@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+from hedging import Hedger, percentile
+
+
+def _warm(hedger: Hedger, samples: int = 20) -> None:
+    for _ in range(samples):
+        hedger.send(lambda: "fast")
+
+
+def test_percentile_uses_nearest_rank():
+    assert percentile([], 95) is None
+    assert percentile(range(1, 101), 95) == 95
+    assert percentile([3, 1, 2], 99) == 3
+
+
+def test_hedger_waits_for_enough_samples_before_hedging():
+    hedger = Hedger(max_rate=1.0, min_samples=3)
+
+    assert hedger.threshold() is None
+    _warm(hedger, 3)
+
+    assert hedger.threshold() is not None
+    assert (hedger.requests, hedger.hedges) == (3, 0)
+
+
+def test_hedger_uses_the_hedge_when_the_first_request_stalls():
+    hedger = Hedger(max_rate=1.0)
+    _warm(hedger)
+    release = threading.Event()
+
+    def stalled():
+        release.wait(timeout=5)
+        return "slow"
+
+    try:
+        assert hedger.send(stalled, lambda: "hedged") == "hedged"
+    finally:
+        release.set()
+
+    assert (hedger.hedges, hedger.hedge_wins) == (1, 1)
+    assert "1 of 21 GET(s) hedged, 1 won by the hedge; p99" in hedger.summary()
+
+
+def test_hedger_caps_the_share_of_hedged_requests():
+    hedger = Hedger(max_rate=0.05)
+    _warm(hedger)
+    hedge_calls = []
+    release = threading.Event()
+
+    def stalled():
+        release.wait(timeout=0.05)
+        return "slow"
+
+    def hedge():
+        hedge_calls.append(1)
+        return "hedged"
+
+    results = [hedger.send(stalled, hedge) for _ in range(3)]
+
+    # 23 requests at 5%, plus the burst, allow two hedges
+    assert results == ["hedged", "hedged", "slow"]
+    assert (hedger.hedges, len(hedge_calls)) == (2, 2)
+
+
+def test_hedger_hedges_the_first_request_after_the_floor():
+    hedger = Hedger(max_rate=0.05, floor=0.01)
+    release = threading.Event()
+
+    def stalled():
+        release.wait(timeout=5)
+        return "slow"
+
+    try:
+        assert hedger.send(stalled, lambda: "hedged") == "hedged"
+    finally:
+        release.set()
+
+    assert (hedger.requests, hedger.hedges) == (1, 1)
+
+
+def test_hedger_never_hedges_sooner_than_the_floor():
+    hedger = Hedger(max_rate=1.0, floor=0.5, min_samples=3)
+    _warm(hedger, 3)
+
+    assert hedger.threshold() == 0.5
+
+
+def test_closed_hedger_runs_requests_unhedged():
+    hedger = Hedger(max_rate=1.0, floor=0.01)
+    hedger.close()
+    hedge_calls = []
+
+    def slow():
+        threading.Event().wait(0.05)
+        return "slow"
+
+    assert hedger.send(slow, lambda: hedge_calls.append(1)) == "slow"
+    assert (hedger.hedges, hedge_calls) == (0, [])
+
+
+def test_hedger_reports_the_first_requests_error_when_both_fail():
+    hedger = Hedger(max_rate=1.0)
+    _warm(hedger)
+
+    def failing(message: str, delay: float):
+        def send():
+            threading.Event().wait(delay)
+            raise OSError(message)
+
+        return send
+
+    with pytest.raises(OSError, match="primary"):
+        hedger.send(failing("primary", 0.05), failing("hedge", 0))
@@ -0,0 +1,72 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from includes import IncludeError, IncludeGraph, expand_includes
+
+
+@pytest.fixture
+def workspace(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "fragments").mkdir()
+    (tmp_path / "collections" / "cool" / "a").mkdir(parents=True)
+    (tmp_path / "fragments" / "args.drac").write_text('args = &ARGS&\n#include "parse.drac"\n')
+    (tmp_path / "fragments" / "parse.drac").write_text("if args:\n    target = args[0]\n")
+    return tmp_path
+
+
+def test_expand_includes_indents_nested_fragments(workspace: Path):
+    source = Path("collections/cool/a/a.alias")
+    fragments = set()
+
+    expanded = expand_includes(source, '<drac2>\nif True:\n    #include "/fragments/args.drac"\n</drac2>', fragments)
+
+    assert expanded == ("<drac2>\nif True:\n    args = &ARGS&\n    if args:\n        target = args[0]\n</drac2>")
+    assert fragments == {Path("fragments/args.drac"), Path("fragments/parse.drac")}
+
+
+def test_expand_includes_resolves_paths_relative_to_the_including_file(workspace: Path):
+    text = '#include "../../../fragments/parse.drac"'
+
+    assert expand_includes(Path("collections/cool/a/a.alias"), text) == "if args:\n    target = args[0]"
+
+
+def test_expand_includes_rejects_missing_fragments_and_cycles(workspace: Path):
+    with pytest.raises(IncludeError, match="missing fragment fragments/nope.drac"):
+        expand_includes(Path("a.alias"), '#include "/fragments/nope.drac"')
+
+    (workspace / "fragments" / "parse.drac").write_text('#include "args.drac"')
+    with pytest.raises(IncludeError, match="cycle"):
+        expand_includes(Path("a.alias"), '#include "/fragments/args.drac"')
+
+
+def test_include_graph_maps_fragments_to_dependents_and_persists(workspace: Path):
+    graph_path = workspace / "cache" / "includes.json"
+    graph = IncludeGraph(graph_path)
+    graph.expand(Path("collections/cool/a/a.alias"), '#include "/fragments/args.drac"')
+    graph.expand(Path("collections/cool/b.snippet"), '#include "/fragments/parse.drac"')
+    graph.save()
+
+    loaded = IncludeGraph.load(graph_path, [])
+
+    assert loaded.dependents(Path("fragments/parse.drac")) == [
+        Path("collections/cool/a/a.alias"),
+        Path("collections/cool/b.snippet"),
+    ]
+    assert loaded.dependents(Path("fragments/args.drac")) == [Path("collections/cool/a/a.alias")]
+    loaded.expand(Path("collections/cool/b.snippet"), "no includes any more")
+    assert loaded.fragments() == [Path("fragments/args.drac"), Path("fragments/parse.drac")]
+    assert loaded.dependents(Path("fragments/parse.drac")) == [Path("collections/cool/a/a.alias")]
+
+
+def test_include_graph_scans_sources_when_nothing_is_persisted(workspace: Path):
+    alias = workspace / "collections" / "cool" / "a" / "a.alias"
+    alias.write_text('#include "/fragments/parse.drac"')
+    graph_path = workspace / "includes.json"
+
+    graph = IncludeGraph.load(graph_path, [Path("collections/cool")])
+    graph.save()
+
+    assert graph.dependents(Path("fragments/parse.drac")) == [Path("collections/cool/a/a.alias")]
+    assert json.loads(graph_path.read_text()) == {"collections/cool/a/a.alias": ["fragments/parse.drac"]}
@@ -0,0 +1,86 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from lockfile import LockEntry, LockFile, active_version
+
+
+def _entry(**overrides) -> LockEntry:
+    fields = dict(type="alias", id="a1", name="root", collection="col-1", docs="collections/cool/root/root.md")
+    fields.update(overrides)
+    return LockEntry(**fields)
+
+
+def test_lockfile_round_trips_and_records_versions(tmp_path: Path):
+    path = tmp_path / "avrae-lock.json"
+    lock = LockFile(path)
+    lock.replace_collection("col-1", [(Path("collections/cool/root/root.alias"), _entry())])
+    lock.record_version(Path("collections/cool/root/root.alias"), 5)
+    lock.record_version(Path("collections/cool/root/root.alias"), {"$planned_version": 0})
+    lock.save()
+
+    loaded = LockFile.load(path)
+
+    assert loaded.get(Path("collections/cool/root/root.alias")) == _entry(version=5)
+    assert json.loads(path.read_text())["version"] == 1
+
+
+def test_lockfile_with_a_root_stores_paths_relative_to_it(tmp_path: Path):
+    path = tmp_path / "avrae-lock.json"
+    lock = LockFile(path, root=tmp_path)
+    alias = tmp_path / "collections/cool/root/root.alias"
+    lock.replace_collection("col-1", [(alias, _entry(docs=(tmp_path / "collections/cool/root/root.md").as_posix()))])
+    lock.save()
+
+    assert list(json.loads(path.read_text())["items"]) == ["collections/cool/root/root.alias"]
+    assert json.loads(path.read_text())["items"]["collections/cool/root/root.alias"]["docs"] == (
+        "collections/cool/root/root.md"
+    )
+    loaded = LockFile.load(path, tmp_path)
+    assert loaded.get(alias) == _entry()
+    assert loaded.entries_for("col-1") == {alias: _entry(docs=(tmp_path / "collections/cool/root/root.md").as_posix())}
+
+
+def test_replace_collection_only_touches_that_collection(tmp_path: Path):
+    lock = LockFile(
+        tmp_path / "avrae-lock.json",
+        {"a.alias": _entry(), "b.alias": _entry(id="b1", collection="col-2")},
+    )
+
+    lock.replace_collection("col-1", [(Path("c.alias"), _entry(id="c1"))])
+
+    assert lock.entries_for("col-1") == {Path("c.alias"): _entry(id="c1")}
+    assert lock.entries_for("col-2") == {Path("b.alias"): _entry(id="b1", collection="col-2")}
+
+
+def test_missing_paths_ignores_unrelated_files(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.chdir(tmp_path)
+    Path("collections/cool/new").mkdir(parents=True)
+    Path("collections/cool/new/new.alias").write_text("")
+    lock = LockFile(Path("avrae-lock.json"), {"collections/cool/root/root.alias": _entry()})
+
+    missing = lock.missing_paths(
+        Path("collections/cool"),
+        [
+            Path("collections/cool/root/root.alias"),
+            Path("collections/cool/root/root.md"),
+            Path("collections/cool/README.md"),
+            Path("collections/cool/new/new.md"),
+            Path("collections/other/x.alias"),
+        ],
+    )
+
+    assert missing == [Path("collections/cool/new/new.md")]
+
+
+def test_load_ignores_unreadable_lockfiles(tmp_path: Path):
+    path = tmp_path / "avrae-lock.json"
+    path.write_text('{"items": {"a.alias": {"unexpected": 1}}}')
+
+    assert LockFile.load(path).entries_for("col-1") == {}
+
+
+def test_active_version_reads_current_version():
+    assert active_version({"versions": [{"version": 1}, {"version": 2, "is_current": True}]}) == 2
+    assert active_version({}) is None
@@ -1,4 +1,7 @@
+import json
 import logging
+import subprocess
+import sys
 from pathlib import Path
 from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
@@ -7,6 +10,7 @@ import pytest
 
 import main
 from parsing import ConnectedFile
+from preflight import PreflightError
 
 
 def test_topic_formatter_adds_uppercase_topic():
@@ -28,12 +32,13 @@ def test_setup_logging_configures_root_logger():
     assert len(kwargs["handlers"]) == 1
 
 
-def test_update_collections_updates_aliases_and_snippets():
+def test_collection_jobs_queues_modified_aliases_snippets_and_docs():
     parser = MagicMock()
     parser.collections = {Path("collections/cool"): "col-1"}
+    parser.token_alias.return_value = "default"
     avrae = MagicMock()
-    parsed_alias = SimpleNamespace(docs_path=Path("collections/cool/root/root.md"))
-    parsed_snippet = SimpleNamespace(docs_path=Path("collections/cool/spell.md"))
+    parsed_alias = SimpleNamespace(data={"_id": "a1"}, docs_path=Path("collections/cool/root/root.md"))
+    parsed_snippet = SimpleNamespace(data={"_id": "s1"}, docs_path=Path("collections/cool/spell.md"))
     avrae.parse_collection.return_value = (
         {Path("collections/cool/root/root.alias"): parsed_alias},
         {Path("collections/cool/spell.snippet"): parsed_snippet},
@@ -42,21 +47,122 @@ def test_update_collections_updates_aliases_and_snippets():
         Path("collections/cool/root/root.alias"),
         Path("collections/cool/root/root.md"),
         Path("collections/cool/spell.snippet"),
-        Path("collections/cool/spell.md"),
     }
 
-    main.update_collections(avrae, parser, modified_paths)
+    jobs = main.collection_jobs(avrae, parser, modified_paths)
 
-    avrae.parse_collection.assert_called_once_with("col-1", parser)
+    avrae.parse_collection.assert_called_once_with("col-1", parser, modified_paths)
+    assert [(job.kind, job.path, job.target_id) for job in jobs] == [
+        ("code", Path("collections/cool/root/root.alias"), "a1"),
+        ("docs", Path("collections/cool/root/root.md"), "a1"),
+        ("code", Path("collections/cool/spell.snippet"), "s1"),
+    ]
+    for job in jobs:
+        job.action()
     avrae.check_and_maybe_update.assert_any_call("alias", parsed_alias)
-    avrae.check_and_maybe_update_docs.assert_any_call("alias", parsed_alias)
+    avrae.check_and_maybe_update_docs.assert_called_once_with("alias", parsed_alias)
     avrae.check_and_maybe_update.assert_any_call("snippet", parsed_snippet)
-    avrae.check_and_maybe_update_docs.assert_any_call("snippet", parsed_snippet)
+
+
+def test_gvar_jobs_only_queues_modified_gvars():
+    parser = MagicMock()
+    parser.gvars = {Path("gvars/one.gvar"): "g1", Path("gvars/two.gvar"): "g2"}
+    parser.token_alias.return_value = "default"
+    avrae = MagicMock()
+
+    [job] = main.gvar_jobs(avrae, parser, {Path("gvars/two.gvar")})
+    job.action()
+
+    assert (job.kind, job.target_id) == ("gvar", "g2")
+    avrae.check_and_maybe_update_gvar.assert_called_once_with(Path("gvars/two.gvar"), "g2")
+
+
+def test_sync_updates_gvars_before_the_code_that_loads_them():
+    parser = MagicMock()
+    parser.collections = {Path("collections/cool"): "col-1"}
+    parser.gvars = {Path("gvars/one.gvar"): "g1"}
+    parser.token_alias.return_value = "default"
+    parsed_alias = SimpleNamespace(data={"_id": "a1"}, docs_path=Path("collections/cool/root/root.md"))
+    calls = []
+    avrae = MagicMock()
+    avrae.parse_collection.return_value = ({Path("collections/cool/root/root.alias"): parsed_alias}, {})
+    avrae.local_code.return_value = "<drac2>data = load_json(get_gvar('g1'))</drac2>"
+    avrae.check_and_maybe_update.side_effect = lambda *args: calls.append("code")
+    avrae.check_and_maybe_update_gvar.side_effect = lambda *args: calls.append("gvar")
+
+    main.sync(avrae, parser, {Path("collections/cool/root/root.alias"), Path("gvars/one.gvar")}, max_workers=4)
+
+    assert calls == ["gvar", "code"]
+
+
+def test_sync_updates_gvars_loaded_only_through_an_include_first(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    from api import Avrae
+    from includes import IncludeGraph
+
+    monkeypatch.chdir(tmp_path)
+    alias_path = Path("collections/cool/root/root.alias")
+    alias_path.parent.mkdir(parents=True)
+    alias_path.write_text('<drac2>\n#include "/fragments/data.drac"\n</drac2>')
+    Path("fragments").mkdir()
+    Path("fragments/data.drac").write_text("data = load_json(get_gvar('g1'))")
+    parser = MagicMock()
+    parser.collections = {Path("collections/cool"): "col-1"}
+    parser.gvars = {Path("gvars/one.gvar"): "g1"}
+    parser.token_alias.return_value = "default"
+    parser.includes = IncludeGraph()
+    parsed_alias = SimpleNamespace(data={"_id": "a1"}, docs_path=Path("collections/cool/root/root.md"))
+    calls = []
+    avrae = Avrae(SimpleNamespace(token="token"))
+    avrae.parse_collection = MagicMock(return_value=({alias_path: parsed_alias}, {}))
+    avrae.check_and_maybe_update = MagicMock(side_effect=lambda *args: calls.append("code"))
+    avrae.check_and_maybe_update_gvar = MagicMock(side_effect=lambda *args: calls.append("gvar"))
+
+    main.sync(avrae, parser, {alias_path, Path("gvars/one.gvar")}, max_workers=4)
+
+    assert calls == ["gvar", "code"]
+
+
+def test_sync_stops_before_any_request_when_preflight_fails():
+    parser = MagicMock()
+    parser.collections = {Path("collections/cool"): "col-1"}
+    avrae = MagicMock()
+    preflight = MagicMock()
+    preflight.check.side_effect = PreflightError("1 file(s) would be rejected by Avrae")
+
+    with pytest.raises(PreflightError):
+        main.sync(avrae, parser, {Path("collections/cool/root/root.alias")}, preflight=preflight)
+
+    avrae.parse_collection.assert_not_called()
+
+
+def test_sync_sends_each_path_through_its_own_account():
+    parser = MagicMock()
+    parser.collections = {}
+    parser.gvars = {Path("gvars/mine.gvar"): "g1", Path("gvars/guild.gvar"): "g2"}
+    parser.token_alias.side_effect = lambda path: "guild" if path.name == "guild.gvar" else "default"
+    accounts = {"default": MagicMock(), "guild": MagicMock()}
+    for account in accounts.values():
+        account.local_code.return_value = ""
+        account.stats = {"uploads_avoided": 0}
+
+    with patch("main.run_prioritized") as mock_run:
+        main.sync(accounts, parser, {Path("gvars/mine.gvar"), Path("gvars/guild.gvar")}, max_workers=3)
+        for job in mock_run.call_args.args[0]:
+            job.action()
+
+    assert mock_run.call_args.args[1] == 6
+    accounts["default"].check_and_maybe_update_gvar.assert_called_once_with(Path("gvars/mine.gvar"), "g1")
+    accounts["guild"].check_and_maybe_update_gvar.assert_called_once_with(Path("gvars/guild.gvar"), "g2")
+    for account in accounts.values():
+        account.save_caches.assert_called_once_with()
 
 
 def test_run_exits_when_modified_files_is_none():
     config = MagicMock()
-    config.modified_files = None
+    config.trace_file = None
+    config.preflight = False
+    config.projects = []
+    config.has_modified_files.return_value = False
 
     with (
         patch("main.Config", return_value=config),
@@ -70,29 +176,38 @@ def test_run_exits_when_modified_files_is_none():
 
 def test_run_exits_when_no_relevant_modified_files():
     config = MagicMock()
-    config.modified_files = ["README.md"]
+    config.trace_file = None
+    config.preflight = True
+    config.projects = []
+    config.iter_modified_files.return_value = iter(["notes.txt", "src/app.py"])
 
     with (
         patch("main.Config", return_value=config),
-        patch("main.utils.parse_paths", return_value=[]),
+        patch("main.create_check_pool") as mock_pool,
         patch("main.exit", side_effect=SystemExit(0)) as mock_exit,
     ):
         with pytest.raises(SystemExit):
             main.run()
 
     mock_exit.assert_called_once_with(0)
+    # nothing to check, so no check pool is started
+    mock_pool.assert_not_called()
 
 
 def test_run_exits_when_no_connected_files():
     config = MagicMock()
-    config.modified_files = ["spell.alias"]
+    config.trace_file = None
+    config.preflight = False
+    config.projects = []
+    config.iter_modified_files.return_value = iter(["spell.alias", "notes.txt"])
     parser = MagicMock()
     parser.connected_files = []
+    consumed = []
+    parser.find_connected_files.side_effect = lambda files: consumed.extend(files)
 
     with (
         patch("main.Config", return_value=config),
-        patch("main.utils.parse_paths", return_value=[Path("spell.alias")]),
-        patch("main.Parser", return_value=parser),
+        patch("parsing.Parser", return_value=parser),
         patch("main.exit", side_effect=SystemExit(0)) as mock_exit,
     ):
         with pytest.raises(SystemExit):
@@ -100,13 +215,17 @@ def test_run_exits_when_no_connected_files():
 
     parser.load_collections.assert_called_once_with()
     parser.load_gvars.assert_called_once_with()
-    parser.find_connected_files.assert_called_once_with([Path("spell.alias")])
+    parser.find_connected_files.assert_called_once()
+    assert consumed == [Path("spell.alias")]
     mock_exit.assert_called_once_with(0)
 
 
-def test_run_updates_aliases_docs_snippets_and_gvars():
+def test_run_syncs_aliases_docs_snippets_and_gvars():
     config = MagicMock()
-    config.modified_files = ["items"]
+    config.trace_file = None
+    config.projects = []
+    config.iter_modified_files.return_value = iter(["collections/cool/root/root.alias"])
+    config.preflight = False
     parser = MagicMock()
     parser.collections = {Path("collections/cool"): "col-1"}
     parser.gvars = {Path("gvars/one.gvar"): "g1"}
@@ -142,15 +261,14 @@ def test_run_updates_aliases_docs_snippets_and_gvars():
     with (
         patch("main.Config", return_value=config),
         patch.object(config, "load_config"),
-        patch("main.utils.parse_paths", return_value=[Path("items")]),
-        patch("main.Parser", return_value=parser),
-        patch("main.Avrae", return_value=avrae),
-        patch("main.update_collections") as mock_update_collections,
+        patch("parsing.Parser", return_value=parser),
+        patch("api.create_clients", return_value={"default": avrae}),
+        patch("main.sync") as mock_sync,
     ):
         main.run()
 
-    mock_update_collections.assert_called_once_with(
-        avrae,
+    mock_sync.assert_called_once_with(
+        {"default": avrae},
         parser,
         {
             Path("collections/cool/root/root.alias"),
@@ -159,5 +277,246 @@ def test_run_updates_aliases_docs_snippets_and_gvars():
             Path("collections/cool/spell.md"),
             Path("gvars/one.gvar"),
         },
+        config.max_workers,
+        None,
+    )
+
+
+def test_importing_main_does_not_import_http_dependencies():
+    src = Path(main.__file__).resolve().parent
+    script = (
+        f"import sys; sys.path.insert(0, {str(src)!r}); import main; "
+        "print(sorted(m for m in ('requests', 'dotenv', 'api') if m in sys.modules))"
+    )
+
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "[]"
+
+
+def test_run_detects_changes_with_git_under_configured_roots():
+    config = MagicMock()
+    config.trace_file = None
+    config.preflight = False
+    config.projects = []
+    config.change_detection = "git"
+    config.diff_base, config.diff_head = "abc", "def"
+    parser = MagicMock()
+    parser.connected_files = []
+    parser.source_roots.return_value = [Path("collections/cool")]
+    parser.includes.fragments.return_value = [Path("fragments/common.drac")]
+    consumed = []
+    parser.find_connected_files.side_effect = lambda files: consumed.extend(files)
+
+    with (
+        patch("main.Config", return_value=config),
+        patch("parsing.Parser", return_value=parser),
+        patch("main.gitdiff.iter_changed_files", return_value=iter(["collections/cool/a/a.alias"])) as mock_diff,
+        patch("main.exit", side_effect=SystemExit(0)),
+    ):
+        with pytest.raises(SystemExit):
+            main.run()
+
+    mock_diff.assert_called_once_with("abc", "def", [Path("collections/cool"), Path("fragments/common.drac")])
+    config.iter_modified_files.assert_not_called()
+    parser.load_collections.assert_called_once_with()
+    assert consumed == [Path("collections/cool/a/a.alias")]
+
+
+def test_plan_saves_operations_without_writing(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    (tmp_path / "gvars").mkdir()
+    (tmp_path / "gvars" / "one.gvar").write_text("new value")
+    (tmp_path / "collections.json").write_text("{}")
+    (tmp_path / "gvars.json").write_text('{"gvars/one.gvar": "g1"}')
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_MODIFIED_FILES", '["gvars/one.gvar"]')
+    monkeypatch.setenv("INPUT_PLAN_FILE", "plan.json")
+    requests_sent = []
+
+    def fake_request(method, url, **kwargs):
+        requests_sent.append((method, url))
+        return SimpleNamespace(status_code=200, text='{"value": "old value"}', json=lambda: {"value": "old value"})
+
+    original_cwd = Path.cwd()
+    try:
+        with patch("api.Session.request", side_effect=fake_request):
+            main.plan()
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    assert requests_sent == [("get", "https://api.avrae.io/customizations/gvars/g1")]
+    saved = json.loads((tmp_path / "plan.json").read_text())
+    assert saved["summary"]["requests"] == {"POST": 1}
+    assert saved["operations"][0]["request_data"] == {"value": "new value"}
+
+
+def test_run_syncs_every_project_through_one_shared_session(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    for name, value in (("a", "new a"), ("b", "new b"), ("c", "same")):
+        (tmp_path / name / "gvars").mkdir(parents=True)
+        (tmp_path / name / "gvars" / "one.gvar").write_text(value)
+        (tmp_path / name / "collections.json").write_text("{}")
+        (tmp_path / name / "gvars.json").write_text(json.dumps({f"{name}/gvars/one.gvar": f"g-{name}"}))
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_PREFLIGHT", "false")
+    monkeypatch.setenv(
+        "INPUT_PROJECTS",
+        json.dumps([[f"{name}/collections.json", f"{name}/gvars.json"] for name in ("a", "b", "c")]),
+    )
+    monkeypatch.setenv("INPUT_MODIFIED_FILES", '["a/gvars/one.gvar", "b/gvars/one.gvar"]')
+    sessions = set()
+    requests_sent = []
+
+    def fake_request(self, method, url, **kwargs):
+        sessions.add(id(self))
+        requests_sent.append((method, url.rsplit("/", 1)[1]))
+        if method == "post":
+            return SimpleNamespace(status_code=200, text="Gvar updated.")
+        return SimpleNamespace(status_code=200, text="", json=lambda: {"value": "old"})
+
+    original_cwd = Path.cwd()
+    try:
+        with patch("api.Session.request", autospec=True, side_effect=fake_request):
+            main.run()
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    assert sorted(requests_sent) == [("get", "g-a"), ("get", "g-b"), ("post", "g-a"), ("post", "g-b")]
+    assert len(sessions) == 1
+
+
+def test_run_checks_every_project_through_the_preflight_process_pool(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    for name in ("a", "b"):
+        (tmp_path / name / "gvars").mkdir(parents=True)
+        for gvar in ("one", "two"):
+            (tmp_path / name / "gvars" / f"{gvar}.gvar").write_text(f"new {name} {gvar}")
+        (tmp_path / name / "collections.json").write_text("{}")
+        (tmp_path / name / "gvars.json").write_text(
+            json.dumps({f"{name}/gvars/{gvar}.gvar": f"g-{name}-{gvar}" for gvar in ("one", "two")})
+        )
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_MAX_WORKERS", "2")
+    monkeypatch.setenv(
+        "INPUT_PROJECTS", json.dumps([[f"{name}/collections.json", f"{name}/gvars.json"] for name in ("a", "b")])
+    )
+    monkeypatch.setenv(
+        "INPUT_MODIFIED_FILES",
+        json.dumps([f"{name}/gvars/{gvar}.gvar" for name in ("a", "b") for gvar in ("one", "two")]),
+    )
+    posted = []
+
+    def fake_request(self, method, url, **kwargs):
+        if method == "post":
+            posted.append(url.rsplit("/", 1)[1])
+            return SimpleNamespace(status_code=200, text="Gvar updated.")
+        return SimpleNamespace(status_code=200, text="", json=lambda: {"value": "old"})
+
+    original_cwd = Path.cwd()
+    try:
+        with patch("api.Session.request", autospec=True, side_effect=fake_request):
+            main.run()
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    assert sorted(posted) == ["g-a-one", "g-a-two", "g-b-one", "g-b-two"]
+    for name in ("a", "b"):
+        assert len(json.loads((tmp_path / ".avrae-cache" / name / "preflight.json").read_text())) == 2
+
+
+def test_find_project_changes_streams_each_path_to_its_project():
+    config = MagicMock()
+    config.change_detection = "input"
+    config.projects = [SimpleNamespace(name="a"), SimpleNamespace(name="b")]
+    config.iter_modified_files.return_value = iter(["a/gvars/one.gvar", "a/collections/x/x.alias", "b/gvars/two.gvar"])
+    roots = {"a": [Path("a/gvars/one.gvar"), Path("a/collections/x")], "b": [Path("b/gvars/two.gvar")]}
+    received = {}
+
+    def load_parser(project_config):
+        parser = MagicMock()
+        parser.includes = None
+        parser.source_roots.return_value = roots[project_config.name]
+
+        def find_connected_files(files):
+            received[project_config.name] = files
+            parser.connected_files = [SimpleNamespace(path=path) for path in files]
+
+        parser.find_connected_files.side_effect = find_connected_files
+        return parser
+
+    config.for_project.side_effect = lambda project: project
+    with patch("main.load_parser", side_effect=load_parser):
+        changes = main.find_project_changes(config)
+
+    assert received == {
+        "a": [Path("a/gvars/one.gvar"), Path("a/collections/x/x.alias")],
+        "b": [Path("b/gvars/two.gvar")],
+    }
+    assert [project.name for project, *_ in changes] == ["a", "b"]
+
+
+def test_status_reports_drift_offline_without_a_token(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+):
+    from state import StateStore
+    from versions import content_hash
+
+    (tmp_path / "gvars").mkdir()
+    (tmp_path / "gvars" / "one.gvar").write_text("new value")
+    (tmp_path / "gvars" / "two.gvar").write_text("same")
+    (tmp_path / "collections.json").write_text("{}")
+    (tmp_path / "gvars.json").write_text('{"gvars/one.gvar": "g1", "gvars/two.gvar": "g2"}')
+    store = StateStore(tmp_path / ".avrae-cache" / "state.sqlite3")
+    store.record(Path("gvars/one.gvar"), "gvar", "g1", content_hash("old value"))
+    store.record(Path("gvars/two.gvar"), "gvar", "g2", content_hash("same"))
+    store.close()
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.delenv("INPUT_AVRAE_TOKEN", raising=False)
+    monkeypatch.delenv("INPUT_CACHE_DIR", raising=False)
+    monkeypatch.setenv("INPUT_STATE_DB", ".avrae-cache/state.sqlite3")
+
+    original_cwd = Path.cwd()
+    try:
+        with caplog.at_level(logging.INFO, logger="main"):
+            main.status()
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    assert " modified: gvars/one.gvar" in caplog.messages
+    assert "two.gvar" not in caplog.text
+    assert "1 file(s) differ from the last known remote state" in caplog.text
+
+
+def test_status_reports_gvars_that_cannot_be_built(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+):
+    from state import StateStore
+
+    (tmp_path / "gvars").mkdir()
+    (tmp_path / "gvars" / "big.gvar").write_text(json.dumps(["x" * 60_000, "y" * 60_000]))
+    (tmp_path / "collections.json").write_text("{}")
+    (tmp_path / "gvars.json").write_text('{"gvars/big.gvar": {"id": "g1", "shards": ["s1"]}}')
+    store = StateStore(tmp_path / "state.sqlite3")
+    store.record(Path("gvars/big.gvar"), "gvar", "g1", "old")
+    store.close()
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.delenv("INPUT_AVRAE_TOKEN", raising=False)
+    monkeypatch.setenv("INPUT_STATE_DB", "state.sqlite3")
+    monkeypatch.setenv("INPUT_GVAR_BUILD", "true")
+
+    original_cwd = Path.cwd()
+    try:
+        with (
+            caplog.at_level(logging.INFO, logger="main"),
+            patch("main.exit", side_effect=SystemExit(1)) as mock_exit,
+        ):
+            with pytest.raises(SystemExit):
+                main.status()
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    mock_exit.assert_called_once_with(1)
+    assert "   broken: gvars/big.gvar: could not build GVAR g1: needs 2 shard GVARs but only 1 are configured" in (
+        caplog.messages
     )
-    avrae.check_and_maybe_update_gvar.assert_called_once_with(Path("gvars/one.gvar"), "g1")
@@ -0,0 +1,71 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import minify
+from minify import CodeBuilder, minify_code, savings_by_collection
+
+
+def test_minify_code_strips_comments_blank_lines_and_indentation():
+    source = (
+        'embed -title "Roll # 1"\n'
+        "<drac2>\n"
+        "# pick a target\n"
+        "args = &ARGS&  # raw arguments\n"
+        "\n"
+        "if args:\n"
+        "    target = args[0]\n"
+        "    text = '# kept'\n"
+        "</drac2>\n"
+        '-desc "{{target}}"'
+    )
+
+    assert minify_code(source) == (
+        'embed -title "Roll # 1"\n'
+        "<drac2>args = &ARGS&\n"
+        "if args:\n"
+        " target = args[0]\n"
+        " text = '# kept'</drac2>\n"
+        '-desc "{{target}}"'
+    )
+
+
+def test_minify_code_minifies_blocks_with_percent_placeholders():
+    source = "<drac2>\n# first argument\nif True:\n    x = %1%\n</drac2>"
+
+    assert minify_code(source) == "<drac2>if True:\n x = %1%</drac2>"
+
+
+def test_minify_code_keeps_multiline_strings_intact():
+    source = '<drac2>\nif True:\n    text = """a\n    # b\n  c"""  # note\n</drac2>'
+
+    assert minify_code(source) == '<drac2>if True:\n text = """a\n    # b\n  c"""</drac2>'
+
+
+def test_minify_code_leaves_blocks_it_cannot_parse():
+    source = "<drac2>\n    x = (\n</drac2>"
+
+    assert minify_code(source) == source
+
+
+def test_code_builder_reuses_artifacts_by_source_hash(tmp_path: Path):
+    source = "<drac2>\n# c\nx = 1\n</drac2>"
+    CodeBuilder(tmp_path).build(Path("a.alias"), source)
+
+    builder = CodeBuilder(tmp_path)
+    with patch.object(minify, "minify_code") as mock_minify:
+        built = builder.build(Path("b.alias"), source)
+
+    mock_minify.assert_not_called()
+    assert built == "<drac2>x = 1</drac2>"
+    assert builder.savings == {Path("b.alias"): (len(source), len(built))}
+
+
+def test_savings_by_collection_sums_files_under_each_collection():
+    savings = {
+        Path("collections/cool/a/a.alias"): (100, 60),
+        Path("collections/cool/s.snippet"): (50, 40),
+        Path("collections/other/b/b.alias"): (10, 10),
+    }
+    collections = {Path("collections/cool"): "col-1", Path("collections/other"): "col-2"}
+
+    assert savings_by_collection(savings, collections) == {"col-1": (150, 100), "col-2": (10, 10)}
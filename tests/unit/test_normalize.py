@@ -0,0 +1,31 @@
+import pytest
+
+from normalize import Normalizer
+
+
+def test_default_rules_strip_bom_line_endings_and_final_newlines():
+    normalize = Normalizer()
+
+    assert normalize("\ufeffline one\r\nline two\rline three  \r\n\r\n") == "line one\nline two\nline three  "
+
+
+def test_trailing_whitespace_rule_strips_every_line():
+    normalize = Normalizer(["trailing_whitespace"])
+
+    assert normalize("a  \nb\t\nc") == "a\nb\nc"
+
+
+def test_empty_rule_set_leaves_text_untouched():
+    text = "\ufeffa\r\n"
+
+    assert Normalizer(()).__call__(text) == text
+
+
+def test_from_spec_parses_comma_separated_rules():
+    assert Normalizer.from_spec(" EOL, bom ").rules == {"eol", "bom"}
+    assert Normalizer.from_spec("none").rules == frozenset()
+
+
+def test_unknown_rules_are_rejected():
+    with pytest.raises(ValueError, match="Unknown normalization rule"):
+        Normalizer.from_spec("eol,tabs")
@@ -4,6 +4,7 @@ from pathlib import Path
 import pytest
 
 from config import Config
+from includes import IncludeGraph
 from parsing import Parser
 
 
@@ -128,3 +129,84 @@ def test_find_connected_files_ignores_unknown_gvars(tmp_path: Path):
     parser.find_connected_files([tmp_path / "gvars" / "missing.gvar"])
 
     assert parser.connected_files == []
+
+
+def test_find_duplicate_targets_reports_shared_ids(tmp_path: Path):
+    parser = _build_parser(
+        tmp_path,
+        {"collections/a": "col-1", "collections/b": "col-1", "collections/c": "col-2"},
+        {"gvars/one.gvar": "g1", "gvars/two.gvar": "g1"},
+    )
+    parser.load_collections()
+    parser.load_gvars()
+
+    assert parser.find_duplicate_targets() == [
+        ("collection", "col-1", [Path("collections/a"), Path("collections/b")]),
+        ("gvar", "g1", [Path("gvars/one.gvar"), Path("gvars/two.gvar")]),
+    ]
+
+
+def test_find_duplicate_targets_is_empty_for_unique_ids(tmp_path: Path):
+    parser = _build_parser(tmp_path, {"collections/a": "col-1"}, {"gvars/one.gvar": "g1"})
+    parser.load_collections()
+    parser.load_gvars()
+
+    assert parser.find_duplicate_targets() == []
+
+
+def test_load_maps_accept_token_aliases(tmp_path: Path):
+    parser = _build_parser(
+        tmp_path,
+        {"collections/cool": {"id": "col-1", "token": "guild"}, "collections/mine": "col-2"},
+        {"gvars/one.gvar": {"id": "g1"}},
+    )
+
+    parser.load_collections()
+    parser.load_gvars()
+
+    assert parser.collections == {Path("collections/cool"): "col-1", Path("collections/mine"): "col-2"}
+    assert parser.gvars == {Path("gvars/one.gvar"): "g1"}
+    assert parser.token_alias(Path("collections/cool")) == "guild"
+    assert parser.token_alias(Path("gvars/one.gvar")) == "default"
+    assert parser.used_token_aliases() == ["default", "guild"]
+
+
+def test_load_gvars_reads_shard_ids(tmp_path: Path):
+    parser = _build_parser(tmp_path, {}, {"gvars/data.gvar": {"id": "g1", "shards": ["s1", "s2"]}})
+
+    parser.load_gvars()
+
+    assert parser.gvars == {Path("gvars/data.gvar"): "g1"}
+    assert parser.gvar_shards == {Path("gvars/data.gvar"): ("s1", "s2")}
+
+
+def test_load_gvars_rejects_malformed_shards(tmp_path: Path):
+    parser = _build_parser(tmp_path, {}, {"gvars/data.gvar": {"id": "g1", "shards": "s1"}})
+
+    with pytest.raises(ValueError, match="'shards'"):
+        parser.load_gvars()
+
+
+def test_load_collections_rejects_entries_without_id(tmp_path: Path):
+    parser = _build_parser(tmp_path, {"collections/cool": {"token": "guild"}}, {})
+
+    with pytest.raises(ValueError, match="must have a string 'id'"):
+        parser.load_collections()
+
+
+def test_find_connected_files_expands_fragments_to_their_dependents(tmp_path: Path):
+    parser = _build_parser(tmp_path, {"collections/cool": "col-1"}, {})
+    parser.load_collections()
+    parser.includes = IncludeGraph(
+        dependencies={
+            "collections/cool/a/a.alias": ["fragments/common.drac"],
+            "collections/cool/s.snippet": ["fragments/common.drac"],
+        }
+    )
+
+    parser.find_connected_files([Path("collections/cool/a/a.alias"), Path("fragments/common.drac")])
+
+    assert [(connected.type, connected.path) for connected in parser.connected_files] == [
+        ("alias", Path("collections/cool/a/a.alias")),
+        ("snippet", Path("collections/cool/s.snippet")),
+    ]
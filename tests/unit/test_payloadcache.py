@@ -0,0 +1,49 @@
+from pathlib import Path
+
+from models import ParsedSnippet
+from payloadcache import PayloadCache, estimate_size
+
+
+def test_estimate_size_counts_shared_objects_once():
+    data = {"code": "x" * 1000}
+    alone = estimate_size(data)
+
+    assert estimate_size([data, data]) < 2 * alone
+    assert estimate_size(ParsedSnippet("spell", data, Path("a.snippet"), Path("a.md"))) > alone
+
+
+def test_payload_cache_evicts_least_recently_used_past_budget():
+    entry_size = estimate_size({"value": "x" * 100})
+    cache = PayloadCache(max_bytes=2 * entry_size)
+    cache.put("a", {"value": "a" * 100})
+    cache.put("b", {"value": "b" * 100})
+    assert cache.get("a") is not None
+
+    cache.put("c", {"value": "c" * 100})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 1, 1)
+    assert cache.size <= cache.max_bytes
+
+
+def test_payload_cache_skips_entries_larger_than_the_budget():
+    cache = PayloadCache(max_bytes=estimate_size({"value": "x"}) * 2)
+    cache.put("small", {"value": "x"})
+
+    cache.put("large", {"value": "x" * 10_000})
+
+    assert cache.get("large") is None
+    assert cache.get("small") == {"value": "x"}
+    assert cache.evictions == 0
+
+
+def test_payload_cache_replaces_and_pops_entries():
+    cache = PayloadCache()
+    cache.put("a", ["one"])
+    cache.put("a", ["two"])
+    cache.pop("a")
+    cache.pop("missing")
+
+    assert len(cache) == 0
+    assert cache.size == 0
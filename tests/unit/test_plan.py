@@ -0,0 +1,74 @@
+import json
+from pathlib import Path
+
+from plan import PLANNED_VERSION, Plan, PlanRecorder
+
+
+def _code_update(recorder: PlanRecorder, item_id: str, content: str) -> None:
+    response = recorder.record(
+        "post", f"https://api.avrae.io/workshop/alias/{item_id}/code", {"content": content}, "json"
+    )
+    recorder.record(
+        "put",
+        f"https://api.avrae.io/workshop/alias/{item_id}/active-code",
+        {"version": response["data"]["version"]},
+        "json",
+    )
+
+
+def test_recorder_links_active_code_puts_to_their_code_post():
+    recorder = PlanRecorder()
+
+    _code_update(recorder, "a1", "code")
+
+    post, put = recorder.operations
+    assert post.depends_on is None
+    assert put.depends_on == 0
+    assert put.request_data == {"version": {PLANNED_VERSION: 0}}
+
+
+def test_recorder_answers_gvar_posts_with_text():
+    recorder = PlanRecorder()
+
+    assert recorder.record("post", "https://api.avrae.io/customizations/gvars/g1", {"value": "v"}, "text") == (
+        "Gvar updated."
+    )
+
+
+def test_summary_counts_requests_and_upload_bytes():
+    recorder = PlanRecorder()
+    _code_update(recorder, "a1", "code")
+    recorder.record("patch", "https://api.avrae.io/workshop/alias/a1", {"name": "a", "docs": "d"}, "json")
+
+    summary = Plan(recorder.operations, max_workers=2).summary(request_latency=1.0)
+
+    assert summary["requests"] == {"POST": 1, "PUT": 1, "PATCH": 1}
+    assert summary["total_requests"] == 3
+    assert summary["upload_bytes"] == sum(len(json.dumps(op.request_data)) for op in recorder.operations)
+    # the POST -> PUT chain and the PATCH run side by side
+    assert summary["estimated_seconds"] == 2.0
+
+
+def test_estimated_duration_scales_with_workers():
+    recorder = PlanRecorder()
+    for index in range(4):
+        _code_update(recorder, f"a{index}", "code")
+
+    assert Plan(recorder.operations, max_workers=1).estimated_duration(1.0) == 8.0
+    assert Plan(recorder.operations, max_workers=4).estimated_duration(1.0) == 2.0
+
+
+def test_plan_round_trips_through_json(tmp_path: Path):
+    recorder = PlanRecorder()
+    _code_update(recorder, "a1", "code")
+    original = Plan(recorder.operations, max_workers=3)
+
+    original.save(tmp_path / "plan.json")
+    loaded = Plan.load(tmp_path / "plan.json")
+
+    assert loaded == original
+    assert json.loads((tmp_path / "plan.json").read_text())["summary"]["total_requests"] == 2
+
+
+def test_empty_plan_estimates_zero():
+    assert Plan([]).estimated_duration() == 0.0
@@ -0,0 +1,127 @@
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+import preflight
+from includes import IncludeGraph
+from normalize import Normalizer
+from preflight import (
+    MAX_CODE_LENGTH,
+    MAX_GVAR_LENGTH,
+    PreflightChecker,
+    PreflightError,
+    check_upload,
+    create_check_pool,
+)
+
+
+def test_check_upload_accepts_valid_draconic_with_argument_placeholders():
+    code = "embed\n<drac2>\nargs = &ARGS&\nif args:\n    return f'{&1&}'\n</drac2>\n-title Hi"
+
+    assert check_upload("code", code.encode("utf-8"), Normalizer()) == []
+
+
+def test_check_upload_accepts_percent_argument_placeholders():
+    code = "embed\n<drac2>\nx = %1%\nrest = %*%\nreturn f'{x} {rest}'\n</drac2>"
+
+    assert check_upload("code", code.encode("utf-8"), Normalizer()) == []
+
+
+def test_check_upload_reports_draconic_syntax_errors_with_file_line():
+    code = "embed\n<drac2>\nx = 1\nif x\n    y = 2\n</drac2>"
+
+    [problem] = check_upload("code", code.encode("utf-8"), Normalizer())
+
+    assert problem.startswith("line 4: draconic syntax error")
+
+
+def test_check_upload_reports_size_and_encoding_problems():
+    assert check_upload("gvar", b"x" * (MAX_GVAR_LENGTH + 1), Normalizer()) == [
+        f"{MAX_GVAR_LENGTH + 1} characters, over Avrae's limit of {MAX_GVAR_LENGTH}"
+    ]
+    assert check_upload("docs", b"caf\xe9", Normalizer()) == ["not valid UTF-8 (byte 3)"]
+
+
+def test_check_upload_measures_normalized_content():
+    content = "x" * MAX_GVAR_LENGTH + "\r\n\r\n"
+
+    assert check_upload("gvar", content.encode("utf-8"), Normalizer()) == []
+
+
+def test_check_upload_measures_built_gvars():
+    data = json.dumps(["x" * 60_000, "y" * 60_000])
+
+    # measured after minifying, which drops the space after the comma
+    assert check_upload("gvar", data.encode("utf-8"), Normalizer(), gvar_shards=0) == [
+        f"{len(data) - 1} characters, over Avrae's limit of {MAX_GVAR_LENGTH}"
+    ]
+    assert check_upload("gvar", data.encode("utf-8"), Normalizer(), gvar_shards=2) == []
+    assert check_upload("gvar", data.encode("utf-8"), Normalizer(), gvar_shards=1) == [
+        "needs 2 shard GVARs but only 1 are configured"
+    ]
+
+
+def test_preflight_raises_before_anything_is_sent(tmp_path: Path):
+    good = tmp_path / "good.alias"
+    bad = tmp_path / "bad.snippet"
+    good.write_text("<drac2>return 1</drac2>")
+    bad.write_text("<drac2>return (</drac2>")
+    checker = PreflightChecker()
+
+    with pytest.raises(PreflightError, match="1 file\\(s\\) would be rejected") as excinfo:
+        checker.check({good, bad, tmp_path / "deleted.alias"})
+
+    assert bad.as_posix() in str(excinfo.value)
+    assert good.as_posix() not in str(excinfo.value)
+
+
+def test_preflight_reuses_cached_verdicts(tmp_path: Path):
+    alias = tmp_path / "a.alias"
+    alias.write_text("<drac2>return 1</drac2>")
+    cache_path = tmp_path / "cache" / "preflight.json"
+    PreflightChecker(cache_path).check({alias})
+
+    with patch.object(preflight, "check_upload") as mock_check:
+        PreflightChecker(cache_path).check({alias})
+
+    mock_check.assert_not_called()
+    assert cache_path.is_file()
+
+
+def test_preflight_checks_in_a_process_pool(tmp_path: Path):
+    paths = set()
+    for index in range(4):
+        path = tmp_path / f"{index}.alias"
+        path.write_text(f"<drac2>return {index} +</drac2>" if index == 3 else f"<drac2>return {index}</drac2>")
+        paths.add(path)
+
+    pool = create_check_pool(2)
+    try:
+        with pytest.raises(PreflightError) as excinfo:
+            PreflightChecker(max_workers=2, pool=pool).check(paths)
+    finally:
+        pool.shutdown()
+
+    assert "3.alias: line 1: draconic syntax error" in str(excinfo.value)
+
+
+def test_check_upload_measures_minified_code_when_minifying():
+    code = "<drac2>\n" + "# comment\n" * (MAX_CODE_LENGTH // 10) + "x = 1\n</drac2>"
+
+    assert check_upload("code", code.encode("utf-8"), Normalizer()) != []
+    assert check_upload("code", code.encode("utf-8"), Normalizer(), minify=True) == []
+
+
+def test_preflight_checks_code_with_fragments_included(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.chdir(tmp_path)
+    Path("broken.drac").write_text("x = (")
+    Path("a.alias").write_text('<drac2>\n#include "broken.drac"\n</drac2>')
+    Path("b.alias").write_text('<drac2>\n#include "missing.drac"\n</drac2>')
+
+    with pytest.raises(PreflightError) as excinfo:
+        PreflightChecker().check({Path("a.alias"), Path("b.alias")}, IncludeGraph())
+
+    assert "a.alias: line 2: draconic syntax error" in str(excinfo.value)
+    assert "b.alias: b.alias includes missing fragment missing.drac" in str(excinfo.value)
@@ -0,0 +1,88 @@
+import json
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+import ratelimit
+from ratelimit import SharedTokenBucket, TokenBucket
+
+
+def test_token_bucket_allows_a_burst_then_paces_requests(monkeypatch: pytest.MonkeyPatch):
+    now = [100.0]
+    slept = []
+    monkeypatch.setattr(ratelimit, "monotonic", lambda: now[0])
+    monkeypatch.setattr(ratelimit, "sleep", slept.append)
+    bucket = TokenBucket(rate=2, burst=2)
+
+    bucket.acquire()
+    bucket.acquire()
+    bucket.acquire()
+    bucket.acquire()
+
+    assert slept == [0.5, 1.0]
+
+
+def test_token_bucket_refills_over_time(monkeypatch: pytest.MonkeyPatch):
+    now = [0.0]
+    slept = []
+    monkeypatch.setattr(ratelimit, "monotonic", lambda: now[0])
+    monkeypatch.setattr(ratelimit, "sleep", slept.append)
+    bucket = TokenBucket(rate=1)
+
+    bucket.acquire()
+    now[0] = 5.0
+    bucket.acquire()
+
+    assert slept == []
+
+
+def test_token_bucket_rejects_non_positive_rates():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_shared_token_bucket_shares_one_budget_between_instances(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    now = [100.0]
+    slept = []
+    monkeypatch.setattr(ratelimit, "time", lambda: now[0])
+    monkeypatch.setattr(ratelimit, "sleep", slept.append)
+    # two instances stand in for two processes; only the file connects them
+    first = SharedTokenBucket(tmp_path / "account.bucket", rate=2, burst=2)
+    second = SharedTokenBucket(tmp_path / "account.bucket", rate=2, burst=2)
+
+    first.acquire()
+    second.acquire()
+    first.acquire()
+    second.acquire()
+    now[0] = 110.0
+    first.acquire()
+
+    assert slept == [0.5, 1.0]
+
+
+def test_shared_token_bucket_uses_one_file_per_token_without_storing_it(tmp_path: Path):
+    one = SharedTokenBucket.for_token(tmp_path, "secret-one", rate=5)
+    two = SharedTokenBucket.for_token(tmp_path, "secret-two", rate=5)
+    one.acquire()
+
+    assert one.path != two.path
+    assert "secret" not in one.path.name and "secret" not in one.path.read_text()
+
+
+def _reserve_many(path: str, count: int) -> None:
+    bucket = SharedTokenBucket(Path(path), rate=0.001, burst=10)
+    for _ in range(count):
+        bucket._reserve()
+
+
+def test_shared_token_bucket_loses_no_reservations_across_processes(tmp_path: Path):
+    path = tmp_path / "account.bucket"
+    processes = [multiprocessing.Process(target=_reserve_many, args=(str(path), 25)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=30)
+
+    assert all(process.exitcode == 0 for process in processes)
+    assert json.loads(path.read_text())["tokens"] == pytest.approx(10 - 100, abs=0.5)
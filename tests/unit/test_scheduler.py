@@ -0,0 +1,123 @@
+import logging
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from scheduler import (
+    SchedulingError,
+    UpdateJob,
+    build_levels,
+    find_gvar_references,
+    link_gvar_dependencies,
+    run_prioritized,
+)
+
+
+def _job(key: str, kind: str = "code", target_id: str = "id", depends_on=(), action=None) -> UpdateJob:
+    return UpdateJob(key, kind, Path(key), target_id, action or MagicMock(return_value=0), frozenset(depends_on))
+
+
+def test_find_gvar_references_matches_quoted_ids_only():
+    code = "<drac2>\nusing(lib='g1')\nx = get_gvar(\"g2\")\n# g3 mentioned in a comment\n</drac2>"
+
+    assert find_gvar_references(code, ["g1", "g2", "g3"]) == {"g1", "g2"}
+
+
+def test_link_gvar_dependencies_links_code_to_every_job_for_the_gvar():
+    jobs = [
+        _job("code:a.alias"),
+        _job("docs:a.md", kind="docs"),
+        _job("gvar:one.gvar", kind="gvar", target_id="g1"),
+        _job("gvar:copy.gvar", kind="gvar", target_id="g1"),
+    ]
+
+    linked = link_gvar_dependencies(jobs, lambda path: "get_gvar('g1')")
+
+    assert linked[0].depends_on == {"gvar:one.gvar", "gvar:copy.gvar"}
+    assert linked[1].depends_on == frozenset()
+
+
+def test_link_gvar_dependencies_skips_reading_without_gvar_jobs():
+    read_code = MagicMock()
+    jobs = [_job("code:a.alias")]
+
+    assert link_gvar_dependencies(jobs, read_code) == jobs
+    read_code.assert_not_called()
+
+
+def test_build_levels_orders_dependencies_first():
+    jobs = [
+        _job("code:a", depends_on={"gvar:g"}),
+        _job("code:b"),
+        _job("gvar:g", kind="gvar"),
+    ]
+
+    levels = build_levels(jobs)
+
+    assert [[job.key for job in level] for level in levels] == [["code:b", "gvar:g"], ["code:a"]]
+
+
+def test_build_levels_ignores_dependencies_outside_the_job_set():
+    [level] = build_levels([_job("code:a", depends_on={"gvar:unmodified"})])
+
+    assert [job.key for job in level] == ["code:a"]
+
+
+def test_build_levels_raises_for_cycles():
+    with pytest.raises(SchedulingError, match="cycle"):
+        build_levels([_job("a", depends_on={"b"}), _job("b", depends_on={"a"})])
+
+
+def test_run_prioritized_runs_independent_jobs_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def action():
+        barrier.wait()
+        return 0
+
+    results = run_prioritized([_job(f"code:{i}", action=action) for i in range(3)], max_workers=3)
+
+    assert results == {"code:0": 0, "code:1": 0, "code:2": 0}
+
+
+def test_run_prioritized_runs_code_before_gvars_before_docs_and_smallest_first():
+    started = []
+
+    def job(key: str, kind: str, depends_on=()) -> UpdateJob:
+        return _job(key, kind=kind, depends_on=depends_on, action=lambda: started.append(key) or 0)
+
+    jobs = [
+        job("docs:a", "docs"),
+        job("gvar:g", "gvar"),
+        job("code:large", "code"),
+        job("code:small", "code"),
+        job("code:needs-g", "code", depends_on={"gvar:g"}),
+    ]
+    sizes = {"code:large": 500, "code:small": 10}
+
+    run_prioritized(jobs, max_workers=1, cost=lambda job: sizes.get(job.key, 0))
+
+    assert started == ["code:small", "code:large", "gvar:g", "code:needs-g", "docs:a"]
+
+
+def test_run_prioritized_reports_time_to_live_for_code(caplog: pytest.LogCaptureFixture):
+    jobs = [_job("code:a"), _job("code:b", action=MagicMock(return_value=-1)), _job("docs:a", kind="docs")]
+
+    with caplog.at_level(logging.INFO, logger="scheduler"):
+        run_prioritized(jobs, max_workers=1)
+
+    assert "Time to live for 1 code change(s): median" in caplog.text
+
+
+def test_run_prioritized_starts_nothing_after_a_failure():
+    dependant = _job("code:a", depends_on={"gvar:g"})
+    later = _job("docs:b", kind="docs")
+    failing = _job("gvar:g", kind="gvar", action=MagicMock(side_effect=RuntimeError("boom")))
+
+    with pytest.raises(RuntimeError, match="boom"):
+        run_prioritized([dependant, later, failing], max_workers=1)
+
+    dependant.action.assert_not_called()
+    later.action.assert_not_called()
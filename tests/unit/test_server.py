@@ -0,0 +1,238 @@
+import hashlib
+import hmac
+import json
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+import server
+from config import Config
+from server import JobQueue, PushEvent, RepoWorkspace, UpdateServer, parse_push_event, repo_config
+
+
+def _push(repository: str = "org/one", after: str = "abc", commits=None, ref: str = "refs/heads/main") -> dict:
+    return {
+        "repository": {"full_name": repository, "default_branch": "main"},
+        "ref": ref,
+        "after": after,
+        "commits": commits if commits is not None else [{"added": [], "modified": ["a.alias"], "removed": []}],
+    }
+
+
+def test_parse_push_event_unions_changes_and_drops_later_removals():
+    event = parse_push_event(
+        _push(
+            commits=[
+                {"added": ["new.alias"], "modified": ["a.alias"], "removed": []},
+                {"added": [], "modified": ["b.alias"], "removed": ["new.alias"]},
+            ]
+        )
+    )
+
+    assert event == PushEvent("org/one", "abc", frozenset({"a.alias", "b.alias"}), "refs/heads/main", "main")
+
+
+def test_parse_push_event_marks_branch_deletions():
+    event = parse_push_event({**_push(after="0" * 40, commits=[]), "deleted": True})
+
+    assert (event.deleted, event.after) == (True, None)
+
+
+def test_parse_push_event_requires_repository():
+    with pytest.raises(ValueError, match="repository"):
+        parse_push_event({"commits": []})
+
+
+@pytest.mark.parametrize("commits", [{"added": []}, ["a.alias"], [{"added": "a.alias"}]])
+def test_parse_push_event_rejects_malformed_commits(commits):
+    with pytest.raises(ValueError, match="commits"):
+        parse_push_event(_push(commits=commits))
+
+
+def test_job_queue_coalesces_pushes_to_waiting_and_running_repositories():
+    queue = JobQueue()
+
+    assert queue.submit(PushEvent("org/one", "a", frozenset({"x.alias"}))) is False
+    assert queue.submit(PushEvent("org/one", "b", frozenset({"y.alias"}))) is True
+    repository, job = queue.take()
+    assert (repository, job.paths, job.after, job.pushes) == ("org/one", {"x.alias", "y.alias"}, "b", 2)
+
+    # a push while the repository is syncing waits for that sync instead of running beside it
+    assert queue.submit(PushEvent("org/one", "c", frozenset({"z.alias"}))) is False
+    assert queue.submit(PushEvent("org/one", "d", frozenset({"w.alias"}))) is True
+    assert not queue._ready
+    queue.done("org/one")
+    repository, job = queue.take()
+    assert (job.paths, job.after, job.pushes) == ({"z.alias", "w.alias"}, "d", 2)
+    queue.done("org/one")
+    assert queue.wait_idle(timeout=0)
+
+
+def test_job_queue_retries_failed_jobs_with_the_next_push():
+    queue = JobQueue()
+    queue.submit(PushEvent("org/one", "a", frozenset({"x.alias"})))
+    repository, job = queue.take()
+    queue.retry(repository, job)
+    queue.done(repository)
+
+    # nothing runs until the next push, which picks the failed paths up
+    assert queue.wait_idle(timeout=0)
+    queue.submit(PushEvent("org/one", "b", frozenset({"y.alias"})))
+    _, job = queue.take()
+    assert (job.paths, job.after, job.pushes) == ({"x.alias", "y.alias"}, "b", 2)
+
+
+def test_job_queue_take_returns_none_once_closed():
+    queue = JobQueue()
+    queue.close()
+
+    assert queue.take() is None
+
+
+def test_repo_config_resolves_paths_inside_the_checkout(tmp_path: Path):
+    config = Config()
+    config.collections_file_path = "collections.json"
+    config.gvars_file_path = "gvars.json"
+    config.state_db = Path("state/remote.sqlite3")
+
+    repo = repo_config(config, tmp_path)
+
+    assert repo.collections_file_path == str(tmp_path / "collections.json")
+    assert repo.cache_dir == tmp_path / ".avrae-cache"
+    assert repo.state_db == tmp_path / "state" / "remote.sqlite3"
+    assert config.collections_file_path == "collections.json"
+
+
+def _workspace(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, sync, includes: bool = False) -> RepoWorkspace:
+    monkeypatch.setattr(server, "create_clients", lambda config, aliases: {alias: MagicMock() for alias in aliases})
+    monkeypatch.setattr(server.gitdiff, "checkout", MagicMock())
+    (tmp_path / "collections/cool").mkdir(parents=True, exist_ok=True)
+    if not (tmp_path / "collections/cool/root.alias").exists():
+        (tmp_path / "collections/cool/root.alias").write_text("code")
+    (tmp_path / "collections.json").write_text(json.dumps({"collections/cool": "col-1"}))
+    (tmp_path / "gvars.json").write_text(json.dumps({}))
+    config = Config()
+    config.collections_file_path = "collections.json"
+    config.gvars_file_path = "gvars.json"
+    config.includes = includes
+    return RepoWorkspace("org/one", tmp_path, repo_config(config, tmp_path), sync)
+
+
+def test_workspace_syncs_connected_paths_under_its_checkout(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    sync = MagicMock()
+    workspace = _workspace(tmp_path, monkeypatch, sync)
+
+    workspace.process(server.PendingJob({"collections/cool/root.alias", "README.md"}, "abc", 1))
+
+    accounts, parser, modified_paths = sync.call_args.args
+    assert modified_paths == {tmp_path / "collections/cool/root.alias"}
+    assert parser is workspace.parser
+    assert set(accounts) == {"default"}
+    # the pushed commit is checked out before anything is read
+    server.gitdiff.checkout.assert_called_once_with(tmp_path, "abc")
+
+
+def test_workspace_expands_includes_inside_its_checkout(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    (tmp_path / "fragments").mkdir()
+    (tmp_path / "fragments/args.drac").write_text("args = &ARGS&")
+    sync = MagicMock()
+    (tmp_path / "collections/cool").mkdir(parents=True)
+    (tmp_path / "collections/cool/root.alias").write_text('<drac2>\n#include "/fragments/args.drac"\n</drac2>')
+    workspace = _workspace(tmp_path, monkeypatch, sync, includes=True)
+
+    workspace.process(server.PendingJob({"fragments/args.drac"}, "abc", 1))
+
+    assert sync.call_args.args[2] == {tmp_path / "collections/cool/root.alias"}
+    assert workspace.parser.includes.root == tmp_path
+
+
+def test_workspace_reloads_maps_when_they_change(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    sync = MagicMock()
+    workspace = _workspace(tmp_path, monkeypatch, sync)
+    (tmp_path / "gvars").mkdir()
+    (tmp_path / "gvars/one.gvar").write_text("value")
+    (tmp_path / "gvars.json").write_text(json.dumps({"gvars/one.gvar": "g1"}))
+
+    workspace.process(server.PendingJob({"gvars.json", "gvars/one.gvar"}, "abc", 1))
+
+    assert workspace.parser.gvars == {tmp_path / "gvars/one.gvar": "g1"}
+    assert sync.call_args.args[2] == {tmp_path / "gvars/one.gvar"}
+
+
+def _sign(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def test_handle_webhook_checks_signature_and_queues_pushes():
+    update_server = UpdateServer({"org/one": MagicMock()}, workers=1, secret="secret")
+    body = json.dumps(_push()).encode("utf-8")
+
+    assert update_server.handle_webhook("push", body, "sha256=bad")[0] == 401
+    assert update_server.handle_webhook("ping", b"{}", _sign("secret", b"{}"))[0] == 200
+    assert update_server.handle_webhook("push", b"[]", _sign("secret", b"[]"))[0] == 400
+    malformed = json.dumps(_push(commits=["a.alias"])).encode("utf-8")
+    assert update_server.handle_webhook("push", malformed, _sign("secret", malformed))[0] == 400
+    other = json.dumps(_push("org/other")).encode("utf-8")
+    assert update_server.handle_webhook("push", other, _sign("secret", other))[0] == 404
+
+    status, reply = update_server.handle_webhook("push", body, _sign("secret", body))
+    assert (status, reply["coalesced"]) == (202, False)
+    assert update_server.handle_webhook("push", body, _sign("secret", body))[1]["coalesced"] is True
+
+
+def test_handle_webhook_ignores_other_branches_and_deletions():
+    update_server = UpdateServer({"org/one": MagicMock()}, workers=1)
+
+    for push in (_push(ref="refs/heads/feature"), _push(ref="refs/tags/v1"), _push(after="0" * 40, commits=[])):
+        status, reply = update_server.handle_webhook("push", json.dumps(push).encode("utf-8"), None)
+        assert status == 200 and "ignored" in reply
+    assert update_server.queue.wait_idle(timeout=0)
+
+    # a configured branch replaces the repository's default branch
+    update_server = UpdateServer({"org/one": MagicMock()}, workers=1, branch="release")
+    assert update_server.handle_webhook("push", json.dumps(_push()).encode("utf-8"), None)[0] == 200
+    release = json.dumps(_push(ref="refs/heads/release")).encode("utf-8")
+    assert update_server.handle_webhook("push", release, None)[0] == 202
+
+
+def test_server_keeps_failed_paths_for_the_next_push():
+    workspace = MagicMock()
+    workspace.process.side_effect = [OSError("Avrae is down"), None]
+    update_server = UpdateServer({"org/one": workspace}, workers=1)
+    update_server.start("127.0.0.1", 0)
+    try:
+        update_server.queue.submit(PushEvent("org/one", "a", frozenset({"x.alias"})))
+        assert update_server.queue.wait_idle(timeout=5)
+        update_server.queue.submit(PushEvent("org/one", "b", frozenset({"y.alias"})))
+        assert update_server.queue.wait_idle(timeout=5)
+    finally:
+        update_server.stop()
+
+    assert workspace.process.call_args.args[0].paths == {"x.alias", "y.alias"}
+
+
+def test_server_processes_webhooks_over_http():
+    import urllib.request
+
+    processed = threading.Event()
+    workspace = MagicMock()
+    workspace.process.side_effect = lambda job: processed.set()
+    update_server = UpdateServer({"org/one": workspace}, workers=1)
+    host, port = update_server.start("127.0.0.1", 0)
+    try:
+        request = urllib.request.Request(
+            f"http://{host}:{port}/webhook",
+            data=json.dumps(_push()).encode("utf-8"),
+            headers={"X-GitHub-Event": "push", "Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            assert response.status == 202
+        assert processed.wait(timeout=5)
+        assert update_server.queue.wait_idle(timeout=5)
+    finally:
+        update_server.stop()
+
+    job = workspace.process.call_args.args[0]
+    assert (job.paths, job.after) == ({"a.alias"}, "abc")
@@ -0,0 +1,63 @@
+from pathlib import Path
+
+import pytest
+
+from state import Drift, StateRow, StateStore, find_drift
+
+
+@pytest.fixture
+def store(tmp_path: Path):
+    store = StateStore(tmp_path / "cache" / "state.sqlite3")
+    yield store
+    store.close()
+
+
+def test_record_upserts_and_keeps_known_fields(store: StateStore):
+    store.record(Path("c/a/a.alias"), "alias", "a1", "h1", collection_id="col-1", parent_id="p1", version=3)
+    store.record(Path("c/a/a.alias"), "alias", "a1", "h2")
+
+    assert store.get(Path("c/a/a.alias")) == StateRow(Path("c/a/a.alias"), "alias", "a1", "h2", "col-1", "p1", 3)
+    assert store.get(Path("missing.alias")) is None
+
+
+def test_lookups_by_id_and_hash(store: StateStore):
+    store.record(Path("c/a/a.alias"), "alias", "a1", "code-hash")
+    store.record(Path("c/a/a.md"), "docs", "a1", "docs-hash")
+    store.record(Path("g/one.gvar"), "gvar", "g1", "code-hash")
+
+    assert [row.path for row in store.find_by_id("a1")] == [Path("c/a/a.alias"), Path("c/a/a.md")]
+    assert [row.path for row in store.find_by_hash("code-hash")] == [Path("c/a/a.alias"), Path("g/one.gvar")]
+
+
+def test_rows_survive_reopening(tmp_path: Path):
+    path = tmp_path / "state.sqlite3"
+    store = StateStore(path)
+    store.record(Path("g/one.gvar"), "gvar", "g1", "h")
+    store.close()
+
+    reopened = StateStore(path)
+    assert reopened.rows() == [StateRow(Path("g/one.gvar"), "gvar", "g1", "h")]
+    reopened.close()
+
+
+def test_find_drift_reports_modified_untracked_and_deleted_files(
+    store: StateStore, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.chdir(tmp_path)
+    Path("c/a").mkdir(parents=True)
+    Path("g").mkdir()
+    for name in ("c/a/a.alias", "c/a/a.md", "c/new.snippet", "c/README.md", "g/one.gvar"):
+        Path(name).write_text(name)
+    store.record(Path("c/a/a.alias"), "alias", "a1", "c/a/a.alias")
+    store.record(Path("c/a/a.md"), "docs", "a1", "stale")
+    store.record(Path("c/gone.snippet"), "snippet", "s1", "x")
+    store.record(Path("g/one.gvar"), "gvar", "g1", "g/one.gvar")
+    store.record(Path("elsewhere/other.alias"), "alias", "o1", "x")
+
+    drift = find_drift(store, [Path("c")], [Path("g/one.gvar")], lambda path, kind: path.read_text())
+
+    assert drift == [
+        Drift("modified", Path("c/a/a.md")),
+        Drift("untracked", Path("c/new.snippet")),
+        Drift("deleted", Path("c/gone.snippet")),
+    ]
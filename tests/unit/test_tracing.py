@@ -0,0 +1,55 @@
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+import tracing
+from tracing import Tracer
+
+
+def test_tracer_records_nested_spans_per_thread(tmp_path: Path):
+    tracer = Tracer(tmp_path / "trace.json")
+
+    def work():
+        with tracer.span("item", "item", path="a.alias"):
+            with tracer.span("read", "item"):
+                pass
+
+    worker = threading.Thread(target=work, name="worker-1")
+    worker.start()
+    worker.join()
+    tracer.save()
+
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    names = [event for event in events if event["ph"] == "M"]
+    spans = [event for event in events if event["ph"] == "X"]
+    assert names[0]["args"]["name"] == "worker-1"
+    assert [span["name"] for span in spans] == ["item", "read"]
+    assert spans[0]["args"] == {"path": "a.alias"}
+    assert spans[0]["ts"] <= spans[1]["ts"]
+    assert spans[1]["ts"] + spans[1]["dur"] <= spans[0]["ts"] + spans[0]["dur"]
+
+
+def test_tracer_records_errors_on_failed_spans(tmp_path: Path):
+    tracer = Tracer(tmp_path / "trace.json")
+
+    with pytest.raises(ValueError):
+        with tracer.span("compare", "item"):
+            raise ValueError("boom")
+
+    assert tracer.to_json()["traceEvents"][-1]["args"] == {"error": "ValueError: boom"}
+
+
+def test_span_is_a_no_op_without_an_active_trace(tmp_path: Path):
+    with tracing.span("phase", "phase"):
+        pass
+
+    tracer = tracing.start(tmp_path / "trace.json")
+    with tracing.span("phase", "phase", files=2):
+        pass
+    tracing.stop()
+
+    assert [event["args"] for event in tracer.to_json()["traceEvents"] if event["ph"] == "X"] == [{"files": 2}]
+    assert (tmp_path / "trace.json").is_file()
+    tracing.stop()
@@ -0,0 +1,171 @@
+import json
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+from requests import RequestException
+
+import main
+from transport import (
+    REDACTED,
+    CassetteError,
+    RecordedResponse,
+    RecordingTransport,
+    ReplayTransport,
+    SessionTransport,
+    create_transport,
+)
+
+
+def _recording(tmp_path: Path, *responses) -> tuple[RecordingTransport, MagicMock]:
+    inner = MagicMock()
+    inner.send.side_effect = list(responses)
+    return RecordingTransport(inner, tmp_path / "cassette.jsonl"), inner
+
+
+def test_recording_transport_redacts_authorization_and_stores_responses(tmp_path: Path):
+    recorder, inner = _recording(tmp_path, RecordedResponse(200, '{"success": true}'))
+
+    response = recorder.send("GET", "https://api.avrae.io/x", {"Authorization": "secret"}, None, 10)
+
+    assert response.status_code == 200
+    inner.send.assert_called_once_with("GET", "https://api.avrae.io/x", {"Authorization": "secret"}, None, 10)
+    [interaction] = [json.loads(line) for line in (tmp_path / "cassette.jsonl").read_text().splitlines()]
+    assert interaction["request"] == {
+        "method": "get",
+        "url": "https://api.avrae.io/x",
+        "headers": {"Authorization": REDACTED},
+        "json": None,
+    }
+    assert interaction["response"] == {"status_code": 200, "text": '{"success": true}'}
+    assert "secret" not in (tmp_path / "cassette.jsonl").read_text()
+
+
+def test_recording_through_two_clients_keeps_both_interactions(tmp_path: Path):
+    cassette = tmp_path / "shared.jsonl"
+    first = RecordingTransport(MagicMock(**{"send.return_value": RecordedResponse(200, "one")}), cassette)
+    first.send("GET", "https://api.avrae.io/one", {}, None, 10)
+    second = RecordingTransport(MagicMock(**{"send.return_value": RecordedResponse(200, "two")}), cassette)
+    second.send("GET", "https://api.avrae.io/two", {}, None, 10)
+
+    urls = [json.loads(line)["request"]["url"] for line in cassette.read_text().splitlines()]
+    assert urls == ["https://api.avrae.io/one", "https://api.avrae.io/two"]
+
+
+def test_replay_serves_recorded_interactions_in_order(tmp_path: Path):
+    recorder, _ = _recording(tmp_path, RecordedResponse(500, "down"), RecordedResponse(200, "Gvar updated."))
+    recorder.send("post", "https://api.avrae.io/g", {}, {"value": "v"}, 10)
+    recorder.send("post", "https://api.avrae.io/g", {}, {"value": "v"}, 10)
+
+    replay = ReplayTransport(tmp_path / "cassette.jsonl")
+
+    assert replay.send("POST", "https://api.avrae.io/g", {}, {"value": "v"}, 10).status_code == 500
+    assert replay.send("POST", "https://api.avrae.io/g", {}, {"value": "v"}, 10).text == "Gvar updated."
+    with pytest.raises(CassetteError, match="No recorded interaction left"):
+        replay.send("POST", "https://api.avrae.io/g", {}, {"value": "v"}, 10)
+
+
+def test_replay_matches_on_request_body(tmp_path: Path):
+    recorder, _ = _recording(tmp_path, RecordedResponse(200, "one"))
+    recorder.send("post", "https://api.avrae.io/g", {}, {"value": "one"}, 10)
+
+    replay = ReplayTransport(tmp_path / "cassette.jsonl")
+
+    with pytest.raises(CassetteError):
+        replay.send("post", "https://api.avrae.io/g", {}, {"value": "two"}, 10)
+
+
+def test_replay_reraises_recorded_network_errors(tmp_path: Path):
+    recorder, _ = _recording(tmp_path, RequestException("connection reset"))
+    with pytest.raises(RequestException):
+        recorder.send("get", "https://api.avrae.io/x", {}, None, 10)
+
+    replay = ReplayTransport(tmp_path / "cassette.jsonl")
+
+    with pytest.raises(RequestException, match="connection reset"):
+        replay.send("get", "https://api.avrae.io/x", {}, None, 10)
+
+
+def test_replay_can_reproduce_recorded_latency(tmp_path: Path):
+    cassette = tmp_path / "cassette.jsonl"
+    cassette.write_text(
+        json.dumps(
+            {
+                "request": {"method": "get", "url": "u", "headers": {}, "json": None},
+                "response": {"status_code": 200, "text": "{}"},
+                "duration": 0.25,
+            }
+        )
+        + "\n"
+    )
+
+    with patch("transport.sleep") as mock_sleep:
+        ReplayTransport(cassette, replay_latency=True).send("get", "u", {}, None, 10)
+
+    mock_sleep.assert_called_once_with(0.25)
+
+
+def test_create_transport_selects_mode(tmp_path: Path):
+    session = MagicMock()
+    cassette = tmp_path / "c.jsonl"
+
+    assert isinstance(create_transport(SimpleNamespace(), session), SessionTransport)
+    recording = create_transport(SimpleNamespace(http_mode="record", http_cassette=cassette), session)
+    replaying = create_transport(SimpleNamespace(http_mode="replay", http_cassette=cassette), session)
+
+    assert isinstance(recording, RecordingTransport)
+    assert isinstance(replaying, ReplayTransport)
+    with pytest.raises(ValueError, match="requires a cassette"):
+        create_transport(SimpleNamespace(http_mode="replay"), session)
+
+
+def _write_workspace(base: Path) -> None:
+    (base / "collections" / "cool" / "root").mkdir(parents=True)
+    (base / "collections" / "cool" / "root" / "root.alias").write_text("new code")
+    (base / "gvars").mkdir()
+    (base / "gvars" / "one.gvar").write_text("new value")
+    (base / "collections.json").write_text(json.dumps({"collections/cool": "col-1"}))
+    (base / "gvars.json").write_text(json.dumps({"gvars/one.gvar": "g1"}))
+
+
+def test_run_replays_a_recorded_session_offline(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    _write_workspace(tmp_path)
+    collection = {
+        "success": True,
+        "data": {
+            "aliases": [{"name": "root", "_id": "a1", "parent_id": None, "subcommands": [], "code": "old code"}],
+            "snippets": [],
+        },
+    }
+    live_responses = {
+        ("get", "https://api.avrae.io/workshop/collection/col-1/full"): RecordedResponse(200, json.dumps(collection)),
+        ("post", "https://api.avrae.io/workshop/alias/a1/code"): RecordedResponse(
+            200, json.dumps({"success": True, "data": {"version": 2}})
+        ),
+        ("put", "https://api.avrae.io/workshop/alias/a1/active-code"): RecordedResponse(200, '{"success": true}'),
+        ("get", "https://api.avrae.io/customizations/gvars/g1"): RecordedResponse(200, '{"value": "old value"}'),
+        ("post", "https://api.avrae.io/customizations/gvars/g1"): RecordedResponse(200, "Gvar updated."),
+    }
+    monkeypatch.setenv("GITHUB_WORKSPACE", str(tmp_path))
+    monkeypatch.setenv("INPUT_AVRAE_TOKEN", "token")
+    monkeypatch.setenv("INPUT_MODIFIED_FILES", json.dumps(["collections/cool/root/root.alias", "gvars/one.gvar"]))
+    monkeypatch.setenv("INPUT_HTTP_CASSETTE", str(tmp_path / "run.jsonl"))
+    original_cwd = Path.cwd()
+
+    def live_request(method, url, **kwargs):
+        return live_responses[(method, url)]
+
+    try:
+        monkeypatch.setenv("INPUT_HTTP_MODE", "record")
+        with patch("api.Session.request", side_effect=live_request):
+            main.run()
+
+        monkeypatch.setenv("INPUT_HTTP_MODE", "replay")
+        with patch("api.Session.request", side_effect=AssertionError("network used during replay")):
+            main.run()
+    finally:
+        monkeypatch.chdir(original_cwd)
+
+    recorded = [json.loads(line) for line in (tmp_path / "run.jsonl").read_text().splitlines()]
+    assert len(recorded) == len(live_responses)
@@ -1,5 +1,9 @@
+import json
 from pathlib import Path
 
+import pytest
+
+import utils
 from utils import is_important_path, parse_paths
 
 
@@ -8,6 +12,7 @@ def test_is_important_path_accepts_supported_extensions():
     assert is_important_path("snippet.snippet") is True
     assert is_important_path("note.md") is True
     assert is_important_path("state.gvar") is True
+    assert is_important_path("fragments/common.drac") is True
 
 
 def test_is_important_path_rejects_other_extensions():
@@ -21,3 +26,53 @@ def test_parse_paths_filters_and_converts_to_path_instances():
     result = parse_paths(paths)
 
     assert result == [Path("spell.alias"), Path("note.md"), Path("tool.snippet")]
+
+
+def test_iter_paths_is_lazy():
+    def source():
+        yield "a.alias"
+        raise AssertionError("consumed too far")
+
+    paths = utils.iter_paths(source())
+
+    assert next(paths) == Path("a.alias")
+
+
+def test_iter_path_list_file_streams_json_arrays(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(utils, "_READ_CHUNK_SIZE", 7)
+    list_file = tmp_path / "modified.json"
+    paths = [f"collections/cool/alias-{i}/alias-{i}.alias" for i in range(50)] + ['odd "quoted", name.md']
+    list_file.write_text("  " + json.dumps(paths, indent=2))
+
+    assert list(utils.iter_path_list_file(list_file)) == paths
+
+
+def test_iter_path_list_file_reads_newline_delimited_files(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(utils, "_READ_CHUNK_SIZE", 5)
+    list_file = tmp_path / "modified.txt"
+    list_file.write_text("one.alias\r\n\ntwo/three.md\nfour.gvar")
+
+    assert list(utils.iter_path_list_file(list_file)) == ["one.alias", "two/three.md", "four.gvar"]
+
+
+def test_iter_path_list_file_handles_empty_json_array(tmp_path: Path):
+    list_file = tmp_path / "modified.json"
+    list_file.write_text("[ ]")
+
+    assert list(utils.iter_path_list_file(list_file)) == []
+
+
+@pytest.mark.parametrize(
+    ("content", "message"),
+    [
+        ('["a.alias", 3]', "only contain strings"),
+        ('["a.alias", "b', "not a valid JSON array"),
+        ('["a.alias"', "before the closing bracket"),
+    ],
+)
+def test_iter_path_list_file_rejects_malformed_json(tmp_path: Path, content: str, message: str):
+    list_file = tmp_path / "modified.json"
+    list_file.write_text(content)
+
+    with pytest.raises(ValueError, match=message):
+        list(utils.iter_path_list_file(list_file))
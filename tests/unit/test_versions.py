@@ -0,0 +1,69 @@
+import json
+from pathlib import Path
+
+from versions import VersionIndex, content_hash
+
+
+def test_content_hash_is_stable_sha256():
+    assert content_hash("abc") == "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+
+
+def test_lookup_returns_recorded_version():
+    index = VersionIndex()
+    index.record("a1", "code", 3)
+
+    assert index.lookup("a1", "code") == 3
+    assert index.lookup("a1", "other") is None
+    assert index.lookup("a2", "code") is None
+
+
+def test_seed_keeps_newest_version_for_duplicate_content():
+    index = VersionIndex()
+
+    index.seed("a1", [("same", 1), ("other", 2), ("same", 4)])
+
+    assert index.is_seeded("a1")
+    assert index.lookup("a1", "same") == 4
+    assert index.lookup("a1", "other") == 2
+
+
+def test_seed_with_no_versions_still_marks_item_seeded():
+    index = VersionIndex()
+
+    index.seed("a1", [])
+
+    assert index.is_seeded("a1")
+
+
+def test_save_and_load_round_trip(tmp_path: Path):
+    path = tmp_path / "cache" / "versions.json"
+    index = VersionIndex(path)
+    index.record("a1", "code", 2)
+
+    index.save()
+
+    assert VersionIndex.load(path).lookup("a1", "code") == 2
+
+
+def test_save_skips_unchanged_index(tmp_path: Path):
+    path = tmp_path / "versions.json"
+
+    VersionIndex(path).save()
+
+    assert not path.exists()
+
+
+def test_load_ignores_corrupt_files(tmp_path: Path):
+    path = tmp_path / "versions.json"
+    path.write_text("{not json")
+
+    index = VersionIndex.load(path)
+
+    assert not index.is_seeded("a1")
+
+
+def test_load_ignores_non_object_json(tmp_path: Path):
+    path = tmp_path / "versions.json"
+    path.write_text(json.dumps(["a1"]))
+
+    assert not VersionIndex.load(path).is_seeded("a1")
@@ -0,0 +1,123 @@
+import json
+import os
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+import watch
+from config import Config
+from watch import InotifyWatcher, PollingWatcher, WatchSession, collect_changes
+
+
+def _touch(path: Path, content: str) -> None:
+    path.write_text(content)
+    stat = path.stat()
+    # force a visible mtime change even on coarse-grained filesystems
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def _build_session(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, sync) -> WatchSession:
+    monkeypatch.chdir(tmp_path)
+    collection = Path("collections/cool/root")
+    collection.mkdir(parents=True)
+    (collection / "root.alias").write_text("old")
+    Path("gvars").mkdir()
+    Path("gvars/one.gvar").write_text("old")
+    Path("collections.json").write_text(json.dumps({"collections/cool": "col-1"}))
+    Path("gvars.json").write_text(json.dumps({"gvars/one.gvar": "g1"}))
+    config = Config()
+    config.token = "token"
+    config.collections_file_path = "collections.json"
+    config.gvars_file_path = "gvars.json"
+    return WatchSession(config, sync)
+
+
+def test_polling_watcher_reports_changed_and_new_files(tmp_path: Path):
+    existing = tmp_path / "existing.alias"
+    existing.write_text("one")
+    watcher = PollingWatcher([tmp_path], [], interval=0.01)
+
+    _touch(existing, "two")
+    (tmp_path / "new.alias").write_text("new")
+
+    assert watcher.poll(1) == {existing, tmp_path / "new.alias"}
+    assert watcher.poll(0.05) == set()
+
+
+def test_polling_watcher_only_tracks_listed_files(tmp_path: Path):
+    tracked = tmp_path / "gvars.json"
+    tracked.write_text("{}")
+    watcher = PollingWatcher([], [tracked], interval=0.01)
+
+    (tmp_path / "other.json").write_text("{}")
+    _touch(tracked, '{"a": 1}')
+
+    assert watcher.poll(1) == {tracked}
+
+
+@pytest.mark.skipif(not hasattr(os, "O_CLOEXEC") or os.uname().sysname != "Linux", reason="inotify is Linux-only")
+def test_inotify_watcher_reports_writes_in_new_subdirectories(tmp_path: Path):
+    watcher = InotifyWatcher([tmp_path], [])
+    try:
+        subdir = tmp_path / "alias"
+        subdir.mkdir()
+        assert watcher.poll(1) == set()
+
+        (subdir / "alias.alias").write_text("code")
+
+        assert subdir / "alias.alias" in collect_changes(watcher, debounce=0.05, timeout=1)
+    finally:
+        watcher.close()
+
+
+def test_collect_changes_merges_a_burst_until_quiet():
+    watcher = MagicMock()
+    watcher.poll.side_effect = [{Path("a")}, {Path("b")}, set()]
+
+    assert collect_changes(watcher, debounce=0.01, timeout=1) == {Path("a"), Path("b")}
+    assert watcher.poll.call_count == 3
+
+
+def test_create_watcher_falls_back_to_polling(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    monkeypatch.setattr(watch, "InotifyWatcher", MagicMock(side_effect=OSError("unsupported")))
+
+    assert isinstance(watch.create_watcher([tmp_path], []), PollingWatcher)
+
+
+def test_watch_session_syncs_connected_files(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    sync = MagicMock()
+    session = _build_session(tmp_path, monkeypatch, sync)
+
+    reload_needed = session.handle_changes({Path("collections/cool/root/root.alias"), Path("notes.txt")})
+
+    assert reload_needed is False
+    sync.assert_called_once_with(session.avrae, session.parser, {Path("collections/cool/root/root.alias")})
+
+
+def test_watch_session_ignores_unrelated_changes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    sync = MagicMock()
+    session = _build_session(tmp_path, monkeypatch, sync)
+
+    assert session.handle_changes({Path("README.md")}) is False
+    sync.assert_not_called()
+
+
+def test_watch_session_reloads_parser_when_config_changes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    sync = MagicMock()
+    session = _build_session(tmp_path, monkeypatch, sync)
+    Path("gvars.json").write_text(json.dumps({"gvars/one.gvar": "g2"}))
+
+    assert session.handle_changes({Path("gvars.json")}) is True
+
+    assert session.parser.gvars == {Path("gvars/one.gvar"): "g2"}
+    sync.assert_not_called()
+
+
+def test_watch_session_watches_collections_gvars_and_config(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    session = _build_session(tmp_path, monkeypatch, MagicMock())
+
+    dirs, files = session.watched_paths()
+
+    assert dirs == [Path("collections/cool")]
+    assert files == [Path("collections.json"), Path("gvars.json"), Path("gvars/one.gvar")]